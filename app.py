@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import sys
@@ -5,47 +6,113 @@ from pathlib import Path
 
 from langgraph.checkpoint.memory import MemorySaver
 
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
-
 sys.path.append(str(Path(__file__).parent.parent))
 logging.basicConfig(level=logging.ERROR, format="%(message)s")
-import json
-from contextlib import asynccontextmanager
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 
-import requests
-import uvicorn
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from langchain.schema import HumanMessage
+from fastapi.responses import Response, StreamingResponse
+from langchain_core.messages import HumanMessage
 from langgraph.graph.state import CompiledStateGraph as CompiledGraph
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 
+from backend.admission import AdmissionController, AdmissionRejected
 from backend.agent import WebAgent
+from backend.answer_cache import AnswerCache
+from backend.cache import create_tool_cache
+from backend.checkpoint import BoundedMemorySaver, SqliteCheckpointer
+from backend.http_clients import HttpClientRegistry
+from backend.models import create_models
+from backend.prefetch import Prefetcher
 from backend.prompts import REASONING_PROMPT, SIMPLE_PROMPT
-from backend.utils import check_api_key
+from backend.replay import FramesEvicted, RunBuffer, RunRegistry
+from backend.streaming import AgentAnswerStream, ChatbotFramer, extract_final_answer, is_agent_model_event
+from backend.telemetry import (
+    RESUMES,
+    RequestTrace,
+    configure_trace_logging,
+    metrics_registry,
+    monitor_event_loop_lag,
+    tool_type_of,
+)
+from backend.tool_events import ToolFrameEncoder, ToolOutputStore
+from backend.utils import TAVILY_API_ENDPOINT, ApiKeyAuthorizer, AuthorizationError, hash_api_key
 
 load_dotenv()
 
+# "incremental" forwards the final answer as the last model step streams it,
+# "buffered" waits for the whole run and filters the answer afterwards
+ANSWER_STREAMING = os.getenv("ANSWER_STREAMING", "incremental")
+# Fraction of requests whose individual model and tool steps are logged
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# Tool calls of one run that may execute at once
+TOOL_PARALLELISM = int(os.getenv("TOOL_PARALLELISM", "4"))
+# Model and prompt of each agent type, and the model summarizing tool outputs
+AGENT_MODELS = {"fast": ("nano", SIMPLE_PROMPT), "deep": ("kimik2", REASONING_PROMPT)}
+SUMMARY_MODEL = "nano"
+# Agent types this deployment serves; SDKs of models only the others use are never imported
+AGENT_TYPES = [name.strip() for name in os.getenv("AGENT_TYPES", "fast,deep").split(",") if name.strip()]
 
-nano = ChatOpenAI(
-    model="gpt-4.1-nano", api_key=os.getenv("OPENAI_API_KEY")
-).with_config({"tags": ["streaming"]})
 
-kimik2 = ChatGroq(
-    model="moonshotai/kimi-k2-instruct", api_key=os.getenv("GROQ_API_KEY")
-).with_config({"tags": ["streaming"]})
+def models_in_use() -> list[str]:
+    """Models the served agent types call, without their fallbacks."""
+    return [AGENT_MODELS[agent_type][0] for agent_type in AGENT_TYPES] + [SUMMARY_MODEL]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-
-    checkpointer = MemorySaver()
-    agent = WebAgent(checkpointer=checkpointer)
+    stack = AsyncExitStack()
+    stack.callback(configure_trace_logging(os.getenv("TRACE_LOG_LEVEL", "INFO")).stop)
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    stack.callback(lag_monitor.cancel)
+    # One keep-alive pool per upstream host, shared by the models, tools and authorizer
+    http = HttpClientRegistry.from_env()
+    stack.push_async_callback(http.aclose)
+    app.state.models = create_models(http, preload=models_in_use())
+
+    checkpointer_kind = os.getenv("CHECKPOINTER", "bounded")
+    if checkpointer_kind == "memory":
+        checkpointer = MemorySaver()
+    elif checkpointer_kind == "sqlite":
+        checkpointer = await stack.enter_async_context(
+            SqliteCheckpointer.from_path(os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db"))
+        )
+    else:
+        checkpointer = BoundedMemorySaver(
+            max_bytes=int(os.getenv("CHECKPOINT_MAX_MB", "256")) * 1024 * 1024,
+            keep_last=int(os.getenv("CHECKPOINT_KEEP_LAST", "3")),
+            idle_ttl=float(os.getenv("CHECKPOINT_IDLE_TTL", "3600")),
+        )
+    result_cache = create_tool_cache(
+        os.getenv("TOOL_CACHE", "memory"),
+        os.getenv("TOOL_CACHE_DIR", ".cache/tools"),
+        max_bytes=int(float(os.getenv("TOOL_CACHE_MAX_MB", "512")) * 1024 * 1024),
+        memory_max_bytes=int(float(os.getenv("TOOL_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+    )
+    # Off unless PREFETCH=on; spends Tavily credits on results the agent may never open
+    prefetcher = Prefetcher.from_env()
+    if prefetcher is not None:
+        stack.push_async_callback(prefetcher.aclose)
+    agent = WebAgent(checkpointer=checkpointer, result_cache=result_cache, http=http, prefetcher=prefetcher)
     app.state.agent = agent
-    yield
+    app.state.authorizer = ApiKeyAuthorizer(client=http.client(TAVILY_API_ENDPOINT))
+    stack.push_async_callback(app.state.authorizer.aclose)
+    app.state.admission = AdmissionController.from_env()
+    # Runs execute in the background so a client can resume a dropped stream
+    app.state.runs = RunRegistry.from_env()
+    stack.push_async_callback(app.state.runs.aclose)
+    # Off unless ANSWER_CACHE=on; serves recent fast agent answers to near-duplicate questions
+    app.state.answer_cache = AnswerCache.from_env()
+    app.state.tool_outputs = ToolOutputStore.from_env()
+    try:
+        yield
+    finally:
+        # Flushes the checkpointer and stops the trace log queue even if the server exits with an error
+        await stack.aclose()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -55,6 +122,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Run-Id"],
 )
 
 
@@ -68,56 +136,134 @@ class AgentRequest(BaseModel):
     input: str
     thread_id: str
     agent_type: str
+    # 1: one "chatbot" frame per character, 2: coalesced chunk frames,
+    # 3: as 2 with compact tool_end frames whose full output is fetched by output_id
+    protocol_version: int = 1
 
 
 @app.get("/")
 async def ping():
     return {"message": "Alive"}
 
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/stream_agent")
 async def stream_agent(
     body: AgentRequest,
     fastapi_request: Request,
     agent: CompiledGraph = Depends(get_agent),
 ):
+    trace = RequestTrace(body.thread_id, sample_rate=TRACE_SAMPLE_RATE)
     api_key = fastapi_request.headers.get("Authorization")
+    started_at = time.perf_counter()
     try:
         # Check authorization before proceeding
-        check_api_key(api_key=api_key)
+        await fastapi_request.app.state.authorizer.check(api_key)
 
-    except requests.exceptions.HTTPError as e:
+    except AuthorizationError as e:
+        trace.finish("unauthorized")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    trace.stage("auth", started_at)
+
+    started_at = time.perf_counter()
+    models = fastapi_request.app.state.models
+    if body.agent_type not in AGENT_TYPES:
+        trace.finish("invalid")
+        raise HTTPException(status_code=400, detail="Invalid agent type")
+    model, prompt = AGENT_MODELS[body.agent_type]
+    agent_runnable = agent["agent"].get_graph(
+        agent_type=body.agent_type, llm=models[model], prompt=prompt, summary_llm=models[SUMMARY_MODEL]
+    )
+    trace.agent_type = body.agent_type
+    trace.stage("graph", started_at)
+    config = WebAgent.run_config(
+        thread_id=body.thread_id,
+        api_key=api_key,
+        user_message=body.input,
+        max_parallel_tools=TOOL_PARALLELISM,
+    )
+
+    started_at = time.perf_counter()
+    runs = fastapi_request.app.state.runs
+    await runs.cancel_abandoned(body.thread_id)
+
+    tool_frames = ToolFrameEncoder(body.protocol_version, fastapi_request.app.state.tool_outputs, hash_api_key(api_key))
+    answer_cache = fastapi_request.app.state.answer_cache
+    # Only for a thread's first message; a follow-up means something different in another conversation
+    use_answer_cache = (
+        answer_cache is not None
+        and body.agent_type == "fast"
+        and not await agent["agent"].has_history(agent_runnable, config)
+    )
+    cached = answer_cache.lookup(body.input) if use_answer_cache else None
+    if use_answer_cache:
+        trace.stage("answer_cache", started_at)
+        started_at = time.perf_counter()
+
+    # Cached answers too count against the key's share
+    try:
+        slot = await fastapi_request.app.state.admission.acquire(api_key, body.agent_type)
+    except AdmissionRejected as e:
+        trace.finish("rejected")
         raise HTTPException(
-            status_code=e.response.status_code, detail=e.response.json()
-        )
-    if body.agent_type == "fast":
-        agent_runnable = agent["agent"].build_graph(
-            api_key=api_key, llm=nano, prompt=SIMPLE_PROMPT, summary_llm=nano, user_message=body.input
+            status_code=429, detail=e.detail, headers={"Retry-After": str(e.retry_after)}
         )
-        print("Fast agent running")
-    elif body.agent_type == "deep":
-        agent_runnable = agent["agent"].build_graph(
-            api_key=api_key, llm=kimik2, prompt=REASONING_PROMPT, summary_llm=nano, user_message=body.input
-        )
-        print("Deep agent running")
-    else:
-        raise HTTPException(status_code=400, detail="Invalid agent type")
+    trace.stage("admission", started_at)
+
+    if cached is not None:
+        try:
+            await agent["agent"].record_answer(agent_runnable, config, body.input, cached.answer)
+        except BaseException:
+            # The run that would release the slot never starts
+            slot.release()
+            raise
+        trace.event("answered from the answer cache")
+        frames = trace.stream(answer_cache.replay(cached, tool_frames))
+        run = runs.start(body.thread_id, api_key, frames, on_finish=slot.release, agent_type=body.agent_type)
+        return run_response(run, fastapi_request)
+
+    trace.event("%s agent running", body.agent_type)
 
     async def event_generator():
-        config = {"configurable": {"thread_id": body.thread_id}}
         operation_counter = 0
+        # Tool run_id -> operation_index; parallel tool calls can end in any order
+        operation_indexes = {}
+        framer = ChatbotFramer(protocol_version=body.protocol_version)
+        incremental = ANSWER_STREAMING == "incremental"
         events_with_content = []  # List to store events with their content and langgraph step
+        answer_stream = AgentAnswerStream()
 
-        async for event in agent_runnable.astream_events(
-            input={"messages": [HumanMessage(content=body.input)]},
-            config=config,
+        async for event in framer.paced(
+            agent_runnable.astream_events(
+                input={"messages": [HumanMessage(content=body.input)]},
+                config=config,
+            )
         ):
- 
+            if event is None:
+                # The model paused with answer text buffered
+                for frame in framer.flush():
+                    yield frame
+                continue
+            trace.on_event(event)
+
+            if incremental:
+                released = answer_stream.feed(event)
+                if released:
+                    for frame in framer.frames(released):
+                        yield frame
+
             # Collect events with content and their langgraph step
             if event["event"] == "on_chat_model_stream":
+                if incremental or not is_agent_model_event(event):
+                    continue
                 content = event["data"]["chunk"]
+                # Get langgraph step from metadata
+                langgraph_step = event.get("metadata", {}).get("langgraph_step", 0)
                 if hasattr(content, "content") and content.content:
-                    # Get langgraph step from metadata
-                    langgraph_step = event.get("metadata", {}).get("langgraph_step", 0)
                     events_with_content.append({
                         "content": content.content,
                         "langgraph_step": langgraph_step,
@@ -125,6 +271,9 @@ async def stream_agent(
                     })
 
             elif event["event"] == "on_tool_start":
+                # Keep answer text ordered before the tool events
+                for frame in framer.flush():
+                    yield frame
                 tool_name = event.get("name", "unknown_tool")
                 tool_input = event["data"].get("input", {})
 
@@ -138,68 +287,49 @@ async def stream_agent(
                 except:
                     serializable_input = "Unable to serialize input"
 
-                # Determine tool type from tool name
-                tool_type = "search"
-                if tool_name and "extract" in tool_name:
-                    tool_type = "extract"
-                elif tool_name and "crawl" in tool_name:
-                    tool_type = "crawl"
-                
-                yield (
-                    json.dumps(
-                        {
-                            "type": "tool_start",
-                            "tool_name": tool_name,
-                            "tool_type": tool_type,
-                            "operation_index": operation_counter,
-                            "content": serializable_input,
-                        }
-                    )
-                    + "\n"
+                tool_type = tool_type_of(tool_name)
+                operation_index = operation_counter
+                operation_indexes[event.get("run_id")] = operation_index
+                operation_counter += 1
+
+                yield tool_frames.frame(
+                    {
+                        "type": "tool_start",
+                        "tool_name": tool_name,
+                        "tool_type": tool_type,
+                        "operation_index": operation_index,
+                        "content": serializable_input,
+                    }
                 )
-                print(f"Tool start: {tool_name} {tool_type} {operation_counter}")
 
             elif event["event"] == "on_tool_end":
                 tool_name = event.get("name", "unknown_tool")
                 tool_output = event["data"].get("output")
-
-                # Safely serialize tool output
-                try:
-                    if hasattr(tool_output, "content"):
-                        # Handle ToolMessage objects
-                        serializable_output = str(tool_output.content)
-                    elif isinstance(tool_output, dict):
-                        serializable_output = {
-                            k: str(v) for k, v in tool_output.items()
-                        }
-                    elif isinstance(tool_output, list):
-                        serializable_output = [str(item) for item in tool_output]
-                    else:
-                        serializable_output = str(tool_output)
-                except:
-                    serializable_output = "Unable to serialize output"
-
-                # Determine tool type from tool name
-                tool_type = "search"
-                if tool_name and "extract" in tool_name:
-                    tool_type = "extract"
-                elif tool_name and "crawl" in tool_name:
-                    tool_type = "crawl"
-
-                yield (
-                    json.dumps(
-                        {
-                            "type": "tool_end",
-                            "tool_name": tool_name,
-                            "tool_type": tool_type,
-                            "operation_index": operation_counter,  # Match with start event
-                            "content": serializable_output,
-                        }
-                    )
-                    + "\n"
+                tool_type = tool_type_of(tool_name)
+                operation_index = operation_indexes.pop(event.get("run_id"), None)
+                if operation_index is None:
+                    operation_index = operation_counter
+                    operation_counter += 1
+
+                yield tool_frames.frame(
+                    {
+                        "type": "tool_end",
+                        "tool_name": tool_name,
+                        "tool_type": tool_type,
+                        "operation_index": operation_index,  # Match with start event
+                        "output": tool_output,
+                    }
                 )
-                print(f"Tool end: {tool_name} {tool_type} {operation_counter}")
-                operation_counter += 1
+
+        # Make the finished turn visible to other workers before the stream ends
+        flush_checkpoints = getattr(agent["agent"].checkpointer, "aflush", None)
+        if flush_checkpoints is not None:
+            await flush_checkpoints()
+
+        if incremental:
+            for frame in framer.frames(answer_stream.finish()) + framer.flush():
+                yield frame
+            return
 
         # After all events are processed, stream the final agent response
         if events_with_content:
@@ -213,51 +343,67 @@ async def stream_agent(
                     final_content += event["content"]
             
             # Filter out internal thoughts and only keep the final answer
-            # Look for "Final Answer:" section and extract only that
-            final_answer = ""
-            lines = final_content.split('\n')
-            
-            # Extract final answer if it exists
-            in_final_answer = False
-            for line in lines:
-                if "Final Answer:" in line:
-                    in_final_answer = True
-                    final_answer += line.replace("Final Answer:", "").strip() + "\n"
-                elif in_final_answer and line.strip():
-                    final_answer += line + "\n"
-                elif in_final_answer and not line.strip():
-                    break
-            
-            # If no "Final Answer:" section found, use the entire response
-            # but filter out obvious internal thought patterns
-            if not final_answer.strip():
-                filtered_response = ""
-                lines = final_content.split('\n')
-                
-                for line in lines:
-                    # Skip internal thought patterns
-                    if not any(pattern in line for pattern in ["Thought:", "Action:", "Action Input:", "Observation:"]):
-                        filtered_response += line + "\n"
-                
-                final_answer = filtered_response.strip()
-            else:
-                final_answer = final_answer.strip()
+            final_answer = extract_final_answer(final_content)
 
             if final_content:
-                # Yield each character one at a time
-                for char in final_answer:
-                    yield (
-                        json.dumps(
-                            {
-                                "type": "chatbot",
-                                "content": char,
-                            }
-                        )
-                        + "\n"
-                    )
-
-    return StreamingResponse(event_generator(), media_type="application/json")
+                for frame in framer.frames(final_answer) + framer.flush():
+                    yield frame
+
+    async def cancel_run():
+        await agent["agent"].cancel_run(agent_runnable, config)
+
+    frames = trace.stream(event_generator())
+    if use_answer_cache:
+        frames = answer_cache.record(body.input, frames, tool_frames)
+    run = runs.start(
+        body.thread_id,
+        api_key,
+        frames,
+        on_cancel=cancel_run,
+        on_finish=slot.release,
+        agent_type=body.agent_type,
+    )
+    return run_response(run, fastapi_request)
+
+
+def run_response(run: RunBuffer, fastapi_request: Request, after_seq: int = 0) -> StreamingResponse:
+    """Stream a run's frames after `after_seq` to the client of `fastapi_request`."""
+    return StreamingResponse(
+        fastapi_request.app.state.runs.stream(run, fastapi_request.receive, after_seq),
+        media_type="application/json",
+        headers={"X-Run-Id": run.run_id},
+    )
+
+
+@app.get("/tool_output/{output_id}")
+async def tool_output(output_id: str, fastapi_request: Request):
+    """The full output of a tool call announced by a compact tool_end frame to a client with the same API key."""
+    key_hash = hash_api_key(fastapi_request.headers.get("Authorization"))
+    content = fastapi_request.app.state.tool_outputs.get(output_id, key_hash)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Tool output not found or expired")
+    return Response(content, media_type="application/json")
+
+
+@app.get("/stream_agent/{thread_id}/{run_id}")
+async def resume_stream(thread_id: str, run_id: str, fastapi_request: Request, after_seq: int = 0):
+    """Resume a run's stream after the last frame sequence number the client received."""
+    runs = fastapi_request.app.state.runs
+    run = runs.get(thread_id, run_id, fastapi_request.headers.get("Authorization") or "")
+    if run is None:
+        RESUMES.labels(result="not_found").inc()
+        raise HTTPException(status_code=404, detail="Run not found or expired")
+    try:
+        run.check_available(after_seq)
+    except FramesEvicted as e:
+        RESUMES.labels(result="evicted").inc()
+        raise HTTPException(status_code=410, detail=str(e))
+    RESUMES.labels(result="ok").inc()
+    return run_response(run, fastapi_request, after_seq)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app=app, host="0.0.0.0", port=8080)
\ No newline at end of file
+    # Single process, for development; production runs gunicorn.conf.py
+    import uvicorn
+
+    uvicorn.run(app=app, host="0.0.0.0", port=int(os.getenv("PORT", "8080")))
\ No newline at end of file
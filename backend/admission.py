@@ -0,0 +1,216 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from backend.telemetry import ACTIVE_RUNS, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+from backend.utils import hash_api_key
+
+DEFAULT_WEIGHTS = {"fast": 3, "deep": 1}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a run can't be admitted within the wait budget."""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """
+    A running agent run. Release it when the run ends, e.g. from
+    `RunRegistry.start`'s `on_finish`; releasing twice is a no-op.
+    """
+
+    def __init__(self, controller: "AdmissionController", key: str, agent_type: str):
+        self._controller = controller
+        self.key = key
+        self.agent_type = agent_type
+        self.started_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+
+class _Waiter:
+    def __init__(self, key: str, agent_type: str):
+        self.key = key
+        self.agent_type = agent_type
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    Bounds how many agent runs a worker executes at once.
+
+    - At most `max_active` runs in total and `max_active_per_key` per API key.
+    - Runs over the limits wait in one FIFO queue per agent type. Freed slots
+      go to the queues by smooth weighted round robin on `weights`, so a burst
+      of deep runs can't starve fast ones (and the other way around).
+    - A run that waits longer than `max_wait` seconds, or arrives when
+      `max_queue` runs are already waiting, is rejected with a Retry-After
+      estimate from the recent run durations.
+    """
+
+    def __init__(
+        self,
+        max_active: int = 32,
+        max_active_per_key: int = 4,
+        max_wait: float = 10.0,
+        max_queue: int = 256,
+        weights: Optional[dict[str, int]] = None,
+    ):
+        """
+        Args:
+            max_active: Concurrent runs per worker
+            max_active_per_key: Concurrent runs per API key
+            max_wait: Seconds a run may wait for a slot
+            max_queue: Waiting runs across all queues
+            weights: Share of freed slots per agent type; unknown types get 1
+        """
+        self.max_active = max_active
+        self.max_active_per_key = max_active_per_key
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.weights = weights or dict(DEFAULT_WEIGHTS)
+        self.active = 0
+        self._active_per_key: dict[str, int] = {}
+        self._queues: dict[str, deque] = {agent_type: deque() for agent_type in self.weights}
+        self._credits: dict[str, int] = {agent_type: 0 for agent_type in self.weights}
+        # Moving average of run durations, for Retry-After
+        self._avg_run_seconds = 5.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        weights = dict(DEFAULT_WEIGHTS)
+        for item in os.getenv("ADMISSION_WEIGHTS", "").split(","):
+            if "=" in item:
+                agent_type, weight = item.split("=", 1)
+                weights[agent_type.strip()] = max(1, int(weight))
+        return cls(
+            max_active=int(os.getenv("ADMISSION_MAX_ACTIVE", "32")),
+            max_active_per_key=int(os.getenv("ADMISSION_MAX_PER_KEY", "4")),
+            max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "10")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "256")),
+            weights=weights,
+        )
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": {agent_type: len(queue) for agent_type, queue in self._queues.items()},
+            "avg_run_seconds": round(self._avg_run_seconds, 3),
+        }
+
+    async def acquire(self, api_key: str, agent_type: str) -> AdmissionSlot:
+        """
+        Wait for a slot for one run.
+
+        Args:
+            api_key: The caller's API key; only its hash is kept
+            agent_type: Queue the run waits in
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait budget runs out
+        """
+        key = hash_api_key(api_key)
+        queue = self._queues.setdefault(agent_type, deque())
+        self._credits.setdefault(agent_type, 0)
+
+        if not queue and self._can_start(key):
+            ADMISSION_WAIT_SECONDS.labels(agent_type=agent_type).observe(0)
+            return self._start(key, agent_type)
+
+        if self.queued >= self.max_queue:
+            self._reject(agent_type, "queue_full")
+            raise AdmissionRejected("Server is at capacity, please retry later", self._retry_after())
+
+        waiter = _Waiter(key, agent_type)
+        queue.append(waiter)
+        ADMISSION_QUEUE_DEPTH.labels(agent_type=agent_type).set(len(queue))
+        # Capacity may be free while the runs ahead wait on their own key's limit
+        self._dispatch()
+        started_at = time.monotonic()
+        try:
+            slot = await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # A slot was handed over just as the wait ended
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(agent_type, "timeout")
+            raise AdmissionRejected("Timed out waiting for capacity, please retry later", self._retry_after())
+        ADMISSION_WAIT_SECONDS.labels(agent_type=agent_type).observe(time.monotonic() - started_at)
+        return slot
+
+    def _can_start(self, key: str) -> bool:
+        return self.active < self.max_active and self._active_per_key.get(key, 0) < self.max_active_per_key
+
+    def _start(self, key: str, agent_type: str) -> AdmissionSlot:
+        self.active += 1
+        self._active_per_key[key] = self._active_per_key.get(key, 0) + 1
+        ACTIVE_RUNS.set(self.active)
+        return AdmissionSlot(self, key, agent_type)
+
+    def _release(self, slot: AdmissionSlot):
+        self.active -= 1
+        remaining = self._active_per_key.get(slot.key, 0) - 1
+        if remaining > 0:
+            self._active_per_key[slot.key] = remaining
+        else:
+            self._active_per_key.pop(slot.key, None)
+        ACTIVE_RUNS.set(self.active)
+        self._avg_run_seconds = 0.9 * self._avg_run_seconds + 0.1 * (time.monotonic() - slot.started_at)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand freed slots to waiters, choosing queues by smooth weighted round robin."""
+        while self.active < self.max_active:
+            eligible = {}
+            for agent_type, queue in self._queues.items():
+                waiter = next((w for w in queue if self._active_per_key.get(w.key, 0) < self.max_active_per_key), None)
+                if waiter is not None:
+                    eligible[agent_type] = waiter
+            if not eligible:
+                return
+
+            for agent_type in eligible:
+                self._credits[agent_type] += self.weights.get(agent_type, 1)
+            chosen = max(eligible, key=lambda agent_type: self._credits[agent_type])
+            self._credits[chosen] -= sum(self.weights.get(agent_type, 1) for agent_type in eligible)
+
+            waiter = eligible[chosen]
+            self._remove(waiter)
+            waiter.future.set_result(self._start(waiter.key, waiter.agent_type))
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues[waiter.agent_type]
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+        ADMISSION_QUEUE_DEPTH.labels(agent_type=waiter.agent_type).set(len(queue))
+
+    def _reject(self, agent_type: str, reason: str):
+        ADMISSION_REJECTED.labels(agent_type=agent_type, reason=reason).inc()
+
+    def _retry_after(self) -> int:
+        """Seconds until the current queue has likely drained."""
+        estimate = self._avg_run_seconds * (self.queued + 1) / max(1, self.max_active)
+        return min(60, max(1, math.ceil(estimate)))
@@ -1,152 +1,556 @@
+import asyncio
 import logging
-from typing import Callable
-from langchain_openai import ChatOpenAI
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from langchain_core.language_models import LanguageModelLike
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_tavily import TavilyCrawl, TavilyExtract, TavilySearch
+from langchain_tavily import _utilities as tavily_utilities
+from langchain_tavily._utilities import (
+    TavilyCrawlAPIWrapper,
+    TavilyExtractAPIWrapper,
+    TavilySearchAPIWrapper,
+)
 from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.prebuilt import create_react_agent
-import json
-import ast
+from pydantic import ConfigDict, SecretStr
+
+from backend.cache import ToolResultCache, normalize_tool_args
+from backend.compaction import DEFAULT_HISTORY_TOKEN_BUDGET, HISTORY_TOKEN_BUDGETS, create_history_compactor
+from backend.http_clients import HttpClientRegistry
+from backend.prefetch import Prefetcher, api_key_of, estimate_credits
+from backend.prompts import dated_prompt
+from backend.streaming import has_final_answer
+from backend.summarizer import (
+    PageSummaryCache,
+    create_async_output_summarizer,
+    create_output_summarizer,
+)
+from backend.utils import TAVILY_API_ENDPOINT
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Graphs are shared between users, so the tools are built with a placeholder key
+# and the caller's key is supplied per run through the config
+PLACEHOLDER_API_KEY = "unset"
 
-def create_output_summarizer(nano_llm: ChatOpenAI) -> Callable[[str, str], dict]:
-    def summarize_output(tool_output: str, user_message: str = "") -> dict:
-        if not tool_output or tool_output.strip() == "":
-            return {"summary": tool_output, "urls": []}
-
-        try:
-            parsed_output = json.loads(tool_output)
-        except (json.JSONDecodeError, TypeError):
-            try:
-                parsed_output = ast.literal_eval(tool_output)
-            except (ValueError, SyntaxError):
-                return {"summary": tool_output, "urls": []}
-
-        # Extract URLs, favicons, and content
-        urls = []
-        favicons = []
-        content = ""
-        
-        if isinstance(parsed_output, dict) and 'results' in parsed_output:
-            items = parsed_output['results']
-        elif isinstance(parsed_output, list):
-            items = parsed_output
-        else:
-            return {"summary": tool_output, "urls": [], "favicons": []}
-        
-        # Extract URLs, favicons and combine content
-        for item in items:
-            if isinstance(item, dict) and 'url' in item and 'raw_content' in item:
-                urls.append(item['url'])
-                favicons.append(item['favicon'])
-        
-        # Generate summary
-        summary_prompt = f"""
-        Summarize the following content into a relevant format that helps answer the user's question.
-        Focus on the key information that would be most useful for answering: {user_message}
-        Remove redundant information and highlight the most important findings.
-        
-        Content:
-        {content}
-        
-        Provide a clear, organized summary that captures the essential information relevant to the user's question:
+# Result recorded for tool calls whose run was cancelled before they finished
+CANCELLED_TOOL_OUTPUT = "Cancelled: the user disconnected before this tool call finished."
+
+# langchain-tavily reads its base URL from a module constant on every call
+tavily_utilities.TAVILY_API_URL = TAVILY_API_ENDPOINT
+
+
+async def post_tavily(wrapper, path: str, params: dict) -> dict:
+    """
+    Call a Tavily endpoint through the wrapper's pooled client.
+
+    Same request and errors as langchain-tavily's async wrappers, which open
+    a new aiohttp session (and connection) for every call.
+
+    Args:
+        wrapper: A pooled API wrapper with `tavily_api_key` and `http_client`
+        path: Endpoint path, e.g. "search"
+        params: Request parameters; None values are dropped
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    headers = {
+        "Authorization": f"Bearer {wrapper.tavily_api_key.get_secret_value()}",
+        "Content-Type": "application/json",
+        "X-Client-Source": "langchain-tavily",
+    }
+    response = await wrapper.http_client.post(f"{TAVILY_API_ENDPOINT}/{path}", json=params, headers=headers)
+    if response.status_code != 200:
+        raise Exception(f"Error {response.status_code}: {response.reason_phrase}")
+    return response.json()
+
+
+class PooledTavilySearchAPIWrapper(TavilySearchAPIWrapper):
+    model_config = ConfigDict(extra="forbid", arbitrary_types_allowed=True)
+    http_client: httpx.AsyncClient
+
+    async def raw_results_async(self, **params) -> dict:
+        return await post_tavily(self, "search", params)
+
+
+class PooledTavilyExtractAPIWrapper(TavilyExtractAPIWrapper):
+    model_config = ConfigDict(extra="forbid", arbitrary_types_allowed=True)
+    http_client: httpx.AsyncClient
+
+    async def raw_results_async(self, **params) -> dict:
+        return await post_tavily(self, "extract", params)
+
+
+class PooledTavilyCrawlAPIWrapper(TavilyCrawlAPIWrapper):
+    model_config = ConfigDict(extra="forbid", arbitrary_types_allowed=True)
+    http_client: httpx.AsyncClient
+
+    async def raw_results_async(self, **params) -> dict:
+        return await post_tavily(self, "crawl", params)
+
+
+def with_request_api_key(tool, config: RunnableConfig):
+    """
+    Return a shallow copy of a Tavily tool that uses the API key of the current run.
+
+    Args:
+        tool: A TavilySearch, TavilyExtract or TavilyCrawl instance
+        config: The run config carrying "api_key" in its configurable section
+    """
+    api_key = (config or {}).get("configurable", {}).get("api_key")
+    if not api_key:
+        return tool
+    if isinstance(api_key, str):
+        api_key = SecretStr(api_key)
+    # TavilyExtract names its wrapper "apiwrapper", the other tools "api_wrapper"
+    wrapper_field = "apiwrapper" if hasattr(tool, "apiwrapper") else "api_wrapper"
+    wrapper = getattr(tool, wrapper_field).model_copy(
+        update={"tavily_api_key": api_key}
+    )
+    return tool.model_copy(update={wrapper_field: wrapper})
+
+
+class ToolRunScope:
+    """
+    State shared by the tool calls of one agent run.
+
+    Tool calls the model issues in one step run concurrently, at most
+    `max_parallel` at a time. Identical calls in the same run (same tool,
+    same normalized arguments) share a single execution. A call that ends in
+    an error is forgotten once done, so a later retry runs again.
+    """
+
+    def __init__(self, max_parallel: int = 4):
+        self.semaphore = asyncio.Semaphore(max_parallel)
+        self.deduplicated = 0
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def run(self, tool_name: str, args: dict, call: Callable[[], Awaitable]):
         """
-        
-        summary = nano_llm.invoke(summary_prompt).content
-        
-        return {"summary": summary, "urls": urls, "favicons": favicons}
-    
-    return summarize_output
+        Args:
+            tool_name: Name of the tool
+            args: Keyword arguments of the tool call
+            call: Coroutine function running the tool
+        """
+        key = normalize_tool_args(tool_name, args)
+        future = self._calls.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            logger.info("Reusing result of an identical %s call in this run", tool_name)
+        else:
+            future = asyncio.ensure_future(self._limited(call))
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget_failed(key, done))
+        # Shield so one cancelled caller doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    async def _limited(self, call: Callable[[], Awaitable]):
+        async with self.semaphore:
+            return await call()
+
+    def cancel(self) -> int:
+        """Cancel the calls still running, e.g. after the client went away. Returns how many were running."""
+        running = [future for future in self._calls.values() if not future.done()]
+        for future in running:
+            future.cancel()
+        return len(running)
+
+    def _forget_failed(self, key: str, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            self._calls.pop(key, None)
+        elif isinstance(future.result(), dict) and "error" in future.result():
+            self._calls.pop(key, None)
+
+
+async def run_in_scope(tool, config: RunnableConfig, args: tuple, kwargs: dict, call: Callable[[], Awaitable]):
+    """Run a tool call through the run's ToolRunScope, if the config carries one."""
+    scope = (config or {}).get("configurable", {}).get("tool_scope")
+    if scope is None:
+        return await call()
+    if args:
+        async with scope.semaphore:
+            return await call()
+    return await scope.run(tool.name, kwargs, call)
+
+
+async def fetch_results(tool, base_cls, config: RunnableConfig, args: tuple, kwargs: dict, per_url: bool = False):
+    """
+    Call the Tavily API through `base_cls._arun`, going through the tool's result cache.
+
+    Args:
+        tool: The tool instance being run
+        base_cls: The langchain-tavily class whose `_arun` does the API call
+        config: The run config
+        args: Positional tool arguments
+        kwargs: Keyword tool arguments
+        per_url: Cache the results of each URL in kwargs["urls"] separately
+    """
+    scoped_tool = with_request_api_key(tool, config)
+
+    async def fetch(**call_kwargs):
+        result = await base_cls._arun(scoped_tool, *args, **call_kwargs)
+        # Prefetches are charged to the budget when they are scheduled
+        if tool.prefetcher is not None and not is_prefetch(config):
+            depth = getattr(tool, "search_depth", None) or getattr(tool, "extract_depth", None)
+            tool.prefetcher.record_credits(estimate_credits(tool.name, depth, call_kwargs), api_key_of(config))
+        return result
+
+    # Tool calls from the agent arrive as keyword arguments only
+    if tool.result_cache is None or args:
+        return await fetch(**kwargs)
+    if per_url:
+        return await tool.result_cache.get_or_fetch_per_url(
+            tool.name, kwargs, lambda urls: fetch(**{**kwargs, "urls": urls})
+        )
+    return await tool.result_cache.get_or_fetch(tool.name, kwargs, lambda: fetch(**kwargs))
+
+
+def is_prefetch(config: RunnableConfig) -> bool:
+    return bool((config or {}).get("configurable", {}).get("prefetch"))
+
+
+def get_user_message(config: RunnableConfig) -> str:
+    return (config or {}).get("configurable", {}).get("user_message", "")
+
+
+class RequestScopedTavilySearch(TavilySearch):
+    result_cache: Optional[ToolResultCache] = None
+    prefetcher: Optional[Prefetcher] = None
+    # The extract tool whose caches the prefetcher warms
+    extract_tool: Optional[TavilyExtract] = None
+
+    def _run(self, *args, config: RunnableConfig, **kwargs):
+        # Remove callback manager from kwargs to avoid Pydantic issues
+        kwargs.pop('run_manager', None)
+        return TavilySearch._run(with_request_api_key(self, config), *args, **kwargs)
+
+    async def _arun(self, *args, config: RunnableConfig, **kwargs):
+        # Remove callback manager from kwargs to avoid Pydantic issues
+        kwargs.pop('run_manager', None)
+
+        async def call():
+            return await fetch_results(self, TavilySearch, config, args, kwargs)
+
+        result = await run_in_scope(self, config, args, kwargs, call)
+        if self.prefetcher is not None and self.extract_tool is not None and isinstance(result, dict):
+            if "error" not in result and not is_prefetch(config):
+                self.prefetcher.schedule(
+                    result, config, self.extract_tool.prefetch, depth=self.extract_tool.extract_depth
+                )
+        return result
+
+
+class SummarizingTavilyExtract(TavilyExtract):
+    output_summarizer: Callable[[str, str], dict]
+    async_output_summarizer: Callable[[str, str], Awaitable[dict]]
+    result_cache: Optional[ToolResultCache] = None
+    prefetcher: Optional[Prefetcher] = None
+
+    def _run(self, *args, config: RunnableConfig, **kwargs):
+        # Remove callback manager from kwargs to avoid Pydantic issues
+        kwargs.pop('run_manager', None)
+        result = TavilyExtract._run(with_request_api_key(self, config), *args, **kwargs)
+        return self.output_summarizer(str(result), get_user_message(config))
+
+    async def _arun(self, *args, config: RunnableConfig, **kwargs):
+        # Remove callback manager from kwargs to avoid Pydantic issues
+        kwargs.pop('run_manager', None)
+
+        if self.prefetcher is not None:
+            self.prefetcher.record_extract(kwargs.get("urls"))
+            await self.prefetcher.wait_for(kwargs.get("urls"))
+
+        async def call():
+            return await self._extract_and_summarize(config, args, kwargs)
+
+        return await run_in_scope(self, config, args, kwargs, call)
+
+    async def prefetch(self, urls: list[str], config: RunnableConfig):
+        """Extract and summarize search results ahead of the agent, warming the result and page summary caches."""
+        # Fill in the schema defaults like an agent's call would, so both share cache entries
+        kwargs = self.args_schema.model_validate({"urls": urls}).model_dump()
+        await self._extract_and_summarize(config, (), kwargs)
+
+    async def _extract_and_summarize(self, config: RunnableConfig, args: tuple, kwargs: dict):
+        result = await fetch_results(self, TavilyExtract, config, args, kwargs, per_url=True)
+        return await self.async_output_summarizer(str(result), get_user_message(config))
+
+
+class SummarizingTavilyCrawl(TavilyCrawl):
+    output_summarizer: Callable[[str, str], dict]
+    async_output_summarizer: Callable[[str, str], Awaitable[dict]]
+    result_cache: Optional[ToolResultCache] = None
+    prefetcher: Optional[Prefetcher] = None
+
+    def _run(self, *args, config: RunnableConfig, **kwargs):
+        # Remove callback manager from kwargs to avoid Pydantic issues
+        kwargs.pop('run_manager', None)
+        result = TavilyCrawl._run(with_request_api_key(self, config), *args, **kwargs)
+        output = self.output_summarizer(str(result), get_user_message(config))
+        return output
+
+    async def _arun(self, *args, config: RunnableConfig, **kwargs):
+        # Remove callback manager from kwargs to avoid Pydantic issues
+        kwargs.pop('run_manager', None)
+
+        async def call():
+            result = await fetch_results(self, TavilyCrawl, config, args, kwargs)
+            output = await self.async_output_summarizer(str(result), get_user_message(config))
+            return output
+
+        return await run_in_scope(self, config, args, kwargs, call)
+
+
+def end_at_final_answer(state: dict) -> dict:
+    """
+    Post-model hook: a step that writes its "Final Answer:" ends the run.
+
+    The ReAct prompt has the model stop at its final answer, and the answer
+    stream releases that section before the step's tool calls, if any,
+    arrive. Tool calls made alongside a final answer are dropped so the
+    streamed answer is the run's last step.
+    """
+    message = state["messages"][-1]
+    if not (isinstance(message, AIMessage) and message.tool_calls and has_final_answer(message.content)):
+        return {}
+    logger.warning("Dropping %d tool calls made alongside a final answer", len(message.tool_calls))
+    additional_kwargs = {key: value for key, value in message.additional_kwargs.items() if key != "tool_calls"}
+    # Same message id, so it replaces the model's message
+    return {
+        "messages": [
+            message.model_copy(
+                update={"tool_calls": [], "invalid_tool_calls": [], "additional_kwargs": additional_kwargs}
+            )
+        ]
+    }
+
+
+def _model_name(llm) -> str:
+    # Models configured with .with_config() are wrapped in a RunnableBinding
+    model = getattr(llm, "bound", llm)
+    return getattr(model, "model_name", None) or getattr(model, "model", None) or repr(model)
 
 
 class WebAgent:
     def __init__(
         self,
         checkpointer: MemorySaver = None,
+        summary_concurrency: int = 8,
+        summary_timeout: float = 20.0,
+        result_cache: Optional[ToolResultCache] = None,
+        summary_cache: Optional[PageSummaryCache] = None,
+        http: Optional[HttpClientRegistry] = None,
+        prefetcher: Optional[Prefetcher] = None,
     ):
+        """
+        Args:
+            checkpointer: Checkpointer for conversation state
+            summary_concurrency: Maximum number of tool output summaries running at once
+            summary_timeout: Seconds before a summary falls back to the unsummarized output
+            result_cache: Cache of raw Tavily results shared by all graphs, or None
+            summary_cache: Cache of per-page summaries; a process-local one is created if omitted
+            http: Shared connection pools for Tavily calls; each call opens its own connection if omitted
+            prefetcher: Extracts top search results in the background, or None
+        """
         self.checkpointer = checkpointer
+        self.http = http
+        self.prefetcher = prefetcher
+        self.result_cache = result_cache
+        self.summary_cache = summary_cache or PageSummaryCache()
+        self.summary_timeout = summary_timeout
+        self.summary_semaphore = asyncio.Semaphore(summary_concurrency)
+        self._graphs: dict[tuple, CompiledStateGraph] = {}
 
-    def build_graph(self, api_key: str, llm: ChatOpenAI, prompt: str, summary_llm: ChatOpenAI, user_message: str = ""):
+    @staticmethod
+    def run_config(thread_id: str, api_key: str, user_message: str = "", max_parallel_tools: int = 4) -> dict:
         """
-        Build and compile the LangGraph workflow.
-        
+        Build the per-request run config for a cached graph.
+
         Args:
-            api_key: Tavily API key
-            llm: Main LLM for the agent
-            prompt: System prompt
-            summary_llm: LLM for summarizing tool outputs
+            thread_id: Conversation thread for the checkpointer
+            api_key: Tavily API key used by the tools for this run
             user_message: The user's original message for context in summarization
+            max_parallel_tools: Tool calls of this run that may execute at once
         """
         if not api_key:
             raise ValueError("Error: Tavily API key not provided.")
 
-        # Create the tools with the API key
-        search = TavilySearch(
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                # Checkpointers copy plain string values of the configurable
+                # section into checkpoint metadata; a SecretStr is left out
+                "api_key": SecretStr(api_key),
+                "user_message": user_message,
+                "tool_scope": ToolRunScope(max_parallel_tools),
+            }
+        }
+
+    def get_graph(
+        self, agent_type: str, llm: LanguageModelLike, prompt: str, summary_llm: LanguageModelLike
+    ) -> CompiledStateGraph:
+        """
+        Return the compiled graph for an agent configuration, building it on first use.
+
+        Graphs are cached per (agent_type, model, prompt). Nothing request specific is
+        captured in them; see `run_config`.
+        """
+        key = (agent_type, _model_name(llm), prompt)
+        graph = self._graphs.get(key)
+        if graph is None:
+            graph = self.build_graph(
+                llm=llm,
+                prompt=prompt,
+                summary_llm=summary_llm,
+                history_token_budget=HISTORY_TOKEN_BUDGETS.get(agent_type, DEFAULT_HISTORY_TOKEN_BUDGET),
+            )
+            self._graphs[key] = graph
+        return graph
+
+    async def cancel_run(self, graph: CompiledStateGraph, config: RunnableConfig) -> int:
+        """
+        Clean up after a run that was cancelled part way, e.g. because the client disconnected.
+
+        Stops the run's tool calls that are still running and answers every
+        tool call of the last model step that has no result yet, so the
+        thread's next turn doesn't send the model unanswered tool calls.
+
+        Args:
+            graph: The graph the run was executing
+            config: The run's config from `run_config`
+
+        Returns:
+            int: Number of tool calls answered as cancelled
+        """
+        scope = config["configurable"].get("tool_scope")
+        if scope is not None:
+            scope.cancel()
+
+        state = await graph.aget_state(config)
+        messages = state.values.get("messages", [])
+        last_step = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+        if last_step is None or not last_step.tool_calls:
+            return 0
+        answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+        cancelled = [
+            ToolMessage(
+                content=CANCELLED_TOOL_OUTPUT,
+                name=tool_call["name"],
+                tool_call_id=tool_call["id"],
+                status="error",
+            )
+            for tool_call in last_step.tool_calls
+            if tool_call["id"] not in answered
+        ]
+        if not cancelled:
+            return 0
+        await graph.aupdate_state(config, {"messages": cancelled}, as_node="tools")
+        flush_checkpoints = getattr(self.checkpointer, "aflush", None)
+        if flush_checkpoints is not None:
+            await flush_checkpoints()
+        logger.info("Answered %d unfinished tool calls of a cancelled run", len(cancelled))
+        return len(cancelled)
+
+    async def has_history(self, graph: CompiledStateGraph, config: RunnableConfig) -> bool:
+        """Whether the run's thread already has messages."""
+        state = await graph.aget_state(config)
+        return bool(state.values.get("messages"))
+
+    async def record_answer(self, graph: CompiledStateGraph, config: RunnableConfig, question: str, answer: str):
+        """
+        Add a question and an answer produced outside the graph, e.g. from a cache, to the thread.
+
+        Args:
+            graph: The graph the thread belongs to
+            config: The run's config from `run_config`
+            question: The user's message
+            answer: The answer sent to the user
+        """
+        # As the step's last node, so the thread ends with no node pending
+        await graph.aupdate_state(
+            config, {"messages": [HumanMessage(content=question), AIMessage(content=answer)]}, as_node="post_model_hook"
+        )
+        flush_checkpoints = getattr(self.checkpointer, "aflush", None)
+        if flush_checkpoints is not None:
+            await flush_checkpoints()
+
+    def _tavily_api(self, wrapper_field: str, pooled_wrapper_cls) -> dict:
+        """Constructor arguments giving a Tavily tool its API wrapper, pooled when a registry is set."""
+        if self.http is None:
+            return {"tavily_api_key": PLACEHOLDER_API_KEY}
+        wrapper = pooled_wrapper_cls(
+            tavily_api_key=PLACEHOLDER_API_KEY,
+            http_client=self.http.client(TAVILY_API_ENDPOINT),
+        )
+        return {wrapper_field: wrapper}
+
+    def build_graph(
+        self,
+        llm: LanguageModelLike,
+        prompt: str,
+        summary_llm: LanguageModelLike,
+        history_token_budget: int = DEFAULT_HISTORY_TOKEN_BUDGET,
+    ) -> CompiledStateGraph:
+        """
+        Build and compile the LangGraph workflow.
+
+        Args:
+            llm: Main LLM for the agent
+            prompt: System prompt template from `backend.prompts`, rendered on every model call
+            summary_llm: LLM for summarizing tool outputs
+            history_token_budget: Estimated token budget for the conversation history
+        """
+        # Create the tools; the API key comes from the run config
+        search = RequestScopedTavilySearch(
             max_results=10,
-            api_key=api_key,
+            **self._tavily_api("api_wrapper", PooledTavilySearchAPIWrapper),
             include_favicon=True,
             search_depth="advanced",
             include_answer=False,
+            result_cache=self.result_cache,
+            prefetcher=self.prefetcher,
         )
 
-        extract = TavilyExtract(
-            extract_depth="advanced",
-            api_key=api_key,
-            include_favicon=True,
+        output_summarizer = create_output_summarizer(summary_llm)
+        async_output_summarizer = create_async_output_summarizer(
+            summary_llm,
+            self.summary_semaphore,
+            timeout=self.summary_timeout,
+            page_cache=self.summary_cache,
         )
 
-        crawl = TavilyCrawl(api_key=api_key, include_favicon=True, limit=15)
-        
-        output_summarizer = create_output_summarizer(summary_llm)
-        
-        class SummarizingTavilyExtract(TavilyExtract):
-            def _run(self, *args, **kwargs):
-                # Remove callback manager from kwargs to avoid Pydantic issues
-                kwargs.pop('run_manager', None)
-                result = super()._run(*args, **kwargs)
-                return output_summarizer(str(result), user_message)
-            
-            async def _arun(self, *args, **kwargs):
-                # Remove callback manager from kwargs to avoid Pydantic issues
-                kwargs.pop('run_manager', None)
-                result = await super()._arun(*args, **kwargs)
-                return output_summarizer(str(result), user_message)
-        
-        class SummarizingTavilyCrawl(TavilyCrawl):
-            def _run(self, *args, **kwargs):
-                # Remove callback manager from kwargs to avoid Pydantic issues
-                kwargs.pop('run_manager', None)
-                result = super()._run(*args, **kwargs)
-                output = output_summarizer(str(result), user_message)
-                return output
-            
-            async def _arun(self, *args, **kwargs):
-                # Remove callback manager from kwargs to avoid Pydantic issues
-                kwargs.pop('run_manager', None)
-                result = await super()._arun(*args, **kwargs)
-                output = output_summarizer(str(result), user_message)
-                return output
-        
         extract_with_summary = SummarizingTavilyExtract(
-            extract_depth=extract.extract_depth,
-            api_key=api_key,
-            include_favicon=extract.include_favicon,
-            description=extract.description
+            extract_depth="advanced",
+            **self._tavily_api("apiwrapper", PooledTavilyExtractAPIWrapper),
+            include_favicon=True,
+            result_cache=self.result_cache,
+            prefetcher=self.prefetcher,
+            output_summarizer=output_summarizer,
+            async_output_summarizer=async_output_summarizer,
         )
-        
+
         crawl_with_summary = SummarizingTavilyCrawl(
-            api_key=api_key,
-            include_favicon=crawl.include_favicon,
-            limit=crawl.limit,
-            description=crawl.description
+            **self._tavily_api("api_wrapper", PooledTavilyCrawlAPIWrapper),
+            include_favicon=True,
+            limit=15,
+            result_cache=self.result_cache,
+            prefetcher=self.prefetcher,
+            output_summarizer=output_summarizer,
+            async_output_summarizer=async_output_summarizer,
         )
-        
+
+        search.extract_tool = extract_with_summary
+
         return create_react_agent(
-            prompt=prompt,
+            prompt=dated_prompt(prompt),
             model=llm,
             tools=[search, extract_with_summary, crawl_with_summary],
+            pre_model_hook=create_history_compactor(history_token_budget),
+            post_model_hook=end_at_final_answer,
             checkpointer=self.checkpointer,
         )
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+import numpy as np
+
+from backend.streaming import ChatbotFramer
+from backend.telemetry import ANSWER_CACHE_LOOKUPS
+from backend.tool_events import ToolFrameEncoder
+
+logger = logging.getLogger(__name__)
+
+# Words that make a question about the present, so its answer goes stale like news
+TIME_SENSITIVE_WORDS = frozenset(
+    ["today", "tonight", "now", "latest", "current", "currently", "breaking", "live", "this week", "yesterday"]
+)
+# Search time ranges whose results change within hours
+SHORT_TIME_RANGES = frozenset(["day", "d", "week", "w"])
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class HashingEmbedder:
+    """
+    Embeds text as signed, hashed counts of its words and word pairs.
+
+    No model to load and the same vector in every process; good enough to
+    find near-duplicate questions, not paraphrases.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        words = normalize_question(text).split()
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        # Sublinear term frequency, then unit length so a dot product is the cosine
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    # tool_start and tool_end events with the full tool outputs, which carry the sources;
+    # encoded for the protocol version of each client they are replayed to
+    tool_events: list[dict]
+    created_at: float
+    max_age: float
+
+
+class AnswerCache:
+    """
+    Recent fast agent answers, looked up by question similarity.
+
+    Questions are embedded with `HashingEmbedder` into a fixed-size matrix
+    used as a ring buffer, and a lookup is one matrix-vector product over it.
+    A hit needs a cosine similarity of at least `threshold` and an answer
+    younger than its freshness window: `ttl`, or `news_ttl` when the run
+    searched news or a short time range, or the question asks about the
+    present.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 2048,
+        threshold: float = 0.9,
+        ttl: float = 3600.0,
+        news_ttl: float = 600.0,
+        embedder: Optional[HashingEmbedder] = None,
+    ):
+        """
+        Args:
+            capacity: Answers kept; the oldest is replaced first
+            threshold: Cosine similarity a cached question needs to be served
+            ttl: Seconds an answer stays fresh
+            news_ttl: Seconds an answer about current events stays fresh
+            embedder: Question embedder; a 1024 dimension `HashingEmbedder` if omitted
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.news_ttl = news_ttl
+        self.embedder = embedder or HashingEmbedder()
+        self._vectors = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+        self._created_at = np.zeros(capacity, dtype=np.float64)
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._entries: list[Optional[CachedAnswer]] = [None] * capacity
+        self._next = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["AnswerCache"]:
+        if os.getenv("ANSWER_CACHE", "off") != "on":
+            return None
+        return cls(
+            capacity=int(os.getenv("ANSWER_CACHE_SIZE", "2048")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.9")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            news_ttl=float(os.getenv("ANSWER_CACHE_NEWS_TTL", "600")),
+        )
+
+    def is_time_sensitive(self, question: str) -> bool:
+        normalized = f" {normalize_question(question)} "
+        return any(f" {word} " in normalized for word in TIME_SENSITIVE_WORDS)
+
+    def lookup(self, question: str) -> Optional[CachedAnswer]:
+        """The freshest close enough answer to `question`, or None."""
+        query = self.embedder.embed(question)
+        now = time.time()
+        max_age = self.news_ttl if self.is_time_sensitive(question) else self.ttl
+        scores = self._vectors @ query
+        # Entries past their own window, or older than this question tolerates, can't match
+        fresh = (self._expires_at > now) & (self._created_at > now - max_age)
+        scores[~fresh] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            ANSWER_CACHE_LOOKUPS.labels(result="miss").inc()
+            return None
+        ANSWER_CACHE_LOOKUPS.labels(result="hit").inc()
+        logger.info("Answer cache hit (similarity %.3f)", scores[best])
+        return self._entries[best]
+
+    def store(self, question: str, answer: str, tool_events: list[dict], news: bool = False):
+        """
+        Args:
+            question: The user's message
+            answer: The final answer text
+            tool_events: The run's tool events, as kept by `ToolFrameEncoder`
+            news: Whether the run searched news or a short time range
+        """
+        max_age = self.news_ttl if news or self.is_time_sensitive(question) else self.ttl
+        now = time.time()
+        slot = self._next
+        self._vectors[slot] = self.embedder.embed(question)
+        self._created_at[slot] = now
+        self._expires_at[slot] = now + max_age
+        self._entries[slot] = CachedAnswer(question, answer, tool_events, now, max_age)
+        self._next = (slot + 1) % self.capacity
+
+    async def record(
+        self, question: str, frames: AsyncIterator[str], tool_frames: ToolFrameEncoder
+    ) -> AsyncIterator[str]:
+        """
+        Pass a run's frames through and cache its answer if the run completes.
+
+        Args:
+            question: The user's message
+            frames: The run's frames
+            tool_frames: The encoder of the run's tool frames, which keeps their events
+        """
+        answer = []
+        async for frame in frames:
+            yield frame
+            if ChatbotFramer.is_chatbot_frame(frame):
+                answer.append(json.loads(frame)["content"])
+        if not answer:
+            return
+        news = False
+        for event in tool_frames.events:
+            tool_input = event.get("content") if event["type"] == "tool_start" else None
+            if isinstance(tool_input, dict):
+                news = news or tool_input.get("topic") == "news"
+                news = news or tool_input.get("time_range") in SHORT_TIME_RANGES
+        self.store(question, "".join(answer), list(tool_frames.events), news=news)
+
+    async def replay(self, cached: CachedAnswer, tool_frames: ToolFrameEncoder) -> AsyncIterator[str]:
+        """
+        The frames of a cached run, encoded for the client's protocol version.
+
+        Args:
+            cached: The answer from `lookup`
+            tool_frames: The tool frame encoder of the client's request; compact
+                tool_end frames get new output IDs, so their full outputs can
+                be fetched for as long as a fresh run's
+        """
+        for event in cached.tool_events:
+            yield tool_frames.frame(event)
+        framer = ChatbotFramer(protocol_version=tool_frames.protocol_version)
+        for frame in framer.frames(cached.answer) + framer.flush():
+            yield frame
@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain_core.tools import ToolException
+
+logger = logging.getLogger(__name__)
+
+# Seconds a result stays fresh, per tool. Searches go stale fastest.
+DEFAULT_TOOL_TTLS = {
+    "tavily_search": 300,
+    "tavily_extract": 3600,
+    "tavily_crawl": 3600,
+}
+
+
+def normalize_tool_args(tool_name: str, args: dict) -> str:
+    """
+    Build a cache key from a tool name and its call arguments.
+
+    Unset arguments are dropped, strings are trimmed and lowercased (except
+    URLs, whose paths can be case sensitive), and lists such as
+    include_domains or urls are sorted, so equivalent calls share a key.
+
+    Args:
+        tool_name: Name of the tool, e.g. "tavily_search"
+        args: Keyword arguments of the tool call
+
+    Returns:
+        str: "<tool_name>:<sha256 of the normalized arguments>"
+    """
+    normalized = {}
+    for name, value in args.items():
+        if value is None or value == [] or value == "":
+            continue
+        normalized[name] = _normalize_value(name, value)
+    digest = hashlib.sha256(
+        json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"{tool_name}:{digest}"
+
+
+def normalize_url(url: str) -> str:
+    return _normalize_value("url", url)
+
+
+def _normalize_value(name: str, value: Any) -> Any:
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        if name in ("url", "urls"):
+            return value.rstrip("/")
+        return value.lower()
+    if isinstance(value, (list, tuple)):
+        return sorted(_normalize_value(name, item) for item in value)
+    return value
+
+
+class CacheBackend(ABC):
+    """Storage interface for `ToolResultCache`."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """The value stored under `key`, or None if it is missing or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        """Store `value` under `key` for `ttl` seconds."""
+
+
+class InMemoryLRUBackend(CacheBackend):
+    """
+    Process-local LRU cache with per-entry expiry.
+
+    Holds at most `max_entries` results and `max_bytes` of them, measured as
+    their JSON encoding; the least recently used are evicted first. A result
+    larger than `max_bytes` on its own is not stored.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Key -> (expiry, value, size)
+        self._entries: "OrderedDict[str, tuple[float, Any, int]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        size = len(json.dumps(value, default=str).encode("utf-8"))
+        if key in self._entries:
+            self._drop(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+
+class DiskBackend(CacheBackend):
+    """
+    JSON files in a directory, shared by every worker on the host.
+
+    File access runs in a thread so the event loop never waits on disk.
+    Each file's modification time is set to its expiry, so the directory can
+    be pruned from `stat` alone: every `prune_every` writes, expired entries
+    are deleted, then the entries closest to expiry until the directory is
+    within `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024, prune_every: int = 200):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        # Prune on the first write, clearing what earlier runs left behind
+        self._writes_since_prune = prune_every
+        self._pruning = False
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def _read(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return entry["value"]
+
+    def _write(self, key: str, value: Any, ttl: float):
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        expires_at = time.time() + ttl
+        tmp_path.write_text(json.dumps({"expires_at": expires_at, "value": value}))
+        os.utime(tmp_path, (expires_at, expires_at))
+        # Atomic on POSIX, so readers never see a partial file
+        tmp_path.replace(path)
+
+    def prune(self) -> int:
+        """
+        Delete expired entries, then the ones expiring soonest while over `max_bytes`.
+
+        Returns:
+            int: Number of entries deleted
+        """
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(key=lambda entry: entry[0])
+
+        total = sum(size for _, size, _ in entries)
+        deleted = 0
+        for expires_at, size, path in entries:
+            if expires_at > now and total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            deleted += 1
+        if deleted:
+            logger.info("Pruned %d tool cache entries, %.1f MB left", deleted, total / 1024 / 1024)
+        return deleted
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        try:
+            await asyncio.to_thread(self._write, key, value, ttl)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("Could not write tool cache entry: %s", e)
+
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= self.prune_every and not self._pruning:
+            self._writes_since_prune = 0
+            self._pruning = True
+            try:
+                await asyncio.to_thread(self.prune)
+            except OSError as e:
+                logger.warning("Could not prune the tool cache: %s", e)
+            finally:
+                self._pruning = False
+
+
+class ToolResultCache:
+    """
+    Content-addressed cache of raw Tavily tool results.
+
+    Only successful results are stored; errors are always fetched again.
+    """
+
+    def __init__(self, backend: CacheBackend, ttls: Optional[dict] = None):
+        """
+        Args:
+            backend: Where entries are stored
+            ttls: Seconds each tool's results stay fresh, keyed by tool name
+        """
+        self.backend = backend
+        self.ttls = {**DEFAULT_TOOL_TTLS, **(ttls or {})}
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+    @property
+    def stats(self) -> dict:
+        return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+    async def get_or_fetch(
+        self, tool_name: str, args: dict, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Return the cached result for a tool call, or call `fetch` and cache its result.
+
+        Args:
+            tool_name: Name of the tool
+            args: Keyword arguments of the tool call
+            fetch: Coroutine function calling the Tavily API
+        """
+        ttl = self.ttls.get(tool_name)
+        if not ttl:
+            return await fetch()
+
+        key = normalize_tool_args(tool_name, args)
+        cached = await self.backend.get(key)
+        if cached is not None:
+            self.hits[tool_name] = self.hits.get(tool_name, 0) + 1
+            return cached
+
+        self.misses[tool_name] = self.misses.get(tool_name, 0) + 1
+        result = await fetch()
+        if isinstance(result, dict) and "error" not in result:
+            await self.backend.set(key, result, ttl)
+        return result
+
+    async def get_or_fetch_per_url(
+        self, tool_name: str, args: dict, fetch: Callable[[list[str]], Awaitable[Any]]
+    ) -> Any:
+        """
+        Cached extract results, one entry per URL.
+
+        Only the URLs missing from the cache are fetched, so an extract of
+        [a, b] is served from earlier extracts of [a] and [b, c]. Hits and
+        misses are counted per URL.
+
+        Args:
+            tool_name: Name of the tool
+            args: Keyword arguments of the tool call, with a "urls" list
+            fetch: Coroutine function fetching results for a list of URLs
+        """
+        ttl = self.ttls.get(tool_name)
+        urls = args.get("urls")
+        if isinstance(urls, str):
+            urls = [urls]
+        if not ttl or not isinstance(urls, list):
+            return await fetch(urls)
+
+        params = {name: value for name, value in args.items() if name != "urls"}
+        items: dict[str, Any] = {}
+        for url in urls:
+            item = await self.backend.get(normalize_tool_args(tool_name, {**params, "urls": url}))
+            if item is not None:
+                items[normalize_url(url)] = item
+        missing = [url for url in urls if normalize_url(url) not in items]
+        self.hits[tool_name] = self.hits.get(tool_name, 0) + len(urls) - len(missing)
+        self.misses[tool_name] = self.misses.get(tool_name, 0) + len(missing)
+
+        failed_results = []
+        if missing:
+            try:
+                result = await fetch(missing)
+            except ToolException:
+                # Nothing could be extracted from the missing URLs
+                if not items:
+                    raise
+                result = {}
+            if isinstance(result, dict) and "error" in result:
+                if not items:
+                    return result
+                result = {}
+            for item in result.get("results", []):
+                if isinstance(item, dict) and item.get("url"):
+                    items[normalize_url(item["url"])] = item
+                    await self.backend.set(normalize_tool_args(tool_name, {**params, "urls": item["url"]}), item, ttl)
+            failed_results = result.get("failed_results", [])
+
+        ordered = [items.pop(normalize_url(url)) for url in urls if normalize_url(url) in items]
+        # Results whose URL differs from the requested one, e.g. after a redirect
+        ordered.extend(items.values())
+        return {"results": ordered, "failed_results": failed_results}
+
+
+def create_tool_cache(
+    kind: str,
+    directory: str = ".cache/tools",
+    max_bytes: int = 512 * 1024 * 1024,
+    memory_max_bytes: int = 64 * 1024 * 1024,
+) -> Optional[ToolResultCache]:
+    """
+    Args:
+        kind: "memory", "disk" or "off"
+        directory: Cache directory for the disk backend
+        max_bytes: Size the disk backend's directory is pruned to
+        memory_max_bytes: Size of the results the memory backend keeps per worker
+
+    Returns:
+        ToolResultCache or None when caching is off
+    """
+    if kind == "memory":
+        return ToolResultCache(InMemoryLRUBackend(max_bytes=memory_max_bytes))
+    if kind == "disk":
+        return ToolResultCache(DiskBackend(directory, max_bytes=max_bytes))
+    if kind == "off":
+        return None
+    raise ValueError(f"Unknown tool cache backend: {kind}")
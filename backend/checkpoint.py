@@ -0,0 +1,307 @@
+import asyncio
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional, Sequence
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from backend.telemetry import CHECKPOINT_BYTES, CHECKPOINT_EVICTIONS, CHECKPOINT_THREADS
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer with a memory budget.
+
+    - Only the latest `keep_last` checkpoints of each thread are kept, along
+      with the channel blobs they still reference.
+    - Threads not read or written for `idle_ttl` seconds are dropped.
+    - When the serialized size of all threads exceeds `max_bytes`, the least
+      recently used threads are dropped until it fits again.
+
+    Dropping a thread loses its conversation history, the same as a restart
+    would with a plain MemorySaver.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        keep_last: int = 3,
+        idle_ttl: Optional[float] = 3600.0,
+        serde: Any = None,
+    ):
+        """
+        Args:
+            max_bytes: Budget for the serialized size of all threads
+            keep_last: Checkpoints kept per thread and namespace
+            idle_ttl: Seconds after which an untouched thread is dropped, or None to disable
+            serde: Serializer passed through to MemorySaver
+        """
+        super().__init__(serde=serde)
+        self.max_bytes = max_bytes
+        self.keep_last = max(1, keep_last)
+        self.idle_ttl = idle_ttl
+        self.evicted_threads = 0
+        # thread_id -> last access time, least recently used first
+        self._last_access: "OrderedDict[str, float]" = OrderedDict()
+        self._thread_bytes: dict[str, int] = {}
+        self._total_bytes = 0
+        # Per-thread indexes of blob and write keys, so trimming never scans other threads
+        self._blob_keys: dict[str, set] = defaultdict(set)
+        self._write_keys: dict[str, set] = defaultdict(set)
+        # (thread_id, checkpoint_ns, checkpoint_id) -> channel_versions of that checkpoint
+        self._versions: dict[tuple, ChannelVersions] = {}
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "threads": len(self._last_access),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "evicted_threads": self.evicted_threads,
+        }
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        if thread_id not in self._last_access:
+            # Avoid the empty entries MemorySaver's defaultdicts would create
+            return None
+        self._touch(thread_id)
+        return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        for channel, version in new_versions.items():
+            self._blob_keys[thread_id].add((thread_id, checkpoint_ns, channel, version))
+        self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+
+        self._touch(thread_id)
+        self._trim(thread_id, checkpoint_ns)
+        self._measure(thread_id)
+        self._evict(keep=thread_id)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id = config["configurable"]["thread_id"]
+        self._write_keys[thread_id].add(
+            (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        )
+        self._touch(thread_id)
+        self._measure(thread_id)
+        self._evict(keep=thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        for key in [key for key in self._versions if key[0] == thread_id]:
+            del self._versions[key]
+        self._last_access.pop(thread_id, None)
+        self._total_bytes -= self._thread_bytes.pop(thread_id, 0)
+        self._report()
+
+    def _touch(self, thread_id: str):
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _trim(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_last:
+            return
+
+        # Checkpoint IDs are time-ordered
+        for checkpoint_id in sorted(checkpoints)[: -self.keep_last]:
+            del checkpoints[checkpoint_id]
+            self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            write_key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(write_key, None)
+            self._write_keys[thread_id].discard(write_key)
+
+        referenced = {
+            (thread_id, checkpoint_ns, channel, version)
+            for checkpoint_id in checkpoints
+            for channel, version in self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {}).items()
+        }
+        blob_keys = self._blob_keys[thread_id]
+        for key in [key for key in blob_keys if key[1] == checkpoint_ns and key not in referenced]:
+            self.blobs.pop(key, None)
+            blob_keys.discard(key)
+
+    def _measure(self, thread_id: str):
+        size = 0
+        for namespace in self.storage.get(thread_id, {}).values():
+            for saved_checkpoint, saved_metadata, _ in namespace.values():
+                size += len(saved_checkpoint[1]) + len(saved_metadata[1])
+        for key in self._blob_keys.get(thread_id, ()):
+            blob = self.blobs.get(key)
+            if blob is not None:
+                size += len(blob[1])
+        for key in self._write_keys.get(thread_id, ()):
+            for _, _, value, _ in self.writes.get(key, {}).values():
+                size += len(value[1])
+        self._total_bytes += size - self._thread_bytes.get(thread_id, 0)
+        self._thread_bytes[thread_id] = size
+
+    def _evict(self, keep: str):
+        if self.idle_ttl is not None:
+            cutoff = time.monotonic() - self.idle_ttl
+            for thread_id, last_access in list(self._last_access.items()):
+                if last_access > cutoff:
+                    break
+                if thread_id != keep:
+                    self.delete_thread(thread_id)
+                    self.evicted_threads += 1
+                    CHECKPOINT_EVICTIONS.labels(reason="idle").inc()
+
+        while self._total_bytes > self.max_bytes and len(self._last_access) > 1:
+            thread_id = next(iter(self._last_access))
+            if thread_id == keep:
+                break
+            self.delete_thread(thread_id)
+            self.evicted_threads += 1
+            CHECKPOINT_EVICTIONS.labels(reason="memory").inc()
+        self._report()
+
+    def _report(self):
+        CHECKPOINT_THREADS.set(len(self._last_access))
+        CHECKPOINT_BYTES.set(self._total_bytes)
+
+
+class CompressedSerializer:
+    """
+    Serializer that zlib-compresses payloads of at least `min_size` bytes.
+
+    Compressed payloads get a "+zlib" suffix on their type tag, so data
+    written before compression was enabled still loads.
+    """
+
+    SUFFIX = "+zlib"
+
+    def __init__(self, serde: Any = None, min_size: int = 1024, level: int = 6):
+        self.serde = serde or JsonPlusSerializer()
+        self.min_size = min_size
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_size:
+            return type_, data
+        return type_ + self.SUFFIX, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(self.SUFFIX):
+            return self.serde.loads_typed((type_[: -len(self.SUFFIX)], zlib.decompress(payload)))
+        return self.serde.loads_typed(data)
+
+
+class _BatchingConnection:
+    """
+    Proxy for an aiosqlite connection that coalesces commits.
+
+    AsyncSqliteSaver commits after every write. Here the first commit starts a
+    short timer and every write until it fires lands in the same transaction,
+    so a burst of checkpoint writes costs one commit. Reads on this connection
+    see uncommitted rows, so the owning worker is never behind.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, flush_interval: float, lock: asyncio.Lock):
+        self._conn = conn
+        self._flush_interval = flush_interval
+        # The saver's lock, so a batched commit never lands mid-write
+        self._lock = lock
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    async def commit(self):
+        if self._flush_interval <= 0:
+            await self._conn.commit()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self._flush_interval)
+        finally:
+            self._flush_task = None
+        async with self._lock:
+            await self._conn.commit()
+
+    async def flush(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._conn.commit()
+
+
+class SqliteCheckpointer(AsyncSqliteSaver):
+    """
+    Durable checkpointer backed by a SQLite file.
+
+    The database runs in WAL mode so several uvicorn workers can share it:
+    readers never block the writer and a follow-up message can land on any
+    worker or survive a restart. State is zlib-compressed and commits are
+    batched every `flush_interval` seconds; `aflush` forces one, e.g. at the
+    end of a run.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, *, flush_interval: float = 0.05, serde: Any = None):
+        super().__init__(conn, serde=serde or CompressedSerializer())
+        self.conn = _BatchingConnection(conn, flush_interval, self.lock)
+
+    @classmethod
+    @asynccontextmanager
+    async def from_path(cls, path: str, flush_interval: float = 0.05) -> AsyncIterator["SqliteCheckpointer"]:
+        """
+        Open (or create) the checkpoint database at `path`.
+
+        Args:
+            path: SQLite database file
+            flush_interval: Seconds writes are batched before a commit, 0 to commit every write
+        """
+        async with aiosqlite.connect(path) as conn:
+            await conn.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints and stays crash consistent
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            # Wait for another worker's write transaction instead of failing
+            await conn.execute("PRAGMA busy_timeout=5000")
+            checkpointer = cls(conn, flush_interval=flush_interval)
+            await checkpointer.setup()
+            try:
+                yield checkpointer
+            finally:
+                await checkpointer.aflush()
+
+    async def aflush(self):
+        """Commit any batched writes now."""
+        async with self.lock:
+            await self.conn.flush()
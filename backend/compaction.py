@@ -0,0 +1,121 @@
+import ast
+import json
+from typing import Callable
+
+from langchain_core.messages import AnyMessage, HumanMessage, ToolMessage
+
+# Prompt budget for the conversation history, in estimated tokens, per agent type
+HISTORY_TOKEN_BUDGETS = {
+    "fast": 8000,
+    "deep": 32000,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 16000
+
+# Marker set on tool messages that were already compacted, so they are never digested twice
+COMPACTED_KEY = "compacted"
+MAX_DIGEST_SOURCES = 10
+MAX_DIGEST_SUMMARY = 400
+
+
+def estimate_tokens(message: AnyMessage) -> int:
+    """Rough token count of a message (about four characters per token)."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, default=str)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        content += json.dumps(tool_calls, default=str)
+    return len(content) // 4 + 4
+
+
+def _parse_content(content: str):
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        try:
+            return ast.literal_eval(content)
+        except (ValueError, SyntaxError):
+            return None
+
+
+def digest_tool_message(message: ToolMessage) -> ToolMessage:
+    """
+    Replace a tool result with a short digest that keeps its sources.
+
+    Search results keep their titles and URLs; summarized extract and crawl
+    results keep their URLs and the start of the summary.
+    """
+    parsed = _parse_content(message.content) if isinstance(message.content, str) else message.content
+    sources = []
+    summary = ""
+    if isinstance(parsed, dict):
+        for item in parsed.get("results", []) or []:
+            if isinstance(item, dict) and item.get("url"):
+                sources.append(f"{item.get('title') or 'Untitled'} - {item['url']}")
+        for url in parsed.get("urls", []) or []:
+            sources.append(str(url))
+        summary = str(parsed.get("summary", ""))
+    elif isinstance(message.content, str):
+        summary = message.content
+
+    lines = [f"[Earlier {message.name or 'tool'} result, compacted]"]
+    if summary:
+        lines.append(summary[:MAX_DIGEST_SUMMARY] + ("..." if len(summary) > MAX_DIGEST_SUMMARY else ""))
+    if sources:
+        lines.append("Sources:")
+        lines.extend(f"- {source}" for source in sources[:MAX_DIGEST_SOURCES])
+
+    return ToolMessage(
+        content="\n".join(lines),
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+        additional_kwargs={**message.additional_kwargs, COMPACTED_KEY: True},
+    )
+
+
+def create_history_compactor(token_budget: int, keep_recent_turns: int = 2) -> Callable[[dict], dict]:
+    """
+    Build a `pre_model_hook` that compacts the conversation before each model call.
+
+    - The last `keep_recent_turns` turns (a user message and everything after
+      it) are kept verbatim.
+    - Older tool results are replaced in the state by digests with the same
+      message ID. Digests are marked, so each result is compacted only once.
+    - If the history is still over `token_budget`, the oldest whole turns are
+      left out of the model's input (`llm_input_messages`), which keeps every
+      tool call paired with its result. They stay in the checkpoint, and none
+      are left out when the recent turns alone are over the budget.
+
+    Args:
+        token_budget: Estimated token budget for the history
+        keep_recent_turns: Turns that are never compacted or left out
+    """
+
+    def compact_history(state: dict) -> dict:
+        messages = state["messages"]
+        turn_starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        # Always set: the model input of an earlier call would otherwise be reused
+        if len(turn_starts) <= keep_recent_turns:
+            return {"messages": [], "llm_input_messages": list(messages)}
+
+        recent_start = turn_starts[-keep_recent_turns] if keep_recent_turns else len(messages)
+        updates = []
+        compacted = list(messages)
+        for i in range(recent_start):
+            message = messages[i]
+            if isinstance(message, ToolMessage) and not message.additional_kwargs.get(COMPACTED_KEY):
+                compacted[i] = digest_tool_message(message)
+                updates.append(compacted[i])
+
+        older = sum(estimate_tokens(message) for message in compacted[:recent_start])
+        recent = sum(estimate_tokens(message) for message in compacted[recent_start:])
+        first_kept = 0
+        if recent <= token_budget:
+            for start, end in zip(turn_starts, turn_starts[1:] + [len(messages)]):
+                if older + recent <= token_budget or start >= recent_start:
+                    break
+                older -= sum(estimate_tokens(message) for message in compacted[start:end])
+                first_kept = end
+
+        return {"messages": updates, "llm_input_messages": compacted[first_kept:]}
+
+    return compact_history
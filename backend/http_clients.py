@@ -0,0 +1,84 @@
+import importlib.util
+import os
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class HttpClientRegistry:
+    """
+    Shared keep-alive connection pools for outbound calls, one per upstream host.
+
+    Created once in the app lifespan and closed at shutdown, so TCP and TLS
+    setup to OpenAI, Groq and Tavily happens once per connection instead of
+    once per request. HTTP/2 is used when the `h2` package is installed,
+    which multiplexes concurrent calls to the same host over one connection.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        http2: Optional[bool] = None,
+    ):
+        """
+        Args:
+            max_connections: Connections per host, in use or idle
+            max_keepalive_connections: Idle connections kept open per host
+            keepalive_expiry: Seconds an idle connection is kept open
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for response data
+            http2: Use HTTP/2; defaults to whether `h2` is installed
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    @classmethod
+    def from_env(cls) -> "HttpClientRegistry":
+        http2 = os.getenv("HTTP2", "auto")
+        return cls(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+            connect_timeout=_env_float("HTTP_CONNECT_TIMEOUT", 5.0),
+            read_timeout=_env_float("HTTP_READ_TIMEOUT", 60.0),
+            http2=None if http2 == "auto" else http2 == "on",
+        )
+
+    def client(self, base_url: str) -> httpx.AsyncClient:
+        """
+        Return the pooled client for the host of `base_url`, creating it on first use.
+
+        Args:
+            base_url: Any URL on the upstream host
+        """
+        parts = urlsplit(base_url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=self.http2)
+            self._clients[host] = client
+        return client
+
+    @property
+    def hosts(self) -> list[str]:
+        return list(self._clients)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
@@ -0,0 +1,141 @@
+import importlib
+import importlib.util
+import logging
+import os
+from typing import Iterable, Optional
+
+from backend.http_clients import HttpClientRegistry
+from backend.routing import ModelRouter, Route, RoutedChatModel
+
+logger = logging.getLogger(__name__)
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or "https://api.groq.com"
+
+# Model key -> (model name, provider)
+MODELS = {
+    "nano": ("gpt-4.1-nano", "openai"),
+    "kimik2": ("moonshotai/kimi-k2-instruct", "groq"),
+}
+# Package of each provider's chat model; imported only when one of its models is built
+PROVIDER_PACKAGES = {
+    "openai": "langchain_openai",
+    "groq": "langchain_groq",
+}
+
+
+def parse_fallbacks(value: str) -> dict[str, list[str]]:
+    """
+    Parse "nano=kimik2,kimik2=nano" into {"nano": ["kimik2"], "kimik2": ["nano"]}.
+
+    A model may list several alternatives, tried in order: "nano=kimik2+other".
+    """
+    fallbacks = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        name, _, alternatives = entry.partition("=")
+        fallbacks[name.strip()] = [alternative.strip() for alternative in alternatives.split("+") if alternative.strip()]
+    return fallbacks
+
+
+def model_fallbacks() -> dict[str, list[str]]:
+    """MODEL_FALLBACKS, checked against the known models."""
+    fallbacks = parse_fallbacks(os.getenv("MODEL_FALLBACKS", "nano=kimik2,kimik2=nano"))
+    unknown = (set(fallbacks) | {name for names in fallbacks.values() for name in names}) - MODELS.keys()
+    if unknown:
+        raise ValueError(f"Unknown models in MODEL_FALLBACKS: {', '.join(sorted(unknown))}")
+    return fallbacks
+
+
+def is_installed(provider: str) -> bool:
+    """Whether the provider's chat model package can be imported, without importing it."""
+    return importlib.util.find_spec(PROVIDER_PACKAGES[provider]) is not None
+
+
+def import_providers(names: Iterable[str]):
+    """
+    Import the SDKs the named models need; their alternatives are imported on first use.
+
+    For a server that preloads the app, so its workers inherit the imports
+    instead of each paying for them.
+    """
+    for provider in {MODELS[name][1] for name in names}:
+        importlib.import_module(PROVIDER_PACKAGES[provider])
+
+
+def _build_openai(http: HttpClientRegistry, model: str, max_retries: int):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=OPENAI_BASE_URL,
+        stream_usage=True,
+        max_retries=max_retries,
+        http_async_client=http.client(OPENAI_BASE_URL),
+    )
+
+
+def _build_groq(http: HttpClientRegistry, model: str, max_retries: int):
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model=model,
+        api_key=os.getenv("GROQ_API_KEY"),
+        base_url=GROQ_BASE_URL,
+        max_retries=max_retries,
+        http_async_client=http.client(GROQ_BASE_URL),
+    )
+
+
+BUILDERS = {"openai": _build_openai, "groq": _build_groq}
+
+
+def create_models(http: HttpClientRegistry, router: Optional[ModelRouter] = None, preload: Iterable[str] = ()) -> dict:
+    """
+    Build the chat models on the shared connection pools.
+
+    Each model is routed: when its provider is rate limited, failing or
+    slow to answer, calls fail over to the alternatives in MODEL_FALLBACKS.
+    Alternatives whose provider package isn't installed are left out.
+    Provider clients are created, and their SDKs imported, on a model's
+    first call unless the model is listed in `preload`.
+
+    Args:
+        http: Registry whose per-host clients the models send their requests through
+        router: Shared latency and circuit breaker state; configured from the environment if omitted
+        preload: Models to create now, so no request waits on an import; not their alternatives,
+            which only a failing or slow model's calls need
+
+    Returns:
+        dict: "nano" (fast agent and summaries) and "kimik2" (deep agent)
+    """
+    # The router fails over instead; retries inside a provider call only delay it
+    max_retries = int(os.getenv("MODEL_MAX_RETRIES", "1"))
+    routes = {
+        key: Route(
+            name=name,
+            provider=provider,
+            build=lambda provider=provider, name=name: BUILDERS[provider](http, name, max_retries),
+        )
+        for key, (name, provider) in MODELS.items()
+    }
+    for key in preload:
+        routes[key].load()
+
+    fallbacks = {}
+    for key, alternatives in model_fallbacks().items():
+        fallbacks[key] = [alternative for alternative in alternatives if is_installed(MODELS[alternative][1])]
+        for alternative in set(alternatives) - set(fallbacks[key]):
+            logger.warning(
+                "Not failing %s over to %s: %s is not installed", key, alternative, PROVIDER_PACKAGES[MODELS[alternative][1]]
+            )
+    router = router or ModelRouter.from_env()
+    return {
+        key: RoutedChatModel(
+            routes=[route] + [routes[alternative] for alternative in fallbacks.get(key, [])],
+            router=router,
+        ).with_config({"tags": ["streaming"]})
+        for key, route in routes.items()
+    }
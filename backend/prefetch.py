@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+from backend.cache import normalize_url
+from backend.telemetry import PREFETCH_CREDITS, PREFETCH_HITS, PREFETCH_SKIPPED, PREFETCH_URLS
+from backend.utils import hash_api_key
+
+logger = logging.getLogger(__name__)
+
+# Tavily charges per 5 extracted URLs, twice as much for advanced depth
+URLS_PER_EXTRACT_CREDIT = 5
+
+
+def estimate_credits(tool_name: str, depth: Optional[str], args: dict) -> int:
+    """
+    Approximate Tavily API credits of one call.
+
+    Args:
+        tool_name: Name of the tool
+        depth: The search or extract depth the call runs with
+        args: Keyword arguments of the tool call
+    """
+    multiplier = 2 if depth == "advanced" else 1
+    if tool_name == "tavily_extract":
+        urls = args.get("urls") or []
+        count = 1 if isinstance(urls, str) else len(urls)
+        return multiplier * max(1, math.ceil(count / URLS_PER_EXTRACT_CREDIT))
+    if tool_name == "tavily_crawl":
+        pages = args.get("limit") or 10
+        return multiplier * max(1, math.ceil(pages / URLS_PER_EXTRACT_CREDIT))
+    return multiplier
+
+
+def api_key_of(config: RunnableConfig) -> str:
+    """Hash of the Tavily API key a run's tool calls are charged to."""
+    return hash_api_key((config or {}).get("configurable", {}).get("api_key"))
+
+
+def _as_list(urls) -> list[str]:
+    return [urls] if isinstance(urls, str) else list(urls or [])
+
+
+class Prefetcher:
+    """
+    Extracts the top search results in the background to warm the caches.
+
+    After a search, the `top_k` highest scoring URLs are extracted and
+    summarized as the extract tool would, so a later extract of those URLs
+    is served from the per-URL result cache and the page summary cache.
+
+    Prefetches run on the requesting user's API key, so their budget is per
+    key: prefetching is skipped when it would push its share of the Tavily
+    credits that key spent in the last `window` seconds above `credit_share`.
+    The hit rate (prefetched URLs the agent later extracted) is counted to
+    tune k.
+    """
+
+    def __init__(
+        self,
+        top_k: int = 3,
+        credit_share: float = 0.25,
+        window: float = 3600.0,
+        max_tasks: int = 16,
+        max_tracked_urls: int = 4096,
+    ):
+        """
+        Args:
+            top_k: Search results extracted per search
+            credit_share: Largest share of a key's recent credits prefetching may use
+            window: Seconds of credit history the share is measured over
+            max_tasks: Prefetches running at once; further ones are skipped
+            max_tracked_urls: Prefetched URLs remembered for hit counting
+        """
+        self.top_k = top_k
+        self.credit_share = credit_share
+        self.window = window
+        self.max_tasks = max_tasks
+        self.max_tracked_urls = max_tracked_urls
+        # API key hash -> (time, credits, prefetch) of its recent calls, least recently spending key first
+        self._spend: "OrderedDict[str, deque]" = OrderedDict()
+        self._tasks: set[asyncio.Task] = set()
+        # normalized URL -> time it was prefetched
+        self._prefetched: "OrderedDict[str, float]" = OrderedDict()
+        # normalized URL -> prefetch still extracting it
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.prefetched_urls = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["Prefetcher"]:
+        if os.getenv("PREFETCH", "off") != "on":
+            return None
+        return cls(
+            top_k=int(os.getenv("PREFETCH_TOP_K", "3")),
+            credit_share=float(os.getenv("PREFETCH_CREDIT_SHARE", "0.25")),
+        )
+
+    @property
+    def stats(self) -> dict:
+        foreground, prefetch = 0, 0
+        for key in list(self._spend):
+            key_foreground, key_prefetch = self._credits(key)
+            foreground, prefetch = foreground + key_foreground, prefetch + key_prefetch
+        return {
+            "prefetched_urls": self.prefetched_urls,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.prefetched_urls, 3) if self.prefetched_urls else None,
+            "credits": {"foreground": foreground, "prefetch": prefetch},
+            "keys": len(self._spend),
+            "running": len(self._tasks),
+        }
+
+    def record_credits(self, credits: int, key: str, prefetch: bool = False):
+        """
+        Args:
+            credits: Estimated credits of a call
+            key: Hash of the API key it was charged to, see `api_key_of`
+            prefetch: Whether it was a prefetch
+        """
+        now = time.monotonic()
+        self._spend.setdefault(key, deque()).append((now, credits, prefetch))
+        self._spend.move_to_end(key)
+        # Forget keys that spent nothing within the window
+        cutoff = now - self.window
+        while self._spend:
+            oldest = next(iter(self._spend))
+            if self._spend[oldest][-1][0] >= cutoff:
+                break
+            del self._spend[oldest]
+        PREFETCH_CREDITS.labels(kind="prefetch" if prefetch else "foreground").inc(credits)
+
+    def record_extract(self, urls):
+        """Count prefetched URLs the agent went on to extract."""
+        for url in _as_list(urls):
+            if self._prefetched.pop(normalize_url(url), None) is not None:
+                self.hits += 1
+                PREFETCH_HITS.inc()
+
+    async def wait_for(self, urls):
+        """Wait for running prefetches of any of `urls`, so their results are reused instead of fetched twice."""
+        tasks = {self._inflight.get(normalize_url(url)) for url in _as_list(urls)}
+        tasks.discard(None)
+        if tasks:
+            await asyncio.wait([asyncio.shield(task) for task in tasks])
+
+    def schedule(
+        self,
+        search_result: dict,
+        config: RunnableConfig,
+        extract: Callable[[list[str], RunnableConfig], Awaitable],
+        depth: Optional[str] = None,
+    ):
+        """
+        Start prefetching the top results of a search, if the budget allows.
+
+        Args:
+            search_result: Raw Tavily search result
+            config: The run config, for the API key and user message
+            extract: Coroutine function extracting and summarizing URLs
+            depth: Extract depth, for the credit estimate
+        """
+        results = search_result.get("results") if isinstance(search_result, dict) else None
+        if not results:
+            return
+        ranked = sorted(
+            (item for item in results if isinstance(item, dict) and item.get("url")),
+            key=lambda item: item.get("score") or 0,
+            reverse=True,
+        )
+        urls = [item["url"] for item in ranked if normalize_url(item["url"]) not in self._prefetched][: self.top_k]
+        if not urls:
+            return
+        if len(self._tasks) >= self.max_tasks:
+            PREFETCH_SKIPPED.labels(reason="busy").inc()
+            return
+        cost = estimate_credits("tavily_extract", depth, {"urls": urls})
+        key = api_key_of(config)
+        if not self._within_budget(key, cost):
+            PREFETCH_SKIPPED.labels(reason="budget").inc()
+            return
+
+        self.record_credits(cost, key, prefetch=True)
+        now = time.monotonic()
+        for url in urls:
+            self._prefetched[normalize_url(url)] = now
+        while len(self._prefetched) > self.max_tracked_urls:
+            self._prefetched.popitem(last=False)
+        self.prefetched_urls += len(urls)
+        PREFETCH_URLS.inc(len(urls))
+
+        # Prefetches outlive the request, so they get a config without its callbacks
+        prefetch_config = {"configurable": {**config.get("configurable", {}), "prefetch": True}}
+        task = asyncio.get_running_loop().create_task(self._run(extract, urls, prefetch_config))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        for url in urls:
+            self._inflight[normalize_url(url)] = task
+        task.add_done_callback(lambda _: self._forget_inflight(urls, task))
+
+    async def _run(self, extract, urls: list[str], config: RunnableConfig):
+        try:
+            await extract(urls, config)
+        except Exception as e:
+            logger.warning("Prefetch of %d URLs failed: %s", len(urls), e)
+
+    def _forget_inflight(self, urls: list[str], task: asyncio.Task):
+        for url in urls:
+            if self._inflight.get(normalize_url(url)) is task:
+                del self._inflight[normalize_url(url)]
+
+    def _credits(self, key: str) -> tuple[int, int]:
+        spend = self._spend.get(key)
+        if spend is None:
+            return 0, 0
+        cutoff = time.monotonic() - self.window
+        while spend and spend[0][0] < cutoff:
+            spend.popleft()
+        if not spend:
+            del self._spend[key]
+            return 0, 0
+        foreground = sum(credits for _, credits, prefetch in spend if not prefetch)
+        prefetch = sum(credits for _, credits, prefetch in spend if prefetch)
+        return foreground, prefetch
+
+    def _within_budget(self, key: str, cost: int) -> bool:
+        foreground, prefetch = self._credits(key)
+        return prefetch + cost <= self.credit_share * (foreground + prefetch + cost)
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
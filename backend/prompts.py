@@ -1,8 +1,10 @@
 import datetime
+from typing import Callable, Optional
 
-today = datetime.datetime.today().strftime("%A, %B %d, %Y")
+from langchain_core.messages import BaseMessage, SystemMessage
 
-SIMPLE_PROMPT = f"""    
+# Templates with a {today} placeholder, filled in by `render_prompt` on every model call
+SIMPLE_PROMPT = """    
         You are a friendly conversational AI assistant created by the company Tavily. 
         Your mission is to answer the user's question in a friendly, concise, accurate, and up-to-date manner - grounding your findings in credible web data.
         
@@ -53,7 +55,7 @@ SIMPLE_PROMPT = f"""
         You will now receive a message from the user:
 
         """
-REASONING_PROMPT = f"""    
+REASONING_PROMPT = """    
         You are a friendly conversational research assistant created by the company Tavily. 
         Your mission is to conduct comprehensive, thorough, accurate, and up-to-date research, grounding your findings in credible web data.
         
@@ -112,3 +114,23 @@ REASONING_PROMPT = f"""
         You will now receive a message from the user:
 
         """
+
+
+def render_prompt(template: str, now: Optional[datetime.datetime] = None) -> str:
+    """Fill in a prompt template with the date of `now` (default: today)."""
+    now = now or datetime.datetime.now()
+    return template.format(today=now.strftime("%A, %B %d, %Y"))
+
+
+def dated_prompt(template: str) -> Callable[[dict], list[BaseMessage]]:
+    """
+    A `create_react_agent` prompt that renders `template` when the model is called.
+
+    Graphs are built once per worker and live for days, so the date can't be
+    rendered when the graph is built.
+    """
+
+    def prompt(state: dict) -> list[BaseMessage]:
+        return [SystemMessage(content=render_prompt(template))] + state["messages"]
+
+    return prompt
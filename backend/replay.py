@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from starlette.types import Receive
+
+from backend.telemetry import CLIENT_DISCONNECTS
+from backend.utils import hash_api_key
+
+logger = logging.getLogger(__name__)
+
+
+class FramesEvicted(Exception):
+    """Raised when frames a client asked for have already left the ring buffer."""
+
+
+async def wait_for_disconnect(receive: Receive):
+    """Return once the client has closed the connection."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def error_frame(code: str, content: str) -> str:
+    """The frame that ends a stream which couldn't deliver a complete answer."""
+    return json.dumps({"type": "error", "code": code, "content": content}) + "\n"
+
+
+class RunBuffer:
+    """
+    The NDJSON frames of one agent run, numbered from 1.
+
+    Keeps the last `max_bytes` of frames, so a client that reconnects can
+    resume after the last sequence number it saw. Frames an attached
+    follower hasn't read yet are never dropped: the run waits in `append`
+    until the slowest follower has caught up.
+    """
+
+    def __init__(self, thread_id: str, run_id: str, key_hash: str, max_bytes: int, agent_type: str = "unknown"):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.agent_type = agent_type
+        self.key_hash = key_hash
+        self.max_bytes = max_bytes
+        self.last_seq = 0
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self._frames: deque[tuple[int, str, int]] = deque()
+        self._size = 0
+        # Follower token -> last sequence number it read
+        self._cursors: dict[int, int] = {}
+        self._next_token = 0
+        self._wakeup = asyncio.Event()
+        self._progress = asyncio.Event()
+
+    @property
+    def first_seq(self) -> int:
+        return self._frames[0][0] if self._frames else self.last_seq + 1
+
+    @property
+    def followers(self) -> int:
+        return len(self._cursors)
+
+    def attach(self, after_seq: int = 0) -> int:
+        """Register a follower reading after `after_seq`; returns its token for `follow` and `detach`."""
+        self._next_token += 1
+        self._cursors[self._next_token] = after_seq
+        return self._next_token
+
+    def detach(self, token: int):
+        if self._cursors.pop(token, None) is not None:
+            self._signal_progress()
+
+    async def append(self, frame: str):
+        """Buffer a frame, waiting while the buffer is full of frames a follower hasn't read."""
+        size = len(frame.encode("utf-8"))
+        while True:
+            self._evict(size)
+            if not self._frames or self._size + size <= self.max_bytes:
+                break
+            progress = self._progress
+            await progress.wait()
+        self.last_seq += 1
+        self._frames.append((self.last_seq, frame, size))
+        self._size += size
+        self.wake()
+
+    def _evict(self, incoming: int):
+        """Drop the oldest frames every follower has read until `incoming` bytes fit."""
+        read = min(self._cursors.values(), default=self.last_seq)
+        while self._frames and self._size + incoming > self.max_bytes and self._frames[0][0] <= read:
+            _, _, size = self._frames.popleft()
+            self._size -= size
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self.wake()
+
+    def wake(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def _signal_progress(self):
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def check_available(self, after_seq: int):
+        """
+        Raises:
+            FramesEvicted: If frames after `after_seq` were already dropped
+        """
+        if after_seq < self.first_seq - 1:
+            raise FramesEvicted(
+                f"Frames {after_seq + 1} to {self.first_seq - 1} of run {self.run_id} are no longer buffered"
+            )
+
+    async def follow(self, token: int, stop: Optional[asyncio.Event] = None) -> AsyncIterator[str]:
+        """
+        Yield the frames after the follower's cursor, each with its "seq" number, until the run ends or `stop` is set.
+
+        Raises:
+            FramesEvicted: If frames the follower asked for were dropped before it attached
+        """
+        cursor = self._cursors[token]
+        while True:
+            wakeup = self._wakeup
+            self.check_available(cursor)
+            pending = [(seq, frame) for seq, frame, _ in self._frames if seq > cursor]
+            for seq, frame in pending:
+                # Frames are JSON objects; put the sequence number first
+                yield f'{{"seq": {seq}, {frame[1:]}'
+                cursor = self._cursors[token] = seq
+                self._signal_progress()
+            if stop is not None and stop.is_set():
+                return
+            if self.done and cursor >= self.last_seq:
+                return
+            if not pending:
+                await wakeup.wait()
+
+
+class RunRegistry:
+    """
+    Agent runs executing in the background, with the frames they streamed.
+
+    A run is started detached from the request, so it survives a dropped
+    connection; the request's own client is attached from the start, so
+    the run never gets further ahead of it than its buffer holds. When its
+    last client disconnects, the run keeps going for `disconnect_grace`
+    seconds for a client to resume, then it is cancelled. Buffers of
+    finished runs are evicted `ttl` seconds after the run ended.
+
+    Buffers live in the worker's memory, so a client resumes on the worker
+    that ran the request (sticky sessions behind a load balancer).
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024, ttl: float = 300.0, disconnect_grace: float = 30.0):
+        """
+        Args:
+            max_bytes: Bytes of frames kept per run; a client that reconnects further behind can't resume
+            ttl: Seconds a finished run stays resumable
+            disconnect_grace: Seconds a run without clients keeps running before it is cancelled
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disconnect_grace = disconnect_grace
+        self._buffers: dict[tuple[str, str], RunBuffer] = {}
+        self._tasks: dict[tuple[str, str], asyncio.Task] = {}
+        self._cancel_timers: dict[tuple[str, str], asyncio.TimerHandle] = {}
+        # Follower attached by `start` for the request's client until its response streams,
+        # with the timer releasing it if that never happens
+        self._reserved: dict[tuple[str, str], tuple[int, asyncio.TimerHandle]] = {}
+
+    @classmethod
+    def from_env(cls) -> "RunRegistry":
+        return cls(
+            max_bytes=int(float(os.getenv("RESUME_BUFFER_MB", "4")) * 1024 * 1024),
+            ttl=float(os.getenv("RESUME_TTL", "300")),
+            disconnect_grace=float(os.getenv("RESUME_GRACE", "30")),
+        )
+
+    def start(
+        self,
+        thread_id: str,
+        api_key: str,
+        frames: AsyncIterator[str],
+        on_cancel: Optional[Callable[[], Awaitable]] = None,
+        on_finish: Optional[Callable[[], None]] = None,
+        agent_type: str = "unknown",
+    ) -> RunBuffer:
+        """
+        Run `frames` to completion in a background task, buffering every frame.
+
+        Args:
+            thread_id: Conversation thread of the run
+            api_key: The caller's API key; resuming requires the same key
+            frames: The run's response frames
+            on_cancel: Coroutine function run after the run was cancelled, e.g. to repair its checkpoint
+            on_finish: Called once the run ended, even if it was cancelled before it started,
+                e.g. to release its admission slot
+            agent_type: Label for the disconnect counter
+        """
+        self._evict_expired()
+        buffer = RunBuffer(thread_id, uuid.uuid4().hex, hash_api_key(api_key), self.max_bytes, agent_type)
+        key = (thread_id, buffer.run_id)
+        self._buffers[key] = buffer
+        # Released if the response never starts streaming, e.g. the client left first
+        self._reserved[key] = (
+            buffer.attach(),
+            asyncio.get_running_loop().call_later(max(self.disconnect_grace, 1.0), self._release_reserved, key),
+        )
+
+        async def run():
+            try:
+                async for frame in frames:
+                    await buffer.append(frame)
+            except asyncio.CancelledError:
+                if on_cancel is not None:
+                    try:
+                        await on_cancel()
+                    except Exception as e:
+                        logger.warning("Cleanup after a cancelled run failed: %s", e)
+                raise
+            except Exception as e:
+                logger.exception("Agent run %s of thread %s failed", buffer.run_id, thread_id)
+                # Ends the stream so clients can tell it from a finished answer
+                await buffer.append(error_frame("run_failed", f"The agent run failed: {type(e).__name__}"))
+
+        def finished(_: asyncio.Task):
+            # A done callback, so it also runs for a task cancelled before its first step
+            buffer.finish()
+            self._tasks.pop(key, None)
+            timer = self._cancel_timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            if on_finish is not None:
+                on_finish()
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(finished)
+        self._tasks[key] = task
+        return buffer
+
+    async def cancel_abandoned(self, thread_id: str):
+        """
+        Cancel the thread's runs that no client is streaming, and wait for their cleanup.
+
+        Called before a new run starts on the thread, so a run left in its
+        disconnect grace period can't write to the checkpoint concurrently.
+        """
+        keys = [
+            key for key in self._tasks if key[0] == thread_id and self._buffers[key].followers == 0
+        ]
+        tasks = [self._tasks[key] for key in keys]
+        for key in keys:
+            timer = self._cancel_timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get(self, thread_id: str, run_id: str, api_key: str) -> Optional[RunBuffer]:
+        """The buffer of a run started with the same API key, or None."""
+        self._evict_expired()
+        buffer = self._buffers.get((thread_id, run_id))
+        if buffer is None or buffer.key_hash != hash_api_key(api_key):
+            return None
+        return buffer
+
+    async def stream(self, buffer: RunBuffer, receive: Receive, after_seq: int = 0) -> AsyncIterator[str]:
+        """
+        Stream a run's frames after `after_seq` to one client until the run ends or the client goes away.
+
+        Args:
+            buffer: The run's buffer from `start` or `get`
+            receive: The client request's ASGI receive channel
+            after_seq: Last sequence number the client already has
+        """
+        key = (buffer.thread_id, buffer.run_id)
+        timer = self._cancel_timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        reserved = self._reserved.pop(key, None) if after_seq == 0 else None
+        if reserved is not None:
+            token, release_timer = reserved
+            release_timer.cancel()
+        else:
+            token = buffer.attach(after_seq)
+
+        disconnected = asyncio.Event()
+
+        async def watch():
+            await wait_for_disconnect(receive)
+            disconnected.set()
+            buffer.wake()
+
+        watcher = asyncio.create_task(watch())
+        try:
+            async for frame in buffer.follow(token, stop=disconnected):
+                yield frame
+        except FramesEvicted as e:
+            # Continuing would skip frames; say so rather than end the stream as if complete
+            logger.warning("%s", e)
+            yield error_frame("frames_evicted", str(e))
+        finally:
+            watcher.cancel()
+            buffer.detach(token)
+            if not buffer.done:
+                # Noticed by the watcher, or by a failed send closing this stream
+                CLIENT_DISCONNECTS.labels(agent_type=buffer.agent_type).inc()
+                if buffer.followers == 0:
+                    self._schedule_cancel(key)
+
+    def _release_reserved(self, key: tuple[str, str]):
+        reserved = self._reserved.pop(key, None)
+        buffer = self._buffers.get(key)
+        if reserved is None or buffer is None:
+            return
+        buffer.detach(reserved[0])
+        if not buffer.done and buffer.followers == 0:
+            self._schedule_cancel(key)
+
+    def _schedule_cancel(self, key: tuple[str, str]):
+        task = self._tasks.get(key)
+        if task is None:
+            return
+        if self.disconnect_grace <= 0:
+            task.cancel()
+            return
+        self._cancel_timers[key] = asyncio.get_running_loop().call_later(self.disconnect_grace, task.cancel)
+
+    def _evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [
+            key
+            for key, buffer in self._buffers.items()
+            if buffer.done and buffer.finished_at < cutoff and buffer.followers == 0
+        ]
+        for key in expired:
+            del self._buffers[key]
+
+    async def aclose(self):
+        for timer in self._cancel_timers.values():
+            timer.cancel()
+        for _, timer in self._reserved.values():
+            timer.cancel()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,497 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from backend.telemetry import MODEL_CALLS, MODEL_CIRCUIT_OPEN, MODEL_FAILOVERS, MODEL_FIRST_TOKEN_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Client errors that another provider may not return, unlike a malformed request
+RETRYABLE_STATUSES = frozenset([408, 409, 429])
+# Recent calls of a model needed before its latency and error rate are trusted
+MIN_SAMPLES = 10
+# Hedge once a call is this many times slower than the model's recent p90 first token
+HEDGE_P90_FACTOR = 3.0
+# Never hedge sooner than this, however fast the model usually is
+MIN_HEDGE_DELAY = 1.0
+# Recent error rate at which a model is tried after its alternatives
+DEGRADED_ERROR_RATE = 0.5
+
+
+def failure_kind(error: BaseException) -> Optional[str]:
+    """
+    Classify a failed model call.
+
+    Returns:
+        Optional[str]: "rate_limited" or "error" when an alternative model may
+        succeed, None when the request itself was rejected (e.g. 400)
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if isinstance(status, int) and 400 <= status < 500 and status not in RETRYABLE_STATUSES:
+        return None
+    return "error"
+
+
+class Route:
+    """
+    A candidate model of a `RoutedChatModel`.
+
+    The model is built on first use, so a provider SDK is only imported by
+    deployments that call it.
+    """
+
+    def __init__(self, name: str, provider: str, build: Callable[[], BaseChatModel]):
+        """
+        Args:
+            name: Model name, as reported in metrics
+            provider: Provider whose circuit breaker the model shares
+            build: Creates the model
+        """
+        self.name = name
+        self.provider = provider
+        self._build = build
+        self._model: Optional[BaseChatModel] = None
+
+    @property
+    def model(self) -> BaseChatModel:
+        return self.load()
+
+    def load(self) -> BaseChatModel:
+        """Build the model now if it wasn't yet."""
+        if self._model is None:
+            self._model = self._build()
+        return self._model
+
+
+class RollingStats:
+    """First-token latency and outcome of a model's calls in the last `max_age` seconds."""
+
+    def __init__(self, window: int = 100, max_age: float = 60.0):
+        self.max_age = max_age
+        # (time, first token seconds or None, succeeded)
+        self._calls: deque[tuple[float, Optional[float], bool]] = deque(maxlen=window)
+
+    def record(self, ok: bool, first_token: Optional[float] = None):
+        self._calls.append((time.monotonic(), first_token, ok))
+
+    def _recent(self) -> list[tuple[float, Optional[float], bool]]:
+        cutoff = time.monotonic() - self.max_age
+        return [call for call in self._calls if call[0] >= cutoff]
+
+    def error_rate(self) -> Optional[float]:
+        calls = self._recent()
+        if len(calls) < MIN_SAMPLES:
+            return None
+        return sum(1 for _, _, ok in calls if not ok) / len(calls)
+
+    def first_token_percentile(self, q: float) -> Optional[float]:
+        latencies = sorted(first_token for _, first_token, _ in self._recent() if first_token is not None)
+        if len(latencies) < MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a provider after `failure_threshold` failures in a row.
+
+    After `cooldown` seconds one probe call is let through (half open); its
+    success closes the circuit, its failure opens it for another cooldown.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def ready(self) -> bool:
+        """Whether a call may be sent now, without claiming the half-open probe."""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.probing
+
+    def start(self) -> bool:
+        """Claim permission for one call; False if the circuit is open or already probing."""
+        if not self.ready():
+            return False
+        if self.state != "closed":
+            self.state = "half_open"
+            self.probing = True
+        return True
+
+    def record(self, ok: bool):
+        self.probing = False
+        if ok:
+            if self.state != "closed":
+                logger.info("Circuit for %s closed", self.provider)
+                MODEL_CIRCUIT_OPEN.labels(provider=self.provider).set(0)
+            self.state = "closed"
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state == "closed":
+                logger.warning("Circuit for %s opened after %d failures", self.provider, self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            MODEL_CIRCUIT_OPEN.labels(provider=self.provider).set(1)
+
+    def release(self):
+        """Give back a claimed call that ended without a verdict, e.g. a cancelled hedge."""
+        self.probing = False
+
+
+class _Attempt:
+    """One model call of a routed request, pumping its chunks into the shared event queue."""
+
+    def __init__(self, route: Route, stream: AsyncIterator, events: asyncio.Queue):
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.finished = False
+        self.task = asyncio.create_task(self._pump(stream, events))
+
+    async def _pump(self, stream: AsyncIterator, events: asyncio.Queue):
+        try:
+            async for chunk in stream:
+                if self.first_token is None:
+                    self.first_token = time.perf_counter() - self.started_at
+                await events.put((self, "chunk", chunk))
+        except Exception as e:
+            await events.put((self, "error", e))
+            return
+        await events.put((self, "done", None))
+
+
+class ModelRouter:
+    """
+    Chooses the model that serves each call from a route's candidates.
+
+    Keeps rolling first-token latency and error rates per model and a
+    circuit breaker per provider, shared by every routed model of a worker.
+    Candidates are tried in their configured order, except that a model
+    that is slow or failing lately goes after its alternatives and a
+    provider with an open circuit goes last. A demoted model leads again
+    once its bad calls are older than `stats_window`.
+
+    A call that fails with a rate limit or a provider error before its
+    first token, or whose model can't be built, fails over to the next
+    candidate. A call with no first token by its deadline is hedged: the
+    next candidate starts too and the first to answer wins ("hedge"), or
+    the slow call is abandoned ("failover"). Hedges only go to candidates
+    of the slow call's provider unless `hedge_across_providers`, as a slow
+    call would otherwise be paid for twice. Once a call streamed its first
+    token it is not retried.
+    """
+
+    def __init__(
+        self,
+        first_token_deadline: float = 8.0,
+        deadline_action: str = "hedge",
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        stats_window: float = 60.0,
+        hedge_across_providers: bool = False,
+    ):
+        """
+        Args:
+            first_token_deadline: Seconds to wait for a first token before trying the next candidate
+            deadline_action: "hedge" keeps the slow call running, "failover" cancels it
+            failure_threshold: Failures in a row that open a provider's circuit
+            cooldown: Seconds an open circuit waits before a probe call
+            stats_window: Seconds of calls the latency and error rates are computed over
+            hedge_across_providers: Whether a hedge may call another provider's model
+        """
+        if deadline_action not in ("hedge", "failover"):
+            raise ValueError(f"Unknown deadline action: {deadline_action}")
+        self.first_token_deadline = first_token_deadline
+        self.deadline_action = deadline_action
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.stats_window = stats_window
+        self.hedge_across_providers = hedge_across_providers
+        self.stats: dict[str, RollingStats] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        return cls(
+            first_token_deadline=float(os.getenv("MODEL_FIRST_TOKEN_DEADLINE", "8")),
+            deadline_action=os.getenv("MODEL_DEADLINE_ACTION", "hedge"),
+            failure_threshold=int(os.getenv("MODEL_BREAKER_FAILURES", "5")),
+            cooldown=float(os.getenv("MODEL_BREAKER_COOLDOWN", "30")),
+            stats_window=float(os.getenv("MODEL_STATS_WINDOW", "60")),
+            hedge_across_providers=os.getenv("MODEL_HEDGE_ACROSS_PROVIDERS", "off") == "on",
+        )
+
+    def _stats(self, route: Route) -> RollingStats:
+        if route.name not in self.stats:
+            self.stats[route.name] = RollingStats(max_age=self.stats_window)
+        return self.stats[route.name]
+
+    def _breaker(self, route: Route) -> CircuitBreaker:
+        if route.provider not in self.breakers:
+            self.breakers[route.provider] = CircuitBreaker(route.provider, self.failure_threshold, self.cooldown)
+        return self.breakers[route.provider]
+
+    def degraded(self, route: Route) -> bool:
+        """Whether the model was mostly failing, or too slow for its deadline, lately."""
+        stats = self._stats(route)
+        error_rate = stats.error_rate()
+        median = stats.first_token_percentile(0.5)
+        return (error_rate is not None and error_rate >= DEGRADED_ERROR_RATE) or (
+            median is not None and median > self.first_token_deadline
+        )
+
+    def hedge_delay(self, route: Route) -> float:
+        """Seconds to wait for the model's first token before trying the next candidate."""
+        p90 = self._stats(route).first_token_percentile(0.9)
+        if p90 is None:
+            return self.first_token_deadline
+        return min(self.first_token_deadline, max(MIN_HEDGE_DELAY, HEDGE_P90_FACTOR * p90))
+
+    def plan(self, routes: Sequence[Route]) -> list[Route]:
+        """The routes in the order to try them."""
+        ready = [route for route in routes if self._breaker(route).ready()]
+        healthy = [route for route in ready if not self.degraded(route)]
+        degraded = [route for route in ready if route not in healthy]
+        blocked = [route for route in routes if route not in ready]
+        return healthy + degraded + blocked
+
+    def _finish(self, attempt: _Attempt, outcome: str, timed: bool = True):
+        route = attempt.route
+        attempt.finished = True
+        MODEL_CALLS.labels(model=route.name, outcome=outcome).inc()
+        if outcome in ("ok", "error", "rate_limited"):
+            ok = outcome == "ok"
+            self._stats(route).record(ok, attempt.first_token if ok and timed else None)
+            self._breaker(route).record(ok)
+        else:
+            if outcome in ("hedge_lost", "deadline"):
+                # Slower than this at least; keeps a model that stopped answering out of the lead
+                self._stats(route).record(True, time.perf_counter() - attempt.started_at)
+            self._breaker(route).release()
+
+    async def astream(
+        self, routes: Sequence[Route], stream: Callable[[Route], AsyncIterator], streaming: bool = True
+    ) -> AsyncIterator[Any]:
+        """
+        Stream one call's chunks from the first candidate to answer.
+
+        Args:
+            routes: Candidate models in order of preference
+            stream: Starts the call on a route and returns its chunk iterator
+            streaming: False when `stream` yields one complete answer; such calls
+                only fail over, as there is no first token to time or hedge on
+
+        Raises:
+            Exception: The last candidate's error when every candidate failed
+        """
+        plan = self.plan(routes)
+        if plan[0] is not routes[0]:
+            reason = "circuit_open" if not self._breaker(routes[0]).ready() else "degraded"
+            MODEL_FAILOVERS.labels(reason=reason).inc()
+        events: asyncio.Queue = asyncio.Queue()
+        running: list[_Attempt] = []
+        last_error: Optional[BaseException] = None
+
+        def deadline_providers() -> Optional[set[str]]:
+            """Providers a call past its deadline may go to; None for any."""
+            if self.deadline_action == "hedge" and not self.hedge_across_providers:
+                return {attempt.route.provider for attempt in running}
+            return None
+
+        def start_next(reason: Optional[str], providers: Optional[set[str]] = None) -> bool:
+            nonlocal last_error
+            for route in list(plan):
+                if providers is not None and route.provider not in providers:
+                    continue
+                plan.remove(route)
+                if not self._breaker(route).start():
+                    continue
+                if reason is not None:
+                    MODEL_FAILOVERS.labels(reason=reason).inc()
+                    logger.info("Trying %s after %s", route.name, reason)
+                try:
+                    attempt = _Attempt(route, stream(route), events)
+                except Exception as e:
+                    # The model couldn't be built or called, e.g. its SDK isn't installed
+                    last_error = e
+                    MODEL_CALLS.labels(model=route.name, outcome="error").inc()
+                    self._stats(route).record(False)
+                    self._breaker(route).record(False)
+                    logger.warning("Model %s failed to start: %s", route.name, e)
+                    reason = "error"
+                    continue
+                running.append(attempt)
+                return True
+            return False
+
+        def hedge_deadline() -> Optional[float]:
+            """When to try another candidate if no running call has a first token by then."""
+            providers = deadline_providers()
+            candidates = [route for route in plan if providers is None or route.provider in providers]
+            if not streaming or not running or not candidates:
+                return None
+            return time.perf_counter() + self.hedge_delay(running[-1].route)
+
+        winner: Optional[_Attempt] = None
+        try:
+            start_next(None)
+            hedge_at = hedge_deadline()
+            while winner is None:
+                if not running:
+                    raise last_error or RuntimeError("No model available for this request")
+                timeout = max(0.0, hedge_at - time.perf_counter()) if hedge_at is not None else None
+                try:
+                    attempt, kind, value = await asyncio.wait_for(events.get(), timeout)
+                except asyncio.TimeoutError:
+                    providers = deadline_providers()
+                    if self.deadline_action == "failover":
+                        for attempt in running:
+                            attempt.task.cancel()
+                            self._finish(attempt, "deadline")
+                        running.clear()
+                    start_next("deadline", providers)
+                    hedge_at = hedge_deadline()
+                    continue
+                if attempt not in running:
+                    continue
+                if kind == "error":
+                    running.remove(attempt)
+                    last_error = value
+                    failure = failure_kind(value)
+                    if failure is None:
+                        self._finish(attempt, "rejected")
+                        raise value
+                    self._finish(attempt, failure)
+                    logger.warning("Model %s failed (%s): %s", attempt.route.name, failure, value)
+                    if not running and start_next(failure):
+                        hedge_at = hedge_deadline()
+                    continue
+                winner = attempt
+                running.remove(attempt)
+                for loser in running:
+                    loser.task.cancel()
+                    self._finish(loser, "hedge_lost")
+                running.clear()
+                if streaming:
+                    MODEL_FIRST_TOKEN_SECONDS.labels(model=winner.route.name).observe(winner.first_token or 0.0)
+                if kind == "done":
+                    self._finish(winner, "ok", timed=streaming)
+                    return
+                yield value
+
+            while True:
+                attempt, kind, value = await events.get()
+                if attempt is not winner:
+                    continue
+                if kind == "chunk":
+                    yield value
+                elif kind == "done":
+                    self._finish(winner, "ok", timed=streaming)
+                    return
+                else:
+                    # Part of the answer was already streamed, so another model can't take over
+                    self._finish(winner, failure_kind(value) or "rejected")
+                    raise value
+        finally:
+            # The caller went away, or every candidate failed
+            for attempt in (running + [winner]) if winner is not None else running:
+                if not attempt.finished:
+                    attempt.task.cancel()
+                    self._finish(attempt, "cancelled")
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that serves each call from one of several models via a `ModelRouter`.
+
+    The candidates are called without callbacks, so a run's events and
+    token usage come from this model only, whichever candidate answered
+    and however many were hedged.
+    """
+
+    routes: list[Route]
+    router: ModelRouter
+    model_name: str = ""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if not self.model_name:
+            self.model_name = self.routes[0].name
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        # Every candidate speaks the OpenAI tool format
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        def stream(route: Route) -> AsyncIterator:
+            return route.model.astream(messages, config={"callbacks": []}, stop=stop, **kwargs)
+
+        async for chunk in self.router.astream(self.routes, stream):
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Called when nothing consumes tokens: one complete, non-streamed response per candidate
+        async def invoke(route: Route) -> AsyncIterator:
+            yield await route.model.ainvoke(messages, config={"callbacks": []}, stop=stop, **kwargs)
+
+        answers = [message async for message in self.router.astream(self.routes, invoke, streaming=False)]
+        return ChatResult(generations=[ChatGeneration(message=answers[0])])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Synchronous calls only fail over; hedging needs the event loop
+        last_error: Optional[BaseException] = None
+        for route in self.router.plan(self.routes):
+            try:
+                message = route.model.invoke(messages, config={"callbacks": []}, stop=stop, **kwargs)
+            except Exception as e:
+                if failure_kind(e) is None:
+                    raise
+                last_error = e
+                continue
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise last_error or RuntimeError("No model available for this request")
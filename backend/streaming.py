@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterable, AsyncIterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+THOUGHT_PATTERNS = ["Thought:", "Action:", "Action Input:", "Observation:"]
+# Graph node of `create_react_agent` whose model calls write the answer
+AGENT_NODE = "agent"
+
+
+def extract_final_answer(final_content: str) -> str:
+    """
+    Filter out internal thoughts from a complete model response.
+
+    Looks for a "Final Answer:" section and keeps only that. If there is none,
+    the whole response is used with the Thought/Action/Observation lines removed.
+
+    Args:
+        final_content: The full text produced by the final model step
+
+    Returns:
+        str: The answer to show to the user
+    """
+    final_answer = ""
+    lines = final_content.split('\n')
+
+    # Extract final answer if it exists
+    in_final_answer = False
+    for line in lines:
+        if FINAL_ANSWER_MARKER in line:
+            in_final_answer = True
+            final_answer += line.replace(FINAL_ANSWER_MARKER, "").strip() + "\n"
+        elif in_final_answer and line.strip():
+            final_answer += line + "\n"
+        elif in_final_answer and not line.strip():
+            break
+
+    # If no "Final Answer:" section found, use the entire response
+    # but filter out obvious internal thought patterns
+    if not final_answer.strip():
+        filtered_response = ""
+
+        for line in lines:
+            # Skip internal thought patterns
+            if not any(pattern in line for pattern in THOUGHT_PATTERNS):
+                filtered_response += line + "\n"
+
+        return filtered_response.strip()
+
+    return final_answer.strip()
+
+
+class FinalAnswerStream:
+    """
+    Incremental version of `extract_final_answer` for one model step.
+
+    Chunks are fed as they arrive and the part of the answer that can no
+    longer change is returned right away:
+
+    - plain: no marker or thought line seen yet; held, since a "Final Answer:"
+      further on would make it a preamble the post-hoc filter drops.
+    - hold: a thought line was seen, so a "Final Answer:" is expected; nothing
+      is released until it shows up.
+    - answer: after the marker; text is released as it streams, until the
+      first blank line.
+    - done: the answer section has ended; the rest of the step is ignored.
+
+    Leading and trailing whitespace is held back, as the post-hoc filter
+    strips it. `finish` runs `extract_final_answer` on the full text and
+    releases whatever is still missing. Should the early output not be a
+    prefix of that, the post-hoc answer is released in full after it.
+    """
+
+    def __init__(self):
+        self.mode = "plain"
+        self._text = ""
+        self._partial = ""
+        self._answer = ""
+        self._emitted = ""
+
+    def feed(self, chunk: str) -> str:
+        """
+        Args:
+            chunk: The next piece of model output
+
+        Returns:
+            str: Newly releasable answer text (may be empty)
+        """
+        self._text += chunk
+        if self.mode == "done":
+            return ""
+
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._consume_line(line)
+            if self.mode == "done":
+                self._partial = ""
+                break
+
+        return self._release()
+
+    def finish(self) -> str:
+        """
+        Returns:
+            str: The rest of the answer once the step is complete
+        """
+        final_answer = extract_final_answer(self._text)
+        self.mode = "done"
+        if not final_answer.startswith(self._emitted):
+            logger.warning("Streamed answer diverged from the post-hoc filter, sending the post-hoc answer")
+            self._emitted = final_answer
+            return "\n\n" + final_answer
+        remainder = final_answer[len(self._emitted):]
+        self._emitted = final_answer
+        return remainder
+
+    def _consume_line(self, line: str):
+        if FINAL_ANSWER_MARKER in line:
+            self.mode = "answer"
+            self._answer += line.replace(FINAL_ANSWER_MARKER, "").strip() + "\n"
+        elif self.mode == "answer":
+            if line.strip():
+                self._answer += line + "\n"
+            else:
+                self.mode = "done"
+        elif self.mode == "plain" and any(pattern in line for pattern in THOUGHT_PATTERNS):
+            self.mode = "hold"
+
+    def _release(self) -> str:
+        if self.mode in ("plain", "hold") and FINAL_ANSWER_MARKER in self._partial:
+            self.mode = "answer"
+
+        if self.mode == "answer":
+            candidate = self._answer + self._partial_answer_text()
+        elif self.mode == "done":
+            candidate = self._answer
+        else:
+            return ""
+
+        safe = candidate.strip()
+        if not safe.startswith(self._emitted):
+            return ""
+        released = safe[len(self._emitted):]
+        self._emitted = safe
+        return released
+
+    def _partial_answer_text(self) -> str:
+        partial = self._partial
+        if FINAL_ANSWER_MARKER in partial:
+            partial = partial.replace(FINAL_ANSWER_MARKER, "").strip()
+        # Hold back a tail that could still grow into another marker
+        for size in range(min(len(partial), len(FINAL_ANSWER_MARKER) - 1), 0, -1):
+            if FINAL_ANSWER_MARKER.startswith(partial[-size:]):
+                return partial[:-size]
+        return partial
+
+
+def has_final_answer(content) -> bool:
+    """Whether a model step's text contains a "Final Answer:" section."""
+    return isinstance(content, str) and FINAL_ANSWER_MARKER in content
+
+
+def is_agent_model_event(event: dict) -> bool:
+    """
+    Whether an `astream_events` event belongs to a model call of the agent
+    node, rather than e.g. the summaries made inside the extract and crawl tools.
+    """
+    return event.get("metadata", {}).get("langgraph_node") == AGENT_NODE
+
+
+class AgentAnswerStream:
+    """
+    The final answer of an agent run, released from its `astream_events` events.
+
+    Each model call of the agent node is filtered by a `FinalAnswerStream`.
+    Until a call writes "Final Answer:" its text is held, since tool call
+    chunks may still follow; a call that ends with tool calls is not the
+    answer and is dropped. Once the marker is written the call is the
+    answer (the agent drops any tool calls it makes, see `backend.agent`),
+    so its answer section is released as it streams.
+    """
+
+    def __init__(self):
+        self._run_id = None
+        self._step: Optional[FinalAnswerStream] = None
+        self._calls_tools = False
+
+    def feed(self, event: dict) -> str:
+        """
+        Args:
+            event: The next event of the run
+
+        Returns:
+            str: Newly releasable answer text (may be empty)
+        """
+        if event["event"] not in ("on_chat_model_stream", "on_chat_model_end") or not is_agent_model_event(event):
+            return ""
+        if event.get("run_id") != self._run_id:
+            self._run_id = event.get("run_id")
+            self._step = FinalAnswerStream()
+            self._calls_tools = False
+
+        if event["event"] == "on_chat_model_end":
+            self._calls_tools = self._calls_tools or bool(getattr(event["data"].get("output"), "tool_calls", None))
+            return self.finish()
+
+        chunk = event["data"]["chunk"]
+        self._calls_tools = self._calls_tools or bool(getattr(chunk, "tool_call_chunks", None))
+        if self._step is None or not getattr(chunk, "content", None):
+            return ""
+        return self._step.feed(chunk.content)
+
+    def finish(self) -> str:
+        """
+        Returns:
+            str: The rest of the current model call's answer, or "" if it called tools instead
+        """
+        step, self._step = self._step, None
+        if step is None or (self._calls_tools and step.mode not in ("answer", "done")):
+            return ""
+        return step.finish()
+
+
+class ChatbotFramer:
+    """
+    Turns answer text into NDJSON "chatbot" frames.
+
+    Protocol version 1 sends one frame per character, which is what the
+    existing UI was built against. Version 2 coalesces text into frames of up
+    to `max_chars` characters, flushing early once the oldest buffered text is
+    `max_delay` seconds old so a slow model still reaches the user promptly.
+    A stream that stalls with text buffered is flushed by `paced`.
+    """
+
+    def __init__(self, protocol_version: int = 1, max_chars: int = 256, max_delay: float = 0.05):
+        self.protocol_version = protocol_version
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._buffer = ""
+        self._buffered_at = 0.0
+
+    @staticmethod
+    def frame(content: str) -> str:
+        return (
+            json.dumps(
+                {
+                    "type": "chatbot",
+                    "content": content,
+                }
+            )
+            + "\n"
+        )
+
+    @staticmethod
+    def is_chatbot_frame(frame: str) -> bool:
+        return frame.startswith('{"type": "chatbot"')
+
+    def frames(self, text: str) -> list[str]:
+        """
+        Args:
+            text: Newly released answer text
+
+        Returns:
+            list[str]: Frames that are ready to be sent
+        """
+        if self.protocol_version < 2:
+            # Yield each character one at a time
+            return [self.frame(char) for char in text]
+
+        if not text:
+            return []
+        if not self._buffer:
+            self._buffered_at = time.monotonic()
+        self._buffer += text
+
+        ready = []
+        while len(self._buffer) >= self.max_chars:
+            ready.append(self.frame(self._buffer[: self.max_chars]))
+            self._buffer = self._buffer[self.max_chars:]
+            self._buffered_at = time.monotonic()
+        if self._buffer and time.monotonic() - self._buffered_at >= self.max_delay:
+            ready.extend(self.flush())
+        return ready
+
+    def time_to_deadline(self) -> Optional[float]:
+        """Seconds until the buffered text is due, or None when nothing is buffered."""
+        if not self._buffer:
+            return None
+        return max(0.0, self._buffered_at + self.max_delay - time.monotonic())
+
+    async def paced(self, source: AsyncIterable[T]) -> AsyncIterator[Optional[T]]:
+        """
+        Iterate `source`, yielding None when buffered text is due before its next item.
+
+        The caller flushes on None, so text isn't held while the source stalls,
+        e.g. while a model pauses between tokens.
+        """
+        if self.protocol_version < 2:
+            # Nothing is buffered
+            async for item in source:
+                yield item
+            return
+
+        iterator = source.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                done, _ = await asyncio.wait({pending}, timeout=self.time_to_deadline())
+                if not done:
+                    yield None
+                    continue
+                next_item, pending = pending, None
+                try:
+                    item = next_item.result()
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    def flush(self) -> list[str]:
+        """
+        Returns:
+            list[str]: A frame with any buffered text
+        """
+        if not self._buffer:
+            return []
+        content, self._buffer = self._buffer, ""
+        return [self.frame(content)]
@@ -0,0 +1,304 @@
+import ast
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from langchain_core.language_models import LanguageModelLike
+
+from backend.telemetry import SUMMARY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Roughly 1.5k tokens of page text per summary call
+DEFAULT_CHUNK_SIZE = 6000
+DEFAULT_CHUNK_OVERLAP = 200
+# Upper bound on page text sent in the single prompt of the sync path
+MAX_SYNC_CONTENT = 48000
+# Upper bound on partial summaries sent in one merge prompt
+MAX_MERGE_CONTENT = 48000
+
+CHUNK_PROMPT = """
+    Summarize the following content into a relevant format that helps answer the user's question.
+    Focus on the key information that would be most useful for answering: {user_message}
+    Remove redundant information and highlight the most important findings.
+
+    Content:
+    {content}
+
+    Provide a clear, organized summary that captures the essential information relevant to the user's question:
+    """
+
+MERGE_PROMPT = """
+    The following are partial summaries of consecutive sections of the page {url}.
+    Merge them into one clear, organized summary that helps answer: {user_message}
+    Remove repetition between the sections and keep every relevant fact.
+
+    Partial summaries:
+    {content}
+
+    Merged summary:
+    """
+
+
+def parse_tool_output(tool_output: str):
+    """
+    Parse a stringified Tavily result into its list of result items.
+
+    Returns:
+        tuple: (result, items). `result` is set when the output can't be
+        summarized and should be returned as is.
+    """
+    if not tool_output or tool_output.strip() == "":
+        return {"summary": tool_output, "urls": []}, []
+
+    try:
+        parsed_output = json.loads(tool_output)
+    except (json.JSONDecodeError, TypeError):
+        try:
+            parsed_output = ast.literal_eval(tool_output)
+        except (ValueError, SyntaxError):
+            return {"summary": tool_output, "urls": []}, []
+
+    if isinstance(parsed_output, dict) and 'results' in parsed_output:
+        return None, parsed_output['results']
+    if isinstance(parsed_output, list):
+        return None, parsed_output
+    return {"summary": tool_output, "urls": [], "favicons": []}, []
+
+
+def extract_pages(items: list) -> list[dict]:
+    """
+    Returns:
+        list[dict]: One {"url", "favicon", "content"} entry per result with raw content
+    """
+    pages = []
+    for item in items:
+        if isinstance(item, dict) and 'url' in item and 'raw_content' in item:
+            pages.append({
+                "url": item['url'],
+                "favicon": item.get('favicon'),
+                "content": item['raw_content'] or "",
+            })
+    return pages
+
+
+def split_into_chunks(text: str, chunk_size: int = DEFAULT_CHUNK_SIZE, overlap: int = DEFAULT_CHUNK_OVERLAP) -> list[str]:
+    """
+    Split text into chunks of at most `chunk_size` characters.
+
+    Chunks end on a paragraph, line or sentence boundary where one is available
+    in the second half of the chunk, and consecutive chunks share `overlap`
+    characters so facts spanning a boundary are not lost.
+    """
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            for separator in ("\n\n", "\n", ". "):
+                boundary = text.rfind(separator, start + chunk_size // 2, end)
+                if boundary != -1:
+                    end = boundary + len(separator)
+                    break
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+def fit_partials(results: list[tuple[str, bool]], budget: int) -> Optional[str]:
+    """
+    Join a page's partial summaries into at most `budget` characters.
+
+    Raw chunks that stand in for a failed chunk summary share what the
+    summaries leave of the budget, each truncated to an equal part.
+
+    Args:
+        results: (text, summarized) per chunk, as `call_llm` returns them
+        budget: Characters the joined text may take
+
+    Returns:
+        Optional[str]: The joined text, or None when the summaries alone don't fit
+    """
+    separators = 2 * (len(results) - 1)
+    summarized = sum(len(text) for text, ok in results if ok)
+    fallbacks = sum(1 for _, ok in results if not ok)
+    left = budget - separators - summarized
+    if left < 0:
+        return None
+    share = left // fallbacks if fallbacks else 0
+    return "\n\n".join(text if ok else text[:share] for text, ok in results)
+
+
+def format_summary(page_summaries: list[tuple[str, str]]) -> str:
+    """Join per-page summaries, each under the URL it came from."""
+    return "\n\n".join(f"Source: {url}\n{summary}" for url, summary in page_summaries)
+
+
+class PageSummaryCache:
+    """LRU cache of page summaries keyed by page content and question."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(content: str, user_message: str) -> str:
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        message_hash = hashlib.sha256(" ".join(user_message.lower().split()).encode("utf-8")).hexdigest()
+        return f"{content_hash}:{message_hash[:16]}"
+
+    def get(self, key: str) -> Optional[str]:
+        summary = self._entries.get(key)
+        if summary is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return summary
+
+    def set(self, key: str, summary: str):
+        self._entries[key] = summary
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def create_output_summarizer(nano_llm: LanguageModelLike) -> Callable[[str, str], dict]:
+    def summarize_output(tool_output: str, user_message: str = "") -> dict:
+        result, items = parse_tool_output(tool_output)
+        if result is not None:
+            return result
+
+        pages = extract_pages(items)
+        urls = [page["url"] for page in pages]
+        favicons = [page["favicon"] for page in pages]
+        content = format_summary([(page["url"], page["content"]) for page in pages])
+
+        summary_prompt = CHUNK_PROMPT.format(
+            user_message=user_message, content=content[:MAX_SYNC_CONTENT]
+        )
+        summary = nano_llm.invoke(summary_prompt).content
+
+        return {"summary": summary, "urls": urls, "favicons": favicons}
+
+    return summarize_output
+
+
+def create_async_output_summarizer(
+    nano_llm: LanguageModelLike,
+    semaphore: asyncio.Semaphore,
+    timeout: float = 20.0,
+    queue_timeout: float = 1.0,
+    page_cache: Optional[PageSummaryCache] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_parallel_chunks: int = 4,
+    merge_budget: int = MAX_MERGE_CONTENT,
+) -> Callable[[str, str], Awaitable[dict]]:
+    """
+    Async map-reduce summarizer for extract and crawl outputs.
+
+    Each page's raw content is split into chunks that are summarized
+    concurrently, at most `max_parallel_chunks` at a time per tool call and
+    `semaphore`'s worth across the process. Pages with several chunks get a
+    merge call over their partial summaries. The result keeps one section per
+    URL so attribution survives, and finished page summaries are cached.
+
+    A chunk that can't get a slot within `queue_timeout` seconds, or whose
+    summary takes longer than `timeout` seconds, falls back to its raw text.
+    The merge prompt gets at most `merge_budget` characters of partial
+    summaries: raw fallback text is truncated to fit, and a page whose
+    summaries alone exceed the budget gets them joined without a merge call.
+    """
+
+    async def call_llm(prompt: str, fallback: str, run_slots: asyncio.Semaphore) -> tuple[str, bool]:
+        """Returns (text, summarized); `text` is `fallback` when summarized is False."""
+        async with run_slots:
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=queue_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Summarizer at capacity, returning unsummarized output")
+                return fallback, False
+
+            try:
+                response = await asyncio.wait_for(nano_llm.ainvoke(prompt), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Summarizer timed out after %ss, returning unsummarized output", timeout)
+                return fallback, False
+            finally:
+                semaphore.release()
+            return response.content, True
+
+    async def summarize_page(page: dict, user_message: str, run_slots: asyncio.Semaphore) -> str:
+        cache_key = PageSummaryCache.key(page["content"], user_message)
+        if page_cache is not None:
+            cached = page_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        chunks = split_into_chunks(page["content"], chunk_size)
+        if not chunks:
+            return ""
+
+        results = await asyncio.gather(*[
+            call_llm(CHUNK_PROMPT.format(user_message=user_message, content=chunk), chunk, run_slots)
+            for chunk in chunks
+        ])
+        partials = [text for text, _ in results]
+        summarized = all(ok for _, ok in results)
+        if len(partials) == 1:
+            summary = partials[0]
+        else:
+            merged = fit_partials(results, merge_budget)
+            if merged is None:
+                logger.warning("Partial summaries of %s exceed the merge budget, returning them unmerged", page["url"])
+                summary = "\n\n".join(text for text, ok in results if ok)
+                summarized = False
+            else:
+                summary, merge_ok = await call_llm(
+                    MERGE_PROMPT.format(url=page["url"], user_message=user_message, content=merged),
+                    merged,
+                    run_slots,
+                )
+                summarized = summarized and merge_ok
+
+        # Only cache complete summaries, not raw text from a fallback
+        if page_cache is not None and summarized:
+            page_cache.set(cache_key, summary)
+        return summary
+
+    async def summarize_output(tool_output: str, user_message: str = "") -> dict:
+        result, items = parse_tool_output(tool_output)
+        if result is not None:
+            return result
+
+        started_at = time.perf_counter()
+        pages = extract_pages(items)
+        urls = [page["url"] for page in pages]
+        favicons = [page["favicon"] for page in pages]
+
+        run_slots = asyncio.Semaphore(max_parallel_chunks)
+        summaries = await asyncio.gather(*[
+            summarize_page(page, user_message, run_slots) for page in pages
+        ])
+        summary = format_summary([
+            (page["url"], page_summary)
+            for page, page_summary in zip(pages, summaries)
+            if page_summary
+        ])
+        SUMMARY_SECONDS.observe(time.perf_counter() - started_at)
+
+        return {"summary": summary, "urls": urls, "favicons": favicons}
+
+    return summarize_output
@@ -0,0 +1,363 @@
+import asyncio
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import AsyncIterator, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, ProcessCollector
+
+from backend.streaming import ChatbotFramer
+
+logger = logging.getLogger("tavily_chat.trace")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+REQUESTS = Counter(
+    "tavily_chat_requests_total",
+    "Agent requests by agent type and outcome",
+    ["agent_type", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "tavily_chat_stage_seconds",
+    "Time spent in request stages before streaming starts (auth, graph)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_BYTE = Histogram(
+    "tavily_chat_time_to_first_byte_seconds",
+    "Time from request arrival to the first streamed frame",
+    ["agent_type"],
+    buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_ANSWER_TOKEN = Histogram(
+    "tavily_chat_time_to_first_answer_token_seconds",
+    "Time from request arrival to the first chatbot frame",
+    ["agent_type"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "tavily_chat_request_seconds",
+    "Time from request arrival to the end of the stream",
+    ["agent_type"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_STEP_SECONDS = Histogram(
+    "tavily_chat_llm_step_seconds",
+    "Duration of each model call, including summarization calls inside tools",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "tavily_chat_llm_tokens",
+    "Tokens per model call",
+    ["model", "kind"],
+    buckets=TOKEN_BUCKETS,
+)
+TOOL_SECONDS = Histogram(
+    "tavily_chat_tool_seconds",
+    "Duration of each tool call, including summarization",
+    ["tool_type"],
+    buckets=LATENCY_BUCKETS,
+)
+SUMMARY_SECONDS = Histogram(
+    "tavily_chat_summary_seconds",
+    "Duration of summarizing one extract or crawl output",
+    buckets=LATENCY_BUCKETS,
+)
+ACTIVE_RUNS = Gauge(
+    "tavily_chat_active_runs",
+    "Agent runs currently admitted",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "tavily_chat_admission_queue_depth",
+    "Agent runs waiting for a slot",
+    ["agent_type"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "tavily_chat_admission_wait_seconds",
+    "Time admitted runs waited for a slot",
+    ["agent_type"],
+    buckets=LATENCY_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "tavily_chat_admission_rejected_total",
+    "Agent runs rejected with 429",
+    ["agent_type", "reason"],
+)
+CLIENT_DISCONNECTS = Counter(
+    "tavily_chat_client_disconnects_total",
+    "Streams whose client went away before the run finished",
+    ["agent_type"],
+)
+RESUMES = Counter(
+    "tavily_chat_resumes_total",
+    "Requests to resume a run's stream, by outcome",
+    ["result"],
+)
+CANCELLED_WORK = Counter(
+    "tavily_chat_cancelled_work_total",
+    "Model calls and tool calls cancelled while running because their run was",
+    ["kind"],
+)
+ANSWER_CACHE_LOOKUPS = Counter(
+    "tavily_chat_answer_cache_lookups_total",
+    "Fast agent questions looked up in the answer cache",
+    ["result"],
+)
+AUTH_CACHE_LOOKUPS = Counter(
+    "tavily_chat_auth_cache_lookups_total",
+    "API key checks by result: answered from the cache, sent upstream, or joined to a check in flight",
+    ["result"],
+)
+AUTH_CACHE_SIZE = Gauge(
+    "tavily_chat_auth_cache_size",
+    "API keys whose authorization is cached",
+    multiprocess_mode="livesum",
+)
+CHECKPOINT_THREADS = Gauge(
+    "tavily_chat_checkpoint_threads",
+    "Conversation threads held by the in-memory checkpointer",
+    multiprocess_mode="livesum",
+)
+CHECKPOINT_BYTES = Gauge(
+    "tavily_chat_checkpoint_bytes",
+    "Serialized size of all threads held by the in-memory checkpointer",
+    multiprocess_mode="livesum",
+)
+CHECKPOINT_EVICTIONS = Counter(
+    "tavily_chat_checkpoint_evictions_total",
+    "Threads dropped by the in-memory checkpointer, losing their history",
+    ["reason"],
+)
+PREFETCH_URLS = Counter(
+    "tavily_chat_prefetch_urls_total",
+    "Search result URLs extracted in the background",
+)
+PREFETCH_HITS = Counter(
+    "tavily_chat_prefetch_hits_total",
+    "Prefetched URLs the agent later extracted",
+)
+PREFETCH_SKIPPED = Counter(
+    "tavily_chat_prefetch_skipped_total",
+    "Prefetches not started",
+    ["reason"],
+)
+PREFETCH_CREDITS = Counter(
+    "tavily_chat_tavily_credits_total",
+    "Estimated Tavily API credits spent, by foreground tool calls and prefetching",
+    ["kind"],
+)
+MODEL_CALLS = Counter(
+    "tavily_chat_model_calls_total",
+    "Calls the model router sent to each model, by outcome",
+    ["model", "outcome"],
+)
+MODEL_FAILOVERS = Counter(
+    "tavily_chat_model_failovers_total",
+    "Calls served by a model other than the preferred one, by reason",
+    ["reason"],
+)
+MODEL_FIRST_TOKEN_SECONDS = Histogram(
+    "tavily_chat_model_first_token_seconds",
+    "Time from sending a model call to its first streamed chunk, for the call that answered",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+MODEL_CIRCUIT_OPEN = Gauge(
+    "tavily_chat_model_circuit_open",
+    "1 while a model provider's circuit breaker is open",
+    ["provider"],
+    multiprocess_mode="livemax",
+)
+EVENT_LOOP_LAG = Histogram(
+    "tavily_chat_event_loop_lag_seconds",
+    "How late the event loop ran a timer, i.e. how long callbacks were blocked",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+_multiprocess_registry: Optional[CollectorRegistry] = None
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    The registry to serve on /metrics.
+
+    With several worker processes (PROMETHEUS_MULTIPROC_DIR set, see
+    gunicorn.conf.py) that is every live worker's metrics combined, plus the
+    process metrics of the worker answering the scrape.
+    """
+    global _multiprocess_registry
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    if _multiprocess_registry is None:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        ProcessCollector(registry=registry)
+        _multiprocess_registry = registry
+    return _multiprocess_registry
+
+
+def configure_trace_logging(level: str = "INFO") -> QueueListener:
+    """
+    Send trace logs through a queue so the event loop never waits on the stream.
+
+    Returns:
+        QueueListener: The started listener; stop it at shutdown to drain the queue
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    listener = QueueListener(log_queue, handler)
+
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+
+async def monitor_event_loop_lag(interval: float = 0.1):
+    """Measure event loop lag every `interval` seconds until cancelled."""
+    while True:
+        started_at = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started_at - interval))
+
+
+class RequestTrace:
+    """
+    Timing of one agent request, fed from the `astream_events` stream.
+
+    Per-event log lines are only written for a `sample_rate` fraction of
+    requests, so a sampled request is logged in full. A one-line summary is
+    written for every request.
+    """
+
+    def __init__(self, thread_id: str, sample_rate: float = 0.1):
+        self.thread_id = thread_id
+        self.agent_type = "unknown"
+        self.started_at = time.perf_counter()
+        self.sampled = random.random() < sample_rate
+        self.first_byte: Optional[float] = None
+        self.first_answer_token: Optional[float] = None
+        self.stages: dict[str, float] = {}
+        self.tokens = {"input": 0, "output": 0}
+        self.tool_calls = 0
+        # run_id -> (kind, start time) of model and tool calls still running
+        self._runs: dict[str, tuple[str, float]] = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def stage(self, name: str, started_at: float):
+        """Record a stage that began at `started_at` (a `time.perf_counter()` value) and just ended."""
+        duration = time.perf_counter() - started_at
+        self.stages[name] = duration
+        STAGE_SECONDS.labels(stage=name).observe(duration)
+
+    def event(self, message: str, *args):
+        if self.sampled:
+            logger.info("[%s] " + message, self.thread_id, *args)
+
+    def on_event(self, event: dict):
+        """Update timings from one `astream_events` event."""
+        kind = event["event"]
+        run_id = event.get("run_id")
+        if kind in ("on_chat_model_start", "on_tool_start"):
+            self._runs[run_id] = ("llm" if kind == "on_chat_model_start" else "tool", time.perf_counter())
+            return
+        if kind not in ("on_chat_model_end", "on_tool_end", "on_tool_error"):
+            return
+
+        _, started_at = self._runs.pop(run_id, (None, None))
+        duration = time.perf_counter() - started_at if started_at is not None else None
+        if kind == "on_chat_model_end":
+            model = event.get("metadata", {}).get("ls_model_name") or "unknown"
+            usage = getattr(event["data"].get("output"), "usage_metadata", None) or {}
+            for token_kind, key in (("input", "input_tokens"), ("output", "output_tokens")):
+                if usage.get(key):
+                    self.tokens[token_kind] += usage[key]
+                    LLM_TOKENS.labels(model=model, kind=token_kind).observe(usage[key])
+            if duration is not None:
+                LLM_STEP_SECONDS.labels(model=model).observe(duration)
+            self.event(
+                "LLM step: %s %.3fs (%d input, %d output tokens)",
+                model,
+                duration or 0.0,
+                usage.get("input_tokens", 0),
+                usage.get("output_tokens", 0),
+            )
+        else:
+            tool_type = tool_type_of(event.get("name"))
+            self.tool_calls += 1
+            if duration is not None:
+                TOOL_SECONDS.labels(tool_type=tool_type).observe(duration)
+            self.event("Tool %s: %s %.3fs", kind[len("on_tool_"):], tool_type, duration or 0.0)
+
+    def on_frame(self, frame: str):
+        if self.first_byte is None:
+            self.first_byte = self.elapsed()
+            TIME_TO_FIRST_BYTE.labels(agent_type=self.agent_type).observe(self.first_byte)
+        if self.first_answer_token is None and ChatbotFramer.is_chatbot_frame(frame):
+            self.first_answer_token = self.elapsed()
+            TIME_TO_FIRST_ANSWER_TOKEN.labels(agent_type=self.agent_type).observe(self.first_answer_token)
+
+    def finish(self, status: str):
+        duration = self.elapsed()
+        REQUESTS.labels(agent_type=self.agent_type, status=status).inc()
+        REQUEST_SECONDS.labels(agent_type=self.agent_type).observe(duration)
+        logger.info(
+            "[%s] %s agent %s in %.3fs (first byte %s, first answer token %s, tools %d, tokens %s, stages %s)",
+            self.thread_id,
+            self.agent_type,
+            status,
+            duration,
+            _format_seconds(self.first_byte),
+            _format_seconds(self.first_answer_token),
+            self.tool_calls,
+            self.tokens,
+            {name: round(seconds, 3) for name, seconds in self.stages.items()},
+        )
+
+    async def stream(self, frames: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass `frames` through, timing the first byte and first answer token and finishing the trace."""
+        status = "error"
+        try:
+            async for frame in frames:
+                self.on_frame(frame)
+                yield frame
+            status = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away and the response was closed
+            status = "cancelled"
+            for kind, _ in self._runs.values():
+                CANCELLED_WORK.labels(kind=kind).inc()
+            if self._runs:
+                self.event("Cancelled %d running model and tool calls", len(self._runs))
+            raise
+        finally:
+            self.finish(status)
+
+
+def tool_type_of(tool_name: Optional[str]) -> str:
+    """Determine tool type from tool name."""
+    tool_type = "search"
+    if tool_name and "extract" in tool_name:
+        tool_type = "extract"
+    elif tool_name and "crawl" in tool_name:
+        tool_type = "crawl"
+    return tool_type
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return f"{value:.3f}s" if value is not None else "n/a"
@@ -0,0 +1,217 @@
+import hmac
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+# orjson is optional; without it frames are encoded by the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# First AgentRequest.protocol_version with compact tool events
+COMPACT_TOOL_EVENTS_VERSION = 3
+# Characters of each search result's content sent with a compact tool_end, enough for the preview
+SNIPPET_CHARS = 200
+# URLs listed in a compact tool_end
+MAX_SOURCES = 50
+# Characters of an output that isn't JSON, e.g. an error message
+MAX_TEXT_CHARS = 1000
+
+SEARCH_RESULT_FIELDS = ("url", "title", "favicon", "published_date")
+
+
+def dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"))
+
+
+def encode_frame(payload: dict) -> str:
+    """One NDJSON frame, encoded with orjson when it is installed."""
+    return dumps(payload) + "\n"
+
+
+def loads(text: str) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def parse_tool_output(output: Any) -> tuple[str, Any]:
+    """
+    A tool output as JSON text and as the value it encodes.
+
+    Tools answer with a ToolMessage whose content is usually JSON already,
+    which is kept as is; other text becomes a JSON string.
+    """
+    content = getattr(output, "content", output)
+    if isinstance(content, str):
+        if content[:1] in ("{", "["):
+            try:
+                return content, loads(content)
+            except ValueError:
+                pass
+        return dumps(content), content
+    try:
+        return dumps(content), content
+    except TypeError:
+        return dumps(str(content)), str(content)
+
+
+def compact_tool_output(tool_type: str, output: Any) -> dict:
+    """
+    The part of a tool output the UI shows right away: its sources.
+
+    Search results keep their URL, title, favicon, date and a content
+    snippet. Extract and crawl summaries keep their URLs and favicons. The
+    full output is fetched separately by ID.
+
+    Args:
+        tool_type: "search", "extract" or "crawl"
+        output: The parsed tool output from `parse_tool_output`
+    """
+    if not isinstance(output, dict):
+        return {"text": str(output)[:MAX_TEXT_CHARS]}
+    if "error" in output:
+        return {"error": str(output["error"])[:MAX_TEXT_CHARS]}
+
+    if tool_type == "search":
+        results = []
+        for item in (output.get("results") or [])[:MAX_SOURCES]:
+            if not isinstance(item, dict):
+                continue
+            result = {field: item[field] for field in SEARCH_RESULT_FIELDS if item.get(field) is not None}
+            result["content"] = str(item.get("content") or "")[:SNIPPET_CHARS]
+            results.append(result)
+        return {"results": results}
+
+    compact = {
+        "urls": (output.get("urls") or [])[:MAX_SOURCES],
+        "favicons": (output.get("favicons") or [])[:MAX_SOURCES],
+    }
+    if output.get("base_url"):
+        compact["base_url"] = output["base_url"]
+    return compact
+
+
+class ToolOutputStore:
+    """
+    Full tool outputs of recent runs, fetched by ID after a compact tool_end.
+
+    Outputs are kept as the encoded bytes sent to the client, at most
+    `max_bytes` in total (oldest dropped first) and for `ttl` seconds. Each
+    is stored with the hash of the run's API key and only fetched with the
+    same key.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 600.0):
+        """
+        Args:
+            max_bytes: Total size of the stored outputs
+            ttl: Seconds an output can be fetched
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._outputs: "OrderedDict[str, tuple[float, str, bytes]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "ToolOutputStore":
+        return cls(
+            max_bytes=int(os.getenv("TOOL_OUTPUT_STORE_MB", "64")) * 1024 * 1024,
+            ttl=float(os.getenv("TOOL_OUTPUT_TTL", "600")),
+        )
+
+    def put(self, text: str, key_hash: str) -> str:
+        """
+        Args:
+            text: The full output, as JSON
+            key_hash: `hash_api_key` of the run's API key
+        """
+        output_id = uuid.uuid4().hex
+        content = text.encode("utf-8")
+        self._outputs[output_id] = (time.monotonic() + self.ttl, key_hash, content)
+        self.size += len(content)
+        self._evict()
+        return output_id
+
+    def get(self, output_id: str, key_hash: str) -> Optional[bytes]:
+        """The output stored under `output_id` by a run with the same API key, or None."""
+        entry = self._outputs.get(output_id)
+        if entry is None:
+            return None
+        expires_at, owner, content = entry
+        if expires_at <= time.monotonic():
+            self._drop(output_id)
+            return None
+        if not hmac.compare_digest(owner, key_hash):
+            return None
+        return content
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._outputs:
+            output_id, (expires_at, _, _) = next(iter(self._outputs.items()))
+            if self.size <= self.max_bytes and expires_at > now:
+                return
+            self._drop(output_id)
+
+    def _drop(self, output_id: str):
+        _, _, content = self._outputs.pop(output_id)
+        self.size -= len(content)
+
+
+def serializable_output(output: Any) -> Any:
+    """A tool output as JSON-serializable values, as protocol versions 1 and 2 send it."""
+    try:
+        if hasattr(output, "content"):
+            # Handle ToolMessage objects
+            return str(output.content)
+        if isinstance(output, dict):
+            return {k: str(v) for k, v in output.items()}
+        if isinstance(output, list):
+            return [str(item) for item in output]
+        return str(output)
+    except Exception:
+        return "Unable to serialize output"
+
+
+class ToolFrameEncoder:
+    """
+    Encodes a run's tool events as frames of one protocol version.
+
+    Events are dicts shaped like the tool_start and tool_end frames, except
+    that a tool_end carries the tool's full `output` rather than frame
+    content. They are kept in `events` as given, so a cached run can be
+    encoded again for a client of another version.
+    """
+
+    def __init__(self, protocol_version: int, store: ToolOutputStore, key_hash: str):
+        """
+        Args:
+            protocol_version: AgentRequest.protocol_version of the client
+            store: Where full outputs of compact tool_end frames are kept
+            key_hash: `hash_api_key` of the client's API key, needed to fetch them
+        """
+        self.protocol_version = protocol_version
+        self.compact = protocol_version >= COMPACT_TOOL_EVENTS_VERSION
+        self.store = store
+        self.key_hash = key_hash
+        self.events: list[dict] = []
+
+    def frame(self, event: dict) -> str:
+        self.events.append(event)
+        if event["type"] != "tool_end":
+            return encode_frame(event) if self.compact else json.dumps(event) + "\n"
+
+        frame = {key: value for key, value in event.items() if key != "output"}
+        if self.compact:
+            # Sources now, the full output on request by output_id
+            output_json, output = parse_tool_output(event["output"])
+            frame["output_id"] = self.store.put(output_json, self.key_hash)
+            frame["content"] = compact_tool_output(event["tool_type"], output)
+            return encode_frame(frame)
+        frame["content"] = serializable_output(event["output"])
+        return json.dumps(frame) + "\n"
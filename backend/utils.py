@@ -1,36 +1,174 @@
-import requests
-from requests.exceptions import RequestException
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
 
-TAVILY_API_ENDPOINT = "https://api.tavily.com"
+import httpx
 
+from backend.telemetry import AUTH_CACHE_LOOKUPS, AUTH_CACHE_SIZE
 
-def check_api_key(api_key: str) -> bool:
-    """
-    Check if the API key is authorized for the given use case
+# Overridable so the app can run against local stand-ins (see benchmarks/stub_servers.py)
+TAVILY_API_ENDPOINT = os.getenv("TAVILY_API_ENDPOINT", "https://api.tavily.com")
+
+
+def hash_api_key(api_key) -> str:
+    """SHA-256 hex digest of an API key (a str or SecretStr), to key state by without keeping the key."""
+    if hasattr(api_key, "get_secret_value"):
+        api_key = api_key.get_secret_value()
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+class AuthorizationError(Exception):
+    """Raised when an API key is rejected or cannot be checked."""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
 
-    Args:
-        api_key: The API key to check
 
-    Returns:
-        bool: True if authorized
+class ApiKeyAuthorizer:
     """
-    try:
-        payload = {"api_key": api_key, "use_case": "chat"}
+    Async authorization of API keys with a bounded TTL cache.
+
+    Positive and negative results are cached under a SHA-256 hash of the key,
+    so raw keys never sit in memory longer than the request that carried them.
+    Concurrent checks of the same key share a single upstream request.
+    Transport errors, 5xx responses and bodies that aren't JSON are never
+    cached. Lookups and the cache size are exported on /metrics.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+        max_entries: int = 10_000,
+        endpoint: str = TAVILY_API_ENDPOINT,
+    ):
+        """
+        Args:
+            client: Shared HTTP client; a pooled one is created if omitted
+            ttl: Seconds an authorized key stays cached
+            negative_ttl: Seconds a rejected key stays cached
+            max_entries: Maximum number of cached keys (least recently used are evicted)
+            endpoint: Base URL of the Tavily API
+        """
+        self._client = client or httpx.AsyncClient(timeout=10.0)
+        self._owns_client = client is None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.endpoint = endpoint
+        # key hash -> (expires_at, error or None)
+        self._cache: "OrderedDict[str, tuple[float, Optional[AuthorizationError]]]" = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _hash_key(api_key: str) -> str:
+        return hash_api_key(api_key)
 
-        response = requests.post(
-            f"{TAVILY_API_ENDPOINT}/authorize-use-case", json=payload
-        )
+    @property
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._cache),
+        }
 
-        response.raise_for_status()
+    async def check(self, api_key: Optional[str]) -> bool:
+        """
+        Check if the API key is authorized for the chat use case
 
-        result = response.json()
+        Args:
+            api_key: The API key to check
 
-        if not result.get("success"):
-            raise requests.exceptions.HTTPError("Authorization failed")
+        Returns:
+            bool: True if authorized
 
+        Raises:
+            AuthorizationError: If the key is rejected or the check fails
+        """
+        if not api_key:
+            raise AuthorizationError(401, "Missing API key")
+
+        key = self._hash_key(api_key)
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires_at, error = cached
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                AUTH_CACHE_LOOKUPS.labels(result="hit").inc()
+                if error is not None:
+                    raise AuthorizationError(error.status_code, error.detail)
+                return True
+            del self._cache[key]
+            AUTH_CACHE_SIZE.set(len(self._cache))
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            AUTH_CACHE_LOOKUPS.labels(result="miss").inc()
+            future = asyncio.ensure_future(self._authorize(key, api_key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            AUTH_CACHE_LOOKUPS.labels(result="coalesced").inc()
+        # Shield so one cancelled caller doesn't cancel the check for the others
+        return await asyncio.shield(future)
+
+    async def _authorize(self, key: str, api_key: str) -> bool:
+        try:
+            response = await self._client.post(
+                f"{self.endpoint}/authorize-use-case",
+                json={"api_key": api_key, "use_case": "chat"},
+            )
+        except httpx.HTTPError as e:
+            raise AuthorizationError(502, f"Authorization check failed: {e}")
+
+        if response.status_code >= 500:
+            raise AuthorizationError(response.status_code, _response_detail(response))
+
+        if response.status_code >= 400:
+            error = AuthorizationError(response.status_code, _response_detail(response))
+            self._store(key, self.negative_ttl, error)
+            raise error
+
+        try:
+            success = response.json().get("success")
+        except (ValueError, AttributeError):
+            # Not a verdict; a later check may get one
+            raise AuthorizationError(401, "Authorization failed")
+        if not success:
+            error = AuthorizationError(401, "Authorization failed")
+            self._store(key, self.negative_ttl, error)
+            raise error
+
+        self._store(key, self.ttl, None)
         return True
 
-    except requests.exceptions.HTTPError:
-        raise
-    except RequestException:
-        raise
+    def _store(self, key: str, ttl: float, error: Optional[AuthorizationError]):
+        self._cache[key] = (time.monotonic() + ttl, error)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        AUTH_CACHE_SIZE.set(len(self._cache))
+
+    async def aclose(self):
+        if self._owns_client:
+            await self._client.aclose()
+
+
+def _response_detail(response: httpx.Response):
+    try:
+        return response.json()
+    except ValueError:
+        return response.text
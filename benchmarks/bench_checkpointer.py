@@ -0,0 +1,101 @@
+"""
+Checkpoint write and read latency under concurrent threads.
+
+Compares MemorySaver, BoundedMemorySaver and SqliteCheckpointer. Each of
+--threads conversation threads writes --turns checkpoints with a growing
+message history (as a chat would) and reads the latest one back after each
+write, all threads running concurrently on one event loop.
+
+    python benchmarks/bench_checkpointer.py --threads 50 --turns 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langgraph.checkpoint.base import empty_checkpoint  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from backend.checkpoint import BoundedMemorySaver, SqliteCheckpointer  # noqa: E402
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def drive(checkpointer, threads: int, turns: int, answer_size: int) -> tuple[list[float], list[float]]:
+    writes: list[float] = []
+    reads: list[float] = []
+
+    async def conversation(thread_index: int):
+        config = {"configurable": {"thread_id": f"thread-{thread_index}", "checkpoint_ns": ""}}
+        messages = []
+        for turn in range(turns):
+            messages = messages + [
+                HumanMessage(content=f"question {turn}"),
+                AIMessage(content="answer " * (answer_size // 7)),
+            ]
+            checkpoint = empty_checkpoint()
+            version = checkpointer.get_next_version(None if turn == 0 else str(turn), None)
+            checkpoint["channel_values"] = {"messages": messages}
+            checkpoint["channel_versions"] = {"messages": version}
+
+            start = time.perf_counter()
+            config = await checkpointer.aput(config, checkpoint, {"step": turn}, {"messages": version})
+            writes.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            await checkpointer.aget_tuple({"configurable": {"thread_id": f"thread-{thread_index}", "checkpoint_ns": ""}})
+            reads.append((time.perf_counter() - start) * 1000)
+            # Let other threads interleave, as model calls would
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*[conversation(i) for i in range(threads)])
+    return writes, reads
+
+
+def report(label: str, writes: list[float], reads: list[float], elapsed: float):
+    print(
+        f"{label:>10}  write p50 {statistics.median(writes):7.3f} p95 {percentile(writes, 0.95):7.3f}"
+        f"  read p50 {statistics.median(reads):7.3f} p95 {percentile(reads, 0.95):7.3f}"
+        f"  total {elapsed:6.2f}s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--answer-size", type=int, default=2000, help="Characters per assistant message")
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.turns} turns, latencies in ms\n")
+
+    for label, checkpointer in (
+        ("memory", MemorySaver()),
+        ("bounded", BoundedMemorySaver(keep_last=3)),
+    ):
+        start = time.perf_counter()
+        writes, reads = await drive(checkpointer, args.threads, args.turns, args.answer_size)
+        report(label, writes, reads, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checkpoints.db")
+        async with SqliteCheckpointer.from_path(path) as checkpointer:
+            start = time.perf_counter()
+            writes, reads = await drive(checkpointer, args.threads, args.turns, args.answer_size)
+            report("sqlite", writes, reads, time.perf_counter() - start)
+        print(f"\nsqlite file size: {os.path.getsize(path) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
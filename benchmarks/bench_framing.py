@@ -0,0 +1,84 @@
+"""
+Benchmark of the "chatbot" frame protocols.
+
+Streams the same answer through a Starlette StreamingResponse with protocol
+version 1 (one frame per character) and version 2 (coalesced chunks), and
+reports bytes on the wire, frames and server CPU time per answer.
+
+    python benchmarks/bench_framing.py --answer-size 4096 --runs 50
+"""
+
+import argparse
+import asyncio
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+from starlette.responses import StreamingResponse
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.streaming import ChatbotFramer  # noqa: E402
+
+
+def make_answer(size: int) -> str:
+    random.seed(0)
+    words = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))))
+    return " ".join(words)[:size]
+
+
+def tokens(answer: str, token_size: int = 4):
+    return [answer[i : i + token_size] for i in range(0, len(answer), token_size)]
+
+
+async def run_once(answer: str, protocol_version: int) -> tuple[int, int, float]:
+    async def event_generator():
+        framer = ChatbotFramer(protocol_version=protocol_version)
+        for token in tokens(answer):
+            for frame in framer.frames(token):
+                yield frame
+        for frame in framer.flush():
+            yield frame
+
+    sent = {"bytes": 0, "frames": 0}
+
+    async def receive():
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            sent["bytes"] += len(message["body"])
+            sent["frames"] += 1
+
+    response = StreamingResponse(event_generator(), media_type="application/json")
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST", "path": "/stream_agent"}
+
+    start = time.process_time()
+    await response(scope, receive, send)
+    cpu = time.process_time() - start
+    return sent["bytes"], sent["frames"], cpu
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answer-size", type=int, default=4096, help="Answer length in characters")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    answer = make_answer(args.answer_size)
+    print(f"answer: {len(answer)} chars, {args.runs} runs per protocol\n")
+    print(f"{'protocol':>8} {'bytes':>10} {'frames':>8} {'cpu ms/answer':>14}")
+    for protocol_version in (1, 2):
+        results = [await run_once(answer, protocol_version) for _ in range(args.runs)]
+        total_bytes, frames, _ = results[0]
+        cpu_ms = sum(cpu for _, _, cpu in results) / len(results) * 1000
+        print(f"{protocol_version:>8} {total_bytes:>10} {frames:>8} {cpu_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
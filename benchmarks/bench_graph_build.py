@@ -0,0 +1,66 @@
+"""
+Microbenchmark of the per-request agent setup.
+
+Compares compiling a new graph for every request (what `WebAgent.build_graph`
+used to do per request) with fetching the cached graph from
+`WebAgent.get_graph` and building the run config. No network calls are made.
+
+    python benchmarks/bench_graph_build.py --requests 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_openai import ChatOpenAI  # noqa: E402
+from langgraph.checkpoint.memory import MemorySaver  # noqa: E402
+
+from backend.agent import WebAgent  # noqa: E402
+from backend.prompts import SIMPLE_PROMPT  # noqa: E402
+
+
+def timed(fn, requests: int) -> list[float]:
+    samples = []
+    for i in range(requests):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:>10}: mean {statistics.mean(samples):8.3f} ms  p50 {statistics.median(samples):8.3f} ms  p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    llm = ChatOpenAI(model="gpt-4.1-nano").with_config({"tags": ["streaming"]})
+    agent = WebAgent(checkpointer=MemorySaver())
+
+    def uncached(i: int):
+        agent.build_graph(llm=llm, prompt=SIMPLE_PROMPT, summary_llm=llm)
+        WebAgent.run_config(thread_id=str(i), api_key="tvly-benchmark", user_message="hello")
+
+    def cached(i: int):
+        agent.get_graph(agent_type="fast", llm=llm, prompt=SIMPLE_PROMPT, summary_llm=llm)
+        WebAgent.run_config(thread_id=str(i), api_key="tvly-benchmark", user_message="hello")
+
+    print(f"{args.requests} requests\n")
+    report("rebuild", timed(uncached, args.requests))
+    report("cached", timed(cached, args.requests))
+
+
+if __name__ == "__main__":
+    main()
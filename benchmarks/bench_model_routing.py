@@ -0,0 +1,136 @@
+"""
+Model routing against a stub server with injected provider faults.
+
+Starts `benchmarks/stub_servers.py` and sends --calls concurrent calls to the
+routed "nano" model (OpenAI, falling back to Groq) in each scenario:
+
+- healthy: both providers answer
+- slow: OpenAI takes --slow-latency seconds, past the first-token deadline, so calls are hedged
+  on Groq (MODEL_HEDGE_ACROSS_PROVIDERS=on)
+- rate_limited: OpenAI answers every call with 429, so calls fail over and its circuit opens
+- down: OpenAI answers with 500, but its circuit is open so it gets no calls
+- recovered: OpenAI is healthy again; after the cooldown one probe call closes the circuit
+
+Scenarios start --window seconds apart, so the model stats of one don't carry
+over into the next.
+
+Reports latency percentiles, which model served the calls and how many calls
+were sent to each provider.
+
+    python benchmarks/bench_model_routing.py --calls 20 --deadline 1 --slow-latency 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+from langchain_core.messages import HumanMessage
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from load_test import percentile, start_process, wait_until_up  # noqa: E402
+
+
+def calls_by_model(metrics) -> Counter:
+    calls = Counter()
+    for metric in metrics.REGISTRY.collect():
+        if metric.name == "tavily_chat_model_calls":
+            for sample in metric.samples:
+                if sample.name.endswith("_total"):
+                    calls[(sample.labels["model"], sample.labels["outcome"])] += sample.value
+    return calls
+
+
+async def run_scenario(model, calls: int) -> tuple[list[float], Counter, int]:
+    latencies: list[float] = []
+    served = Counter()
+    errors = 0
+
+    async def call(index: int):
+        nonlocal errors
+        started_at = time.perf_counter()
+        try:
+            message = None
+            # Streamed, as the agent calls it; only streamed calls are hedged
+            async for chunk in model.astream([HumanMessage(content=f"question {index}")]):
+                message = chunk if message is None else message + chunk
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - started_at)
+        served[message.response_metadata.get("model_name", "unknown")] += 1
+
+    await asyncio.gather(*(call(i) for i in range(calls)))
+    return latencies, served, errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20, help="Concurrent calls per scenario")
+    parser.add_argument("--deadline", type=float, default=1.0, help="MODEL_FIRST_TOKEN_DEADLINE")
+    parser.add_argument("--slow-latency", type=float, default=5.0, help="Seconds OpenAI takes in the slow scenario")
+    parser.add_argument("--cooldown", type=float, default=10.0, help="MODEL_BREAKER_COOLDOWN")
+    parser.add_argument("--window", type=float, default=3.0, help="MODEL_STATS_WINDOW")
+    parser.add_argument("--stub-port", type=int, default=8191)
+    args = parser.parse_args()
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    os.environ.update(
+        {
+            "OPENAI_BASE_URL": f"{stub_url}/v1",
+            "OPENAI_API_KEY": "sk-stub",
+            "GROQ_BASE_URL": stub_url,
+            "GROQ_API_KEY": "stub",
+            "MODEL_FIRST_TOKEN_DEADLINE": str(args.deadline),
+            "MODEL_BREAKER_COOLDOWN": str(args.cooldown),
+            "MODEL_STATS_WINDOW": str(args.window),
+            "MODEL_MAX_RETRIES": "0",
+            # The slow scenario measures hedging on Groq
+            "MODEL_HEDGE_ACROSS_PROVIDERS": "on",
+        }
+    )
+    # Read the base URLs above at import
+    import prometheus_client
+
+    from backend.http_clients import HttpClientRegistry
+    from backend.models import create_models
+
+    stub = start_process(["benchmarks/stub_servers.py", "--port", str(args.stub_port), "--token-rate", "0"], {})
+    http = HttpClientRegistry.from_env()
+    try:
+        await wait_until_up(stub_url)
+        model = create_models(http)["nano"]
+        scenarios = [
+            ("healthy", {"latency": 0, "error_rate": 0}),
+            ("slow", {"latency": args.slow_latency, "error_rate": 0}),
+            ("rate_limited", {"latency": 0, "error_rate": 1, "status": 429}),
+            ("down", {"latency": 0, "error_rate": 1, "status": 500}),
+            ("recovered", {"latency": 0, "error_rate": 0}),
+        ]
+        print(f"{args.calls} calls per scenario, first-token deadline {args.deadline}s\n")
+        print(f"{'scenario':>12} {'p50 s':>7} {'p95 s':>7} {'errors':>6}  served by / provider calls")
+        async with httpx.AsyncClient() as client:
+            for name, faults in scenarios:
+                await client.post(f"{stub_url}/stub/faults", json={"provider": "openai", **faults})
+                await asyncio.sleep(args.cooldown if name == "recovered" else args.window)
+                before = calls_by_model(prometheus_client)
+                latencies, served, errors = await run_scenario(model, args.calls)
+                sent = calls_by_model(prometheus_client)
+                sent.subtract(before)
+                p50 = percentile(latencies, 0.5) if latencies else float("nan")
+                p95 = percentile(latencies, 0.95) if latencies else float("nan")
+                provider_calls = {f"{model_name} {outcome}": int(n) for (model_name, outcome), n in sent.items() if n}
+                print(f"{name:>12} {p50:>7.2f} {p95:>7.2f} {errors:>6}  {dict(served)} / {provider_calls}")
+    finally:
+        await http.aclose()
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
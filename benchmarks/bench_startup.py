@@ -0,0 +1,141 @@
+"""
+Startup time of the backend.
+
+Prints the modules that take longest to import with `import app`
+(`python -X importtime`), then starts the server --runs times against
+`benchmarks/stub_servers.py` and reports, from process start:
+
+- ready: until `GET /` answers
+- first answer: until the first `/stream_agent` request has streamed its answer
+
+    python benchmarks/bench_startup.py --top 15 --runs 5
+    python benchmarks/bench_startup.py --server gunicorn --workers 4 --preload
+"""
+
+import argparse
+import asyncio
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from load_test import ROOT, percentile, start_process, wait_until_up  # noqa: E402
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_profile() -> list[tuple[str, int]]:
+    """Packages `import app` imports directly and their cumulative import time in microseconds."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, capture_output=True, text=True
+    ).stderr
+    # A module is listed after the modules it imports, indented one level less
+    packages: dict[str, int] = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, module = int(match.group(2)), len(match.group(3)) // 2, match.group(4)
+        if depth == 0 and module == "app":
+            packages["total"] = cumulative
+            break
+        if depth == 0:
+            # Imported at interpreter startup, along with what it listed
+            packages = {}
+        elif depth == 1:
+            package = module.split(".")[0]
+            packages[package] = packages.get(package, 0) + cumulative
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+async def first_answer(client: httpx.AsyncClient, app_url: str, agent_type: str):
+    body = {"input": "question", "thread_id": f"startup-{time.time_ns()}", "agent_type": agent_type}
+    async with client.stream(
+        "POST",
+        f"{app_url}/stream_agent",
+        json=body,
+        headers={"Authorization": "tvly-startup"},
+        timeout=60,
+    ) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_lines():
+            pass
+
+
+async def cold_start(args, stub_url: str) -> tuple[float, float]:
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    if args.server == "gunicorn":
+        command = ["-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app", "--log-level", "warning"]
+    else:
+        command = ["-m", "uvicorn", "app:app", "--port", str(args.app_port), "--log-level", "warning"]
+    started_at = time.perf_counter()
+    process = start_process(
+        command,
+        {
+            "PORT": str(args.app_port),
+            "WEB_CONCURRENCY": str(args.workers),
+            "PRELOAD": "on" if args.preload else "off",
+            "OPENAI_BASE_URL": f"{stub_url}/v1",
+            "OPENAI_API_KEY": "sk-stub",
+            "GROQ_BASE_URL": stub_url,
+            "GROQ_API_KEY": "stub",
+            "TAVILY_API_ENDPOINT": stub_url,
+            "TRACE_LOG_LEVEL": "WARNING",
+        },
+    )
+    try:
+        await wait_until_up(app_url)
+        ready = time.perf_counter() - started_at
+        async with httpx.AsyncClient() as client:
+            await first_answer(client, app_url, args.agent_type)
+        return ready, time.perf_counter() - started_at
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="Packages to list in the import profile")
+    parser.add_argument("--runs", type=int, default=5, help="Server starts to time")
+    parser.add_argument("--server", default="uvicorn", choices=["uvicorn", "gunicorn"])
+    parser.add_argument("--workers", type=int, default=1, help="WEB_CONCURRENCY, with --server gunicorn")
+    parser.add_argument("--preload", action="store_true", help="PRELOAD=on, with --server gunicorn")
+    parser.add_argument("--agent-type", default="fast", choices=["fast", "deep"])
+    parser.add_argument("--app-port", type=int, default=8182)
+    parser.add_argument("--stub-port", type=int, default=8192)
+    args = parser.parse_args()
+
+    profile = import_profile()
+    print(f"{'import app':>24} {'ms':>8}")
+    for package, microseconds in profile[: args.top + 1]:
+        print(f"{package:>24} {microseconds / 1000:>8.1f}")
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    stub = start_process(["benchmarks/stub_servers.py", "--port", str(args.stub_port), "--token-rate", "0"], {})
+    try:
+        await wait_until_up(stub_url)
+        ready, answered = [], []
+        for _ in range(args.runs):
+            run_ready, run_answered = await cold_start(args, stub_url)
+            ready.append(run_ready)
+            answered.append(run_answered)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    server = f"{args.server}, {args.workers} worker(s){', preloaded' if args.preload else ''}"
+    print(f"\n{server}, {args.runs} starts")
+    for label, samples in (("ready", ready), ("first answer", answered)):
+        print(
+            f"{label:>13} s   p50 {percentile(samples, 0.5):6.2f}  min {min(samples):6.2f}  max {max(samples):6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
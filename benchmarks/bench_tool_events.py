@@ -0,0 +1,122 @@
+"""
+Benchmark of the tool_end frame formats.
+
+Encodes the same search, extract and crawl outputs as the frames sent with
+protocol versions 1 and 2 (the whole output as a JSON string inside the
+frame) and version 3 (a compact frame with the sources, the full output
+kept for `GET /tool_output/{id}`), and reports bytes on the wire and encode
+time per frame.
+
+    python benchmarks/bench_tool_events.py --results 10 --page-size 20000 --runs 2000
+"""
+
+import argparse
+import json
+import random
+import string
+import sys
+import timeit
+from pathlib import Path
+
+from langchain_core.messages import ToolMessage
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from backend.tool_events import (  # noqa: E402
+    ToolOutputStore,
+    compact_tool_output,
+    encode_frame,
+    orjson,
+    parse_tool_output,
+)
+
+
+def make_text(size: int) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append("".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))))
+    return " ".join(words)[:size]
+
+
+def make_outputs(results: int, page_size: int) -> dict[str, ToolMessage]:
+    """ToolMessages shaped like the agent's search, extract and crawl outputs."""
+    random.seed(0)
+    urls = [f"https://example{i}.com/articles/{i}" for i in range(results)]
+    favicons = [f"https://example{i}.com/favicon.ico" for i in range(results)]
+    search = {
+        "query": "latest developments in battery chemistry",
+        "results": [
+            {
+                "url": url,
+                "title": make_text(60),
+                "content": make_text(800),
+                "score": random.random(),
+                "raw_content": make_text(page_size),
+                "favicon": favicon,
+                "published_date": "Mon, 12 Oct 2026 09:00:00 GMT",
+            }
+            for url, favicon in zip(urls, favicons)
+        ],
+        "response_time": 1.2,
+    }
+    extract = {"summary": make_text(4000), "urls": urls, "favicons": favicons}
+    crawl = {**extract, "base_url": "https://example0.com"}
+    return {
+        tool_type: ToolMessage(content=json.dumps(output), tool_call_id="call_0")
+        for tool_type, output in (("search", search), ("extract", extract), ("crawl", crawl))
+    }
+
+
+def current_frame(tool_type: str, output: ToolMessage) -> str:
+    # As app.py encodes tool_end for protocol versions 1 and 2
+    return (
+        json.dumps(
+            {
+                "type": "tool_end",
+                "tool_name": f"tavily_{tool_type}",
+                "tool_type": tool_type,
+                "operation_index": 0,
+                "content": str(output.content),
+            }
+        )
+        + "\n"
+    )
+
+
+def compact_frame(tool_type: str, output: ToolMessage, store: ToolOutputStore) -> str:
+    text, parsed = parse_tool_output(output)
+    return encode_frame(
+        {
+            "type": "tool_end",
+            "tool_name": f"tavily_{tool_type}",
+            "tool_type": tool_type,
+            "operation_index": 0,
+            "output_id": store.put(text, ""),
+            "content": compact_tool_output(tool_type, parsed),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=int, default=10, help="Results per search, URLs per extract and crawl")
+    parser.add_argument("--page-size", type=int, default=20000, help="Characters of raw content per search result")
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    outputs = make_outputs(args.results, args.page_size)
+    store = ToolOutputStore()
+    print(f"encoder: {'orjson' if orjson is not None else 'json'}, {args.runs} runs per frame\n")
+    print(f"{'tool':>8} {'format':>8} {'bytes':>10} {'us/frame':>10}")
+    for tool_type, output in outputs.items():
+        for name, encode in (
+            ("current", lambda: current_frame(tool_type, output)),
+            ("compact", lambda: compact_frame(tool_type, output, store)),
+        ):
+            size = len(encode().encode("utf-8"))
+            seconds = timeit.timeit(encode, number=args.runs) / args.runs
+            print(f"{tool_type:>8} {name:>8} {size:>10} {seconds * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
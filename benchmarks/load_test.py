@@ -0,0 +1,233 @@
+"""
+Load test of `/stream_agent` against local stand-ins of the upstream APIs.
+
+Starts `benchmarks/stub_servers.py` and the app (uvicorn, --workers
+processes) pointed at it, then drives --threads concurrent conversations of
+--turns messages each. Reports TTFB and total latency percentiles, requests
+per second, and per-worker event loop lag and RSS scraped from `/metrics`.
+
+    python benchmarks/load_test.py --threads 50 --turns 3 --agent-type fast
+    python benchmarks/load_test.py --workers 4 --token-rate 0 --protocol-version 2
+
+Pass --app-url to load an app that is already running (its upstream URLs
+must then point at a stub server you started yourself).
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+ROOT = Path(__file__).parent.parent
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{([^}]*)\})? (\S+)$')
+
+
+def percentile(samples: list[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def start_process(args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env={**os.environ, **env})
+
+
+async def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout}s")
+                await asyncio.sleep(0.2)
+
+
+async def drive(app_url: str, threads: int, turns: int, agent_type: str, protocol_version: int) -> dict:
+    ttfb: list[float] = []
+    totals: list[float] = []
+    errors = 0
+    rejected = 0
+
+    async def conversation(client: httpx.AsyncClient, thread_index: int):
+        nonlocal errors, rejected
+        thread_id = f"load-{os.getpid()}-{thread_index}"
+        for turn in range(turns):
+            body = {
+                "input": f"question {turn} of thread {thread_index}",
+                "thread_id": thread_id,
+                "agent_type": agent_type,
+                "protocol_version": protocol_version,
+            }
+            start = time.perf_counter()
+            first_byte: Optional[float] = None
+            answer = False
+            try:
+                async with client.stream(
+                    "POST",
+                    f"{app_url}/stream_agent",
+                    json=body,
+                    # One key per conversation, so the per-key admission limit doesn't cap the load
+                    headers={"Authorization": f"tvly-load-test-{thread_index}"},
+                ) as response:
+                    async for chunk in response.aiter_bytes():
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - start
+                        answer = answer or b'"chatbot"' in chunk
+                    if response.status_code == 429:
+                        rejected += 1
+                        continue
+                    if response.status_code != 200 or not answer:
+                        errors += 1
+                        continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            ttfb.append(first_byte * 1000)
+            totals.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=threads, max_keepalive_connections=threads)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[conversation(client, i) for i in range(threads)])
+        elapsed = time.perf_counter() - start
+
+    return {"ttfb": ttfb, "totals": totals, "errors": errors, "rejected": rejected, "elapsed": elapsed}
+
+
+def parse_metrics(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, labels or "")] = float(value)
+    return samples
+
+
+def histogram_quantile(samples: dict, name: str, q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-quantile, as Prometheus would approximate it."""
+    buckets = sorted(
+        (float(labels.split('"')[1]), count)
+        for (metric, labels), count in samples.items()
+        if metric == f"{name}_bucket"
+    )
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    target = q * buckets[-1][1]
+    return next(bound for bound, count in buckets if count >= target)
+
+
+async def scrape_workers(app_url: str, workers: int) -> list[dict]:
+    """Scrape /metrics until every worker answered once, telling workers apart by their start time."""
+    found = {}
+    async with httpx.AsyncClient() as client:
+        for _ in range(workers * 10):
+            # A new connection per scrape, so the requests spread over the workers
+            response = await client.get(f"{app_url}/metrics", headers={"Connection": "close"})
+            samples = parse_metrics(response.text)
+            found.setdefault(samples.get(("process_start_time_seconds", "")), samples)
+            if len(found) >= workers:
+                break
+    return list(found.values())
+
+
+def report(results: dict, workers: list[dict], threads: int, turns: int):
+    ttfb, totals = results["ttfb"], results["totals"]
+    print(
+        f"{threads} threads x {turns} turns, {len(totals)} ok, {results['rejected']} rejected (429),"
+        f" {results['errors']} failed in {results['elapsed']:.2f}s"
+    )
+    if totals:
+        print(f"requests/s  {len(totals) / results['elapsed']:8.2f}")
+        for label, samples in (("ttfb", ttfb), ("total", totals)):
+            print(
+                f"{label:>5} ms    p50 {percentile(samples, 0.50):8.1f}  p95 {percentile(samples, 0.95):8.1f}"
+                f"  p99 {percentile(samples, 0.99):8.1f}  max {max(samples):8.1f}"
+            )
+
+    print()
+    for index, samples in enumerate(workers):
+        rss = samples.get(("process_resident_memory_bytes", ""), 0) / 1024 / 1024
+        lag_p50 = histogram_quantile(samples, "tavily_chat_event_loop_lag_seconds", 0.50)
+        lag_p99 = histogram_quantile(samples, "tavily_chat_event_loop_lag_seconds", 0.99)
+        lag = (
+            f"loop lag p50 <= {lag_p50 * 1000:.0f} ms, p99 <= {lag_p99 * 1000:.0f} ms"
+            if lag_p99 is not None
+            else "loop lag n/a"
+        )
+        print(f"worker {index}: rss {rss:7.1f} MiB, {lag}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=20, help="Concurrent conversations")
+    parser.add_argument("--turns", type=int, default=3, help="Messages per conversation")
+    parser.add_argument("--agent-type", default="fast", choices=["fast", "deep"])
+    parser.add_argument("--protocol-version", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--app-url", help="Load an already running app instead of starting one")
+    parser.add_argument("--app-port", type=int, default=8180)
+    parser.add_argument("--stub-port", type=int, default=8190)
+    parser.add_argument("--token-rate", type=float, default=100.0, help="Stub model tokens per second, 0 for no delay")
+    parser.add_argument("--tavily-latency", type=float, default=0.3, help="Seconds per stub Tavily call")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="Tool calls the stub model makes per message")
+    args = parser.parse_args()
+
+    processes = []
+    app_url = args.app_url
+    try:
+        if app_url is None:
+            stub_url = f"http://127.0.0.1:{args.stub_port}"
+            processes.append(start_process(
+                [
+                    "benchmarks/stub_servers.py",
+                    "--port", str(args.stub_port),
+                    "--token-rate", str(args.token_rate),
+                    "--tavily-latency", str(args.tavily_latency),
+                    "--tool-rounds", str(args.tool_rounds),
+                ],
+                {},
+            ))
+            await wait_until_up(stub_url)
+
+            app_url = f"http://127.0.0.1:{args.app_port}"
+            processes.append(start_process(
+                [
+                    "-m", "uvicorn", "app:app",
+                    "--port", str(args.app_port),
+                    "--workers", str(args.workers),
+                    "--log-level", "warning",
+                ],
+                {
+                    "OPENAI_BASE_URL": f"{stub_url}/v1",
+                    "OPENAI_API_KEY": "sk-stub",
+                    "GROQ_BASE_URL": stub_url,
+                    "GROQ_API_KEY": "stub",
+                    "TAVILY_API_ENDPOINT": stub_url,
+                    "TRACE_LOG_LEVEL": "WARNING",
+                },
+            ))
+            await wait_until_up(app_url)
+
+        results = await drive(app_url, args.threads, args.turns, args.agent_type, args.protocol_version)
+        workers = await scrape_workers(app_url, args.workers)
+        report(results, workers, args.threads, args.turns)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,272 @@
+"""
+Local stand-ins for the upstream APIs, so `/stream_agent` can be load tested
+without paying for OpenAI, Groq or Tavily calls.
+
+One server answers:
+
+- OpenAI-compatible chat completions (`/v1/chat/completions`, and Groq's
+  `/openai/v1/chat/completions`), streamed at a configurable token rate.
+  While tools are offered and fewer than --tool-rounds tool results follow
+  the last user message, the model calls a tool (search, then extract);
+  otherwise it streams a "Final Answer: ..." reply.
+- Tavily `/search`, `/extract`, `/crawl` and `/authorize-use-case`.
+- `POST /stub/faults` to make one model provider ("openai" or "groq")
+  slow or failing while the server runs, e.g.
+  `{"provider": "openai", "latency": 5, "error_rate": 1, "status": 429}`.
+
+    python benchmarks/stub_servers.py --port 8090 --token-rate 100
+
+Point the app at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1 GROQ_BASE_URL=http://127.0.0.1:8090 \\
+    TAVILY_API_ENDPOINT=http://127.0.0.1:8090 OPENAI_API_KEY=sk-stub GROQ_API_KEY=stub \\
+    python app.py
+
+`benchmarks/load_test.py` does this for you.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+import random
+from dataclasses import asdict, dataclass, field
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class ProviderFaults:
+    # Extra seconds before a chat completion starts
+    latency: float = 0.0
+    # Fraction of chat completions answered with `status` instead
+    error_rate: float = 0.0
+    status: int = 429
+
+
+@dataclass
+class StubSettings:
+    token_rate: float = 100.0
+    first_token_delay: float = 0.2
+    answer_tokens: int = 80
+    tool_rounds: int = 1
+    tavily_latency: float = 0.3
+    page_chars: int = 4000
+    max_results: int = 5
+    faults: dict = field(default_factory=lambda: {"openai": ProviderFaults(), "groq": ProviderFaults()})
+
+
+settings = StubSettings()
+app = FastAPI()
+
+WORDS = "the quick brown fox jumps over a lazy dog while the agent streams its answer".split()
+
+
+def _answer_tokens(count: int) -> list[str]:
+    return ["Final Answer:"] + [f" {WORDS[i % len(WORDS)]}" for i in range(count)]
+
+
+def _next_tool_call(body: dict):
+    """Tool call the stub model makes for this request, or None to answer."""
+    tool_names = {tool["function"]["name"] for tool in body.get("tools") or []}
+    if not tool_names:
+        return None
+
+    messages = body.get("messages", [])
+    user_index = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    rounds = sum(1 for m in messages[user_index + 1:] if m.get("role") == "tool")
+    if rounds >= settings.tool_rounds:
+        return None
+
+    question = str(messages[user_index].get("content", "")) if user_index >= 0 else ""
+    if rounds % 2 == 1 and "tavily_extract" in tool_names:
+        name, args = "tavily_extract", {"urls": [f"https://example.com/page-{rounds}"]}
+    else:
+        name, args = "tavily_search", {"query": question[:200] or "latest news"}
+    return {
+        "id": f"call_{uuid.uuid4().hex[:12]}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args)},
+    }
+
+
+def _usage(body: dict, completion_tokens: int) -> dict:
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def _stream_completion(body: dict, tool_call):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "stub")
+    await asyncio.sleep(settings.first_token_delay)
+    yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+
+    if tool_call is not None:
+        yield _chunk(completion_id, model, {"tool_calls": [{"index": 0, **tool_call}]})
+        yield _chunk(completion_id, model, {}, "tool_calls")
+        completion_tokens = 20
+    else:
+        tokens = _answer_tokens(settings.answer_tokens)
+        for token in tokens:
+            if settings.token_rate > 0:
+                await asyncio.sleep(1 / settings.token_rate)
+            yield _chunk(completion_id, model, {"content": token})
+        yield _chunk(completion_id, model, {}, "stop")
+        completion_tokens = len(tokens)
+
+    if (body.get("stream_options") or {}).get("include_usage"):
+        usage = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [],
+            "usage": _usage(body, completion_tokens),
+        }
+        yield f"data: {json.dumps(usage)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    faults = settings.faults["groq" if request.url.path.startswith("/openai/") else "openai"]
+    if faults.latency > 0:
+        await asyncio.sleep(faults.latency)
+    if random.random() < faults.error_rate:
+        message = "Rate limit reached (stub)" if faults.status == 429 else "Upstream error (stub)"
+        return JSONResponse({"error": {"message": message, "type": "stub_fault"}}, status_code=faults.status)
+    tool_call = _next_tool_call(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream_completion(body, tool_call), media_type="text/event-stream")
+
+    tokens = [] if tool_call else _answer_tokens(settings.answer_tokens)
+    delay = settings.first_token_delay + (len(tokens) / settings.token_rate if settings.token_rate > 0 else 0)
+    await asyncio.sleep(delay)
+    message = {"role": "assistant", "content": "".join(tokens) or None}
+    if tool_call:
+        message["tool_calls"] = [tool_call]
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_call else "stop"}],
+        "usage": _usage(body, max(len(tokens), 20)),
+    }
+
+
+def _page(url: str) -> dict:
+    text = " ".join(WORDS)
+    return {
+        "url": url,
+        "raw_content": (text + ". ") * (settings.page_chars // (len(text) + 2) + 1),
+        "favicon": "https://example.com/favicon.ico",
+    }
+
+
+@app.post("/search")
+async def search(request: Request):
+    body = await request.json()
+    await asyncio.sleep(settings.tavily_latency)
+    count = min(int(body.get("max_results") or settings.max_results), settings.max_results)
+    return {
+        "query": body.get("query", ""),
+        "results": [
+            {
+                "url": f"https://example.com/page-{i}",
+                "title": f"Result {i}",
+                "content": " ".join(WORDS),
+                "score": 1 - i / 10,
+                "favicon": "https://example.com/favicon.ico",
+            }
+            for i in range(count)
+        ],
+        "response_time": settings.tavily_latency,
+    }
+
+
+@app.post("/extract")
+async def extract(request: Request):
+    body = await request.json()
+    await asyncio.sleep(settings.tavily_latency)
+    urls = body.get("urls") or []
+    if isinstance(urls, str):
+        urls = [urls]
+    return {"results": [_page(url) for url in urls], "failed_results": []}
+
+
+@app.post("/crawl")
+async def crawl(request: Request):
+    body = await request.json()
+    await asyncio.sleep(settings.tavily_latency)
+    base_url = str(body.get("url", "https://example.com")).rstrip("/")
+    count = min(int(body.get("limit") or settings.max_results), settings.max_results)
+    return {"base_url": base_url, "results": [_page(f"{base_url}/{i}") for i in range(count)]}
+
+
+@app.post("/stub/faults")
+async def set_faults(request: Request):
+    body = await request.json()
+    faults = settings.faults[body["provider"]]
+    for name in ("latency", "error_rate", "status"):
+        if name in body:
+            setattr(faults, name, type(getattr(faults, name))(body[name]))
+    return asdict(faults)
+
+
+@app.post("/authorize-use-case")
+async def authorize_use_case():
+    return {"success": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--token-rate", type=float, default=settings.token_rate, help="Streamed tokens per second, 0 for no delay")
+    parser.add_argument("--first-token-delay", type=float, default=settings.first_token_delay, help="Seconds before the first chunk")
+    parser.add_argument("--answer-tokens", type=int, default=settings.answer_tokens)
+    parser.add_argument("--tool-rounds", type=int, default=settings.tool_rounds, help="Tool calls per user message")
+    parser.add_argument("--tavily-latency", type=float, default=settings.tavily_latency, help="Seconds per Tavily call")
+    parser.add_argument("--page-chars", type=int, default=settings.page_chars, help="Raw content size of extracted pages")
+    for provider in ("openai", "groq"):
+        parser.add_argument(f"--{provider}-latency", type=float, default=0.0, help=f"Extra seconds before each {provider} completion")
+        parser.add_argument(f"--{provider}-error-rate", type=float, default=0.0, help=f"Fraction of {provider} completions that fail")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of failed completions")
+    args = parser.parse_args()
+
+    settings.token_rate = args.token_rate
+    settings.first_token_delay = args.first_token_delay
+    settings.answer_tokens = args.answer_tokens
+    settings.tool_rounds = args.tool_rounds
+    settings.tavily_latency = args.tavily_latency
+    settings.page_chars = args.page_chars
+    for provider, faults in settings.faults.items():
+        faults.latency = getattr(args, f"{provider}_latency")
+        faults.error_rate = getattr(args, f"{provider}_error_rate")
+        faults.status = args.error_status
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
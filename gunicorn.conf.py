@@ -0,0 +1,70 @@
+"""
+Production server: `gunicorn -c gunicorn.conf.py app:app`.
+
+Runs WEB_CONCURRENCY uvicorn worker processes. With PRELOAD=on the app and
+the SDKs of the models in use are imported once in the master process and
+shared by the forked workers, so workers start, and restart, faster.
+
+Conversations are shared by the workers only with CHECKPOINTER=sqlite, so
+the default is one worker per CPU with it and a single worker otherwise.
+Resumable runs, stored tool outputs, the answer cache and prefetch budgets
+are per worker whatever the checkpointer; with several workers, resuming a
+run and fetching a tool output need sticky routing to the same worker.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+# Conversations kept in memory are per worker, and requests aren't routed by thread
+shared_checkpoints = os.getenv("CHECKPOINTER", "bounded") == "sqlite"
+workers = int(os.getenv("WEB_CONCURRENCY") or (multiprocessing.cpu_count() if shared_checkpoints else 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("PRELOAD", "off") == "on"
+# Agent runs stream for minutes; a worker is only killed when its event loop stops answering
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Metrics directory created for this run, removed on exit
+_metrics_dir = None
+if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    # Each worker writes its metrics here and /metrics serves them combined;
+    # must be set before prometheus_client is imported
+    _metrics_dir = tempfile.mkdtemp(prefix="tavily-chat-metrics-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = _metrics_dir
+
+
+def on_starting(server):
+    if workers > 1 and not shared_checkpoints:
+        server.log.warning(
+            "%d workers with in-memory conversations: a thread's next message may reach a worker that "
+            "doesn't know it. Set CHECKPOINTER=sqlite or WEB_CONCURRENCY=1.",
+            workers,
+        )
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Drop the metrics of a previous run
+        Path(metrics_dir).mkdir(parents=True, exist_ok=True)
+        for path in Path(metrics_dir).glob("*.db"):
+            path.unlink()
+    if preload_app:
+        import app
+        from backend.models import import_providers
+
+        import_providers(app.models_in_use())
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if _metrics_dir:
+        shutil.rmtree(_metrics_dir, ignore_errors=True)
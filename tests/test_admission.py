@@ -0,0 +1,25 @@
+import asyncio
+
+from backend.admission import AdmissionController
+from backend.replay import RunRegistry
+
+
+def test_slot_is_released_when_the_run_is_cancelled_before_it_starts():
+    async def main():
+        admission = AdmissionController(max_active=1, max_wait=0.1)
+        registry = RunRegistry()
+        slot = await admission.acquire("tvly-key", "fast")
+
+        async def frames():
+            yield '{"type": "chatbot", "content": "never sent"}\n'
+
+        buffer = registry.start("thread", "tvly-key", frames(), on_finish=slot.release)
+        # Cancels the run task before its first step
+        await registry.aclose()
+        await asyncio.sleep(0)
+
+        assert buffer.done
+        assert admission.active == 0
+        await admission.acquire("tvly-key", "fast")
+
+    asyncio.run(main())
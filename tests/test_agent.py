@@ -0,0 +1,27 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from backend.agent import WebAgent
+from backend.prompts import SIMPLE_PROMPT
+
+
+class FakeModel(FakeMessagesListChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def test_recorded_answer_leaves_no_step_pending():
+    async def main():
+        agent = WebAgent(checkpointer=MemorySaver())
+        model = FakeModel(responses=[AIMessage(content="Final Answer: Paris")])
+        graph = agent.get_graph(agent_type="fast", llm=model, prompt=SIMPLE_PROMPT, summary_llm=model)
+        config = WebAgent.run_config(thread_id="thread", api_key="tvly-key", user_message="capital of France?")
+        await agent.record_answer(graph, config, "capital of France?", "Paris")
+        state = await graph.aget_state(config)
+        assert state.next == ()
+        assert [message.content for message in state.values["messages"]] == ["capital of France?", "Paris"]
+
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+import pytest
+from langchain_core.messages import ToolMessage
+
+from backend.answer_cache import AnswerCache
+from backend.tool_events import ToolFrameEncoder, ToolOutputStore
+
+KEY_HASH = "key"
+QUESTION = "What is the capital of France?"
+OUTPUT = json.dumps({"results": [{"url": "https://a.com", "title": "Paris", "content": "x" * 5000}]})
+
+
+async def collect(frames) -> list[dict]:
+    return [json.loads(frame) async for frame in frames]
+
+
+async def run(tool_frames: ToolFrameEncoder):
+    """The frames of a run with one search, as `event_generator` yields them."""
+    tool_input = {"query": "capital of France", "topic": "general"}
+    yield tool_frames.frame(
+        {"type": "tool_start", "tool_name": "tavily_search", "tool_type": "search", "operation_index": 0, "content": tool_input}
+    )
+    output = ToolMessage(OUTPUT, tool_call_id="call_0")
+    yield tool_frames.frame(
+        {"type": "tool_end", "tool_name": "tavily_search", "tool_type": "search", "operation_index": 0, "output": output}
+    )
+    yield json.dumps({"type": "chatbot", "content": "Paris"}) + "\n"
+
+
+@pytest.mark.parametrize("recorded_version, replayed_version", [(1, 3), (3, 1), (3, 3)])
+def test_replay_encodes_tool_frames_for_the_client(recorded_version, replayed_version):
+    async def record_and_replay():
+        cache = AnswerCache()
+        store = ToolOutputStore()
+        tool_frames = ToolFrameEncoder(recorded_version, store, KEY_HASH)
+        await collect(cache.record(QUESTION, run(tool_frames), tool_frames))
+        replay_store = ToolOutputStore()
+        replayed = await collect(cache.replay(cache.lookup(QUESTION), ToolFrameEncoder(replayed_version, replay_store, KEY_HASH)))
+        return replayed, replay_store
+
+    replayed, replay_store = asyncio.run(record_and_replay())
+    tool_end = next(frame for frame in replayed if frame["type"] == "tool_end")
+    if replayed_version >= 3:
+        assert len(tool_end["content"]["results"][0]["content"]) < 5000
+        # A new ID in the replaying client's store, not the recording run's
+        assert replay_store.get(tool_end["output_id"], KEY_HASH).decode("utf-8") == OUTPUT
+    else:
+        assert "output_id" not in tool_end
+        assert tool_end["content"] == OUTPUT
+    assert "".join(frame["content"] for frame in replayed if frame["type"] == "chatbot") == "Paris"
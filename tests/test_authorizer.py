@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.utils import ApiKeyAuthorizer, AuthorizationError
+
+
+class AuthEndpoint:
+    """Stands in for the Tavily authorization endpoint, counting requests."""
+
+    def __init__(self, status: int = 200, body: bytes = b'{"success": true}', delay: float = 0.0):
+        self.status = status
+        self.body = body
+        self.delay = delay
+        self.requests = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return httpx.Response(self.status, content=self.body)
+
+    def authorizer(self, **kwargs) -> ApiKeyAuthorizer:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self))
+        return ApiKeyAuthorizer(client=client, endpoint="http://auth", **kwargs)
+
+
+def test_authorized_key_is_cached():
+    async def main():
+        endpoint = AuthEndpoint()
+        authorizer = endpoint.authorizer()
+        assert await authorizer.check("tvly-key") and await authorizer.check("tvly-key")
+        assert endpoint.requests == 1
+        assert authorizer.stats["hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_cached_key_is_checked_again_after_its_ttl():
+    async def main():
+        endpoint = AuthEndpoint()
+        authorizer = endpoint.authorizer(ttl=0.01)
+        await authorizer.check("tvly-key")
+        await asyncio.sleep(0.02)
+        await authorizer.check("tvly-key")
+        assert endpoint.requests == 2
+
+    asyncio.run(main())
+
+
+def test_concurrent_checks_share_one_request():
+    async def main():
+        endpoint = AuthEndpoint(delay=0.05)
+        authorizer = endpoint.authorizer()
+        assert all(await asyncio.gather(*(authorizer.check("tvly-key") for _ in range(10))))
+        assert endpoint.requests == 1
+        assert authorizer.stats["coalesced"] == 9
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("body", [b"", b"<html>bad gateway</html>"])
+def test_malformed_response_is_a_401_that_is_not_cached(body):
+    async def main():
+        endpoint = AuthEndpoint(body=body)
+        authorizer = endpoint.authorizer()
+        for _ in range(2):
+            with pytest.raises(AuthorizationError) as error:
+                await authorizer.check("tvly-key")
+            assert error.value.status_code == 401
+        assert endpoint.requests == 2
+
+    asyncio.run(main())
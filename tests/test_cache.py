@@ -0,0 +1,22 @@
+import asyncio
+
+from backend.cache import InMemoryLRUBackend
+
+
+def test_memory_backend_evicts_least_recently_used_by_size():
+    async def main():
+        backend = InMemoryLRUBackend(max_bytes=2500)
+        page = {"raw_content": "x" * 1000}
+        await backend.set("a", page, ttl=60)
+        await backend.set("b", page, ttl=60)
+        await backend.get("a")
+        await backend.set("c", page, ttl=60)
+        assert await backend.get("b") is None
+        assert await backend.get("a") == page and await backend.get("c") == page
+        assert backend.size <= backend.max_bytes
+
+        await backend.set("huge", {"raw_content": "x" * 5000}, ttl=60)
+        assert await backend.get("huge") is None
+        assert await backend.get("a") == page
+
+    asyncio.run(main())
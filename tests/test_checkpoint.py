@@ -0,0 +1,31 @@
+from langgraph.checkpoint.base import empty_checkpoint
+from prometheus_client import REGISTRY
+
+from backend.checkpoint import BoundedMemorySaver
+
+
+def save(saver: BoundedMemorySaver, thread_id: str, content: str):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": content}
+    checkpoint["channel_versions"] = {"messages": 1}
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saver.put(config, checkpoint, {}, {"messages": 1})
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_thread_sizes_and_evictions_are_exported():
+    evictions = sample("tavily_chat_checkpoint_evictions_total", reason="memory")
+    saver = BoundedMemorySaver(max_bytes=25000, idle_ttl=None)
+    save(saver, "a", "x" * 10000)
+    save(saver, "b", "x" * 10000)
+    assert sample("tavily_chat_checkpoint_threads") == 2
+    assert sample("tavily_chat_checkpoint_bytes") == saver.total_bytes > 20000
+
+    save(saver, "c", "x" * 10000)
+    assert saver.get_tuple({"configurable": {"thread_id": "a", "checkpoint_ns": ""}}) is None
+    assert sample("tavily_chat_checkpoint_threads") == 2
+    assert sample("tavily_chat_checkpoint_bytes") == saver.total_bytes <= saver.max_bytes
+    assert sample("tavily_chat_checkpoint_evictions_total", reason="memory") == evictions + 1
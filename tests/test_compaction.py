@@ -0,0 +1,34 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from backend.compaction import COMPACTED_KEY, create_history_compactor
+
+
+def conversation(result_sizes: list[int]) -> list:
+    """One search turn per entry, its tool result `size` characters long."""
+    messages = []
+    for turn, size in enumerate(result_sizes):
+        content = '{"results": [{"url": "https://a.com", "title": "T", "content": "%s"}]}' % ("x" * size)
+        messages += [
+            HumanMessage(f"question {turn}", id=f"human-{turn}"),
+            AIMessage("", tool_calls=[{"name": "tavily_search", "args": {"query": "q"}, "id": f"call-{turn}"}], id=f"ai-{turn}"),
+            ToolMessage(content, tool_call_id=f"call-{turn}", name="tavily_search", id=f"tool-{turn}"),
+            AIMessage("the answer " * 20, id=f"answer-{turn}"),
+        ]
+    return messages
+
+
+def turns(messages: list) -> list[str]:
+    return [message.content for message in messages if isinstance(message, HumanMessage)]
+
+
+def test_old_turns_are_left_out_of_the_model_input_not_the_state():
+    update = create_history_compactor(300)({"messages": conversation([3000, 3000, 3000, 100, 100])})
+    assert turns(update["llm_input_messages"]) == ["question 3", "question 4"]
+    # Only digests replace state messages; nothing is removed from the checkpoint
+    assert [message.id for message in update["messages"]] == ["tool-0", "tool-1", "tool-2"]
+    assert all(message.additional_kwargs[COMPACTED_KEY] for message in update["messages"])
+
+
+def test_no_turns_are_left_out_when_the_recent_turns_are_over_budget():
+    update = create_history_compactor(2000)({"messages": conversation([300, 300, 300, 4000, 4000])})
+    assert turns(update["llm_input_messages"]) == [f"question {turn}" for turn in range(5)]
@@ -0,0 +1,19 @@
+import sys
+
+from backend.http_clients import HttpClientRegistry
+from backend.models import create_models
+
+
+def test_preloading_the_fast_agent_leaves_groq_unimported(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.delitem(sys.modules, "langchain_groq", raising=False)
+    create_models(HttpClientRegistry(), preload=["nano"])
+    assert "langchain_groq" not in sys.modules
+
+
+def test_alternatives_of_uninstalled_providers_are_left_out(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    # None in sys.modules makes the package unimportable
+    monkeypatch.setitem(sys.modules, "langchain_groq", None)
+    models = create_models(HttpClientRegistry(), preload=["nano"])
+    assert [route.name for route in models["nano"].bound.routes] == ["gpt-4.1-nano"]
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from backend.prefetch import Prefetcher, api_key_of
+
+
+def run_config(api_key: str) -> dict:
+    return {"configurable": {"api_key": api_key, "user_message": "q"}}
+
+
+SEARCH_RESULT = {"results": [{"url": f"https://example.com/{i}", "score": 1 - i / 10} for i in range(3)]}
+
+
+def test_budget_is_per_api_key():
+    async def main():
+        prefetcher = Prefetcher(top_k=3, credit_share=0.5)
+        extracted = []
+
+        async def extract(urls, config):
+            extracted.append(config["configurable"]["api_key"])
+
+        # Plenty of foreground spend, but on another key
+        prefetcher.record_credits(100, api_key_of(run_config("tvly-heavy")))
+        prefetcher.schedule(SEARCH_RESULT, run_config("tvly-new"), extract, depth="advanced")
+        await asyncio.sleep(0)
+        assert extracted == []
+
+        prefetcher.schedule(SEARCH_RESULT, run_config("tvly-heavy"), extract, depth="advanced")
+        await asyncio.sleep(0)
+        assert extracted == ["tvly-heavy"]
+        await prefetcher.aclose()
+
+    asyncio.run(main())
+
+
+def test_keys_that_stopped_spending_are_forgotten():
+    prefetcher = Prefetcher(window=0.01)
+    for index in range(100):
+        prefetcher.record_credits(1, api_key_of(run_config(f"tvly-{index}")))
+    time.sleep(0.02)
+    prefetcher.record_credits(1, api_key_of(run_config("tvly-new")))
+    assert len(prefetcher._spend) == 1
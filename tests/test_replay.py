@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from backend.replay import FramesEvicted, RunBuffer, RunRegistry
+
+
+def frame(index: int) -> str:
+    return json.dumps({"type": "chatbot", "content": str(index)}) + "\n"
+
+
+def test_slow_follower_gets_every_frame():
+    async def main():
+        buffer = RunBuffer("thread", "run", "key", max_bytes=200)
+        token = buffer.attach()
+
+        async def produce():
+            for index in range(200):
+                await buffer.append(frame(index))
+            buffer.finish()
+
+        producer = asyncio.create_task(produce())
+        received = []
+        async for line in buffer.follow(token):
+            received.append(json.loads(line)["seq"])
+            await asyncio.sleep(0)
+        await producer
+        assert received == list(range(1, 201))
+
+    asyncio.run(main())
+
+
+def test_frames_are_dropped_once_no_follower_needs_them():
+    async def main():
+        buffer = RunBuffer("thread", "run", "key", max_bytes=200)
+        for index in range(50):
+            await buffer.append(frame(index))
+        assert buffer.first_seq > 1
+        with pytest.raises(FramesEvicted):
+            buffer.check_available(0)
+
+    asyncio.run(main())
+
+
+def test_a_failed_run_ends_with_an_error_frame():
+    async def main():
+        registry = RunRegistry()
+
+        async def frames():
+            yield frame(0)
+            raise RuntimeError("model unavailable")
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        buffer = registry.start("thread", "key", frames())
+        received = [json.loads(line) async for line in registry.stream(buffer, receive)]
+        resumed = [json.loads(line) async for line in registry.stream(registry.get("thread", buffer.run_id, "key"), receive, 1)]
+        await registry.aclose()
+        return received, resumed
+
+    received, resumed = asyncio.run(main())
+    assert [line["type"] for line in received] == ["chatbot", "error"]
+    assert received[-1]["code"] == "run_failed"
+    assert resumed == received[1:]
@@ -0,0 +1,55 @@
+import asyncio
+
+from backend.routing import ModelRouter, Route
+
+
+class FakeModel:
+    def __init__(self, answer: str, delay: float = 0.0):
+        self.answer = answer
+        self.delay = delay
+        self.calls = 0
+
+    async def astream(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        yield self.answer
+
+
+def missing_sdk():
+    raise ModuleNotFoundError("No module named 'langchain_groq'")
+
+
+def stream(route: Route):
+    return route.model.astream()
+
+
+async def answer(router: ModelRouter, routes: list[Route]) -> list[str]:
+    return [chunk async for chunk in router.astream(routes, stream)]
+
+
+def test_a_hedge_that_cannot_start_leaves_the_slow_call_running():
+    slow = FakeModel("from nano", delay=0.2)
+    router = ModelRouter(first_token_deadline=0.05, hedge_across_providers=True)
+    routes = [Route("nano", "openai", lambda: slow), Route("kimik2", "groq", missing_sdk)]
+    assert asyncio.run(answer(router, routes)) == ["from nano"]
+    assert router.breakers["groq"].failures == 1
+    assert router.breakers["openai"].failures == 0
+
+
+def test_a_model_that_cannot_be_built_fails_over():
+    fallback = FakeModel("from nano")
+    router = ModelRouter()
+    routes = [Route("kimik2", "groq", missing_sdk), Route("nano", "openai", lambda: fallback)]
+    assert asyncio.run(answer(router, routes)) == ["from nano"]
+    assert router.breakers["groq"].failures == 1
+
+
+def test_slow_calls_are_not_hedged_on_another_provider_by_default():
+    slow, other = FakeModel("from nano", delay=0.2), FakeModel("from kimik2")
+    router = ModelRouter(first_token_deadline=0.05)
+    routes = [Route("nano", "openai", lambda: slow), Route("kimik2", "groq", lambda: other)]
+    assert asyncio.run(answer(router, routes)) == ["from nano"]
+    assert other.calls == 0
+
+    router = ModelRouter(first_token_deadline=0.05, hedge_across_providers=True)
+    assert asyncio.run(answer(router, routes)) == ["from kimik2"]
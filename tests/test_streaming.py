@@ -0,0 +1,189 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from backend.agent import end_at_final_answer
+from backend.streaming import AgentAnswerStream, ChatbotFramer, extract_final_answer, is_agent_model_event
+
+
+def model_call(node: str, step: int, text: str, chunk_size: int, tool_call: bool = False) -> list[dict]:
+    """The `astream_events` events of one streamed model call, as LangGraph emits them."""
+    run_id = str(uuid.uuid4())
+    metadata = {"langgraph_node": node, "langgraph_step": step}
+    events = [
+        {
+            "event": "on_chat_model_stream",
+            "run_id": run_id,
+            "metadata": metadata,
+            "data": {"chunk": AIMessageChunk(content=text[i:i + chunk_size])},
+        }
+        for i in range(0, len(text), chunk_size)
+    ]
+    tool_calls = []
+    if tool_call:
+        # Tool call chunks follow the text, as OpenAI streams them
+        events.append(
+            {
+                "event": "on_chat_model_stream",
+                "run_id": run_id,
+                "metadata": metadata,
+                "data": {
+                    "chunk": AIMessageChunk(
+                        content="",
+                        tool_call_chunks=[{"name": "tavily_search", "args": '{"query": "q"}', "id": "call_0", "index": 0}],
+                    )
+                },
+            }
+        )
+        tool_calls = [{"name": "tavily_search", "args": {"query": "q"}, "id": "call_0"}]
+    events.append(
+        {
+            "event": "on_chat_model_end",
+            "run_id": run_id,
+            "metadata": metadata,
+            "data": {"output": AIMessage(content=text, tool_calls=tool_calls)},
+        }
+    )
+    return events
+
+
+def tool_call(name: str, step: int) -> list[dict]:
+    metadata = {"langgraph_node": "tools", "langgraph_step": step}
+    return [
+        {"event": "on_tool_start", "name": name, "run_id": str(uuid.uuid4()), "metadata": metadata, "data": {}},
+        {"event": "on_tool_end", "name": name, "run_id": str(uuid.uuid4()), "metadata": metadata, "data": {}},
+    ]
+
+
+def buffered_answer(events: list[dict]) -> str:
+    """The answer as `ANSWER_STREAMING=buffered` sends it: the filtered text of the last agent step."""
+    steps: dict[int, str] = {}
+    for event in events:
+        if event["event"] == "on_chat_model_stream" and is_agent_model_event(event):
+            step = event["metadata"]["langgraph_step"]
+            steps[step] = steps.get(step, "") + event["data"]["chunk"].content
+    return extract_final_answer(steps[max(steps)]) if steps else ""
+
+
+def streamed_answer(events: list[dict]) -> str:
+    stream = AgentAnswerStream()
+    released = "".join(stream.feed(event) for event in events)
+    return released + stream.finish()
+
+
+SUMMARY = "Final Answer: the quick brown fox jumps over a lazy dog while"
+ANSWERS = [
+    "Final Answer: the quick brown fox jumps over a lazy dog while",
+    "Let me think about this.\nThought: I know the answer.\nFinal Answer: 42\n",
+    "Sure.\n\nFinal Answer: The answer is 42.",
+    "Paris is the capital of France.\nIt lies on the Seine.",
+    "Thought: I now know the final answer\nFinal Answer: Line one\nLine two\n\nObservation: ignored",
+    "Thought: no marker follows\nParis.",
+    "  Final Answer:   padded  \n",
+]
+CHUNK_SIZES = [1, 3, 7, 1000]
+
+
+def traces(answer: str, chunk_size: int) -> dict[str, list[dict]]:
+    return {
+        "answer only": model_call("agent", 1, answer, chunk_size),
+        # The search and extract rounds of `benchmarks/stub_servers.py --tool-rounds 2`
+        "extract summary in the tools step": [
+            *model_call("agent", 1, "", chunk_size, tool_call=True),
+            *tool_call("tavily_search", 2),
+            *model_call("agent", 3, "", chunk_size, tool_call=True),
+            {"event": "on_tool_start", "name": "tavily_extract", "run_id": "t", "metadata": {}, "data": {}},
+            *model_call("tools", 4, SUMMARY, chunk_size),
+            {"event": "on_tool_end", "name": "tavily_extract", "run_id": "t", "metadata": {}, "data": {}},
+            *model_call("agent", 5, answer, chunk_size),
+        ],
+        "text before tool call chunks": [
+            *model_call("agent", 1, "I will search for this.", chunk_size, tool_call=True),
+            *tool_call("tavily_search", 2),
+            *model_call("agent", 3, "Thought: I need the page.\nAction: tavily_extract\n", chunk_size, tool_call=True),
+            *tool_call("tavily_extract", 4),
+            *model_call("agent", 5, answer, chunk_size),
+        ],
+        # `end_at_final_answer` drops the tool calls, so this step ends the run
+        "tool calls alongside a final answer": [
+            *model_call("agent", 1, "Thought: searching.", chunk_size, tool_call=True),
+            *tool_call("tavily_search", 2),
+            *model_call("agent", 3, "Final Answer: " + answer, chunk_size, tool_call=True),
+        ],
+        "compaction summary before the agent": [
+            *model_call("pre_model_hook", 1, "Final Answer: digest of earlier turns", chunk_size),
+            *model_call("agent", 2, answer, chunk_size),
+        ],
+    }
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_streamed_answer_equals_buffered_answer(answer, chunk_size):
+    for name, events in traces(answer, chunk_size).items():
+        assert streamed_answer(events) == buffered_answer(events), name
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Let me think about this.\nThought: I know the answer.\nFinal Answer: 42\n", "42"),
+        ("Sure.\n\nFinal Answer: The answer is 42.", "The answer is 42."),
+    ],
+)
+def test_preamble_is_not_released_before_the_answer(text, expected):
+    stream = AgentAnswerStream()
+    released = [stream.feed(event) for event in model_call("agent", 1, text, 1)]
+    assert "".join(released) == expected
+    assert "Sure" not in "".join(released) and "think" not in "".join(released)
+
+
+def test_answer_streams_before_the_step_ends():
+    events = model_call("agent", 1, "Final Answer: the quick brown fox jumps", 4)
+    stream = AgentAnswerStream()
+    released_early = "".join(stream.feed(event) for event in events[:-1])
+    assert released_early.startswith("the quick brown fox")
+
+
+def test_final_answer_drops_tool_calls():
+    tool_calls = [{"name": "tavily_search", "args": {"query": "q"}, "id": "call_0"}]
+    message = AIMessage(
+        content="Final Answer: 42",
+        tool_calls=tool_calls,
+        additional_kwargs={"tool_calls": [{"id": "call_0"}]},
+        id="run-0",
+    )
+    update = end_at_final_answer({"messages": [message]})
+    assert update["messages"][0].id == "run-0"
+    assert update["messages"][0].tool_calls == []
+    assert "tool_calls" not in update["messages"][0].additional_kwargs
+
+    thinking = AIMessage(content="Thought: I should search.", tool_calls=tool_calls)
+    assert end_at_final_answer({"messages": [thinking]}) == {}
+
+
+def test_buffered_text_is_flushed_while_the_source_stalls():
+    async def main():
+        framer = ChatbotFramer(protocol_version=2, max_delay=0.05)
+
+        async def stalled_model():
+            yield "Paris"
+            await asyncio.sleep(1.0)
+            yield " is the capital."
+
+        sent = []
+        started_at = time.monotonic()
+        async for text in framer.paced(stalled_model()):
+            if text is None:
+                sent.extend((time.monotonic() - started_at, frame) for frame in framer.flush())
+                break
+            framer.frames(text)
+        return sent
+
+    sent = asyncio.run(main())
+    assert [json.loads(frame)["content"] for _, frame in sent] == ["Paris"]
+    assert sent[0][0] < 0.5
@@ -0,0 +1,50 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from backend.summarizer import create_async_output_summarizer
+
+MERGE_MARKER = "Partial summaries:"
+
+
+class FakeModel:
+    """Summarizes chunks in `chunk_seconds` and records the merge prompts."""
+
+    def __init__(self, chunk_seconds: float = 0.0, chunk_summary: str = "summary"):
+        self.chunk_seconds = chunk_seconds
+        self.chunk_summary = chunk_summary
+        self.merge_prompts = []
+
+    async def ainvoke(self, prompt: str):
+        if MERGE_MARKER in prompt:
+            self.merge_prompts.append(prompt)
+            return SimpleNamespace(content="merged")
+        await asyncio.sleep(self.chunk_seconds)
+        return SimpleNamespace(content=self.chunk_summary)
+
+
+def extract_output(size: int) -> str:
+    text = "\n\n".join("Sentence %d of the page." % i for i in range(size // 25))
+    return json.dumps({"results": [{"url": "https://a.com", "raw_content": text}]})
+
+
+def summarize(model: FakeModel, output: str) -> dict:
+    summarizer = create_async_output_summarizer(
+        model, asyncio.Semaphore(4), timeout=0.05, chunk_size=500, merge_budget=1000
+    )
+    return asyncio.run(summarizer(output, "question"))
+
+
+def test_raw_fallback_chunks_are_truncated_to_the_merge_budget():
+    model = FakeModel(chunk_seconds=1.0)
+    result = summarize(model, extract_output(5000))
+    assert result["summary"] == "Source: https://a.com\nmerged"
+    content = model.merge_prompts[0].split(MERGE_MARKER)[1].split("Merged summary:")[0]
+    assert len(content.strip()) <= 1000
+
+
+def test_summaries_over_the_merge_budget_are_returned_unmerged():
+    model = FakeModel(chunk_summary="s" * 300)
+    result = summarize(model, extract_output(5000))
+    assert model.merge_prompts == []
+    assert result["summary"].count("s" * 300) >= 4
@@ -0,0 +1,10 @@
+from backend.tool_events import ToolOutputStore
+from backend.utils import hash_api_key
+
+
+def test_outputs_are_only_fetched_with_the_runs_api_key():
+    store = ToolOutputStore()
+    output_id = store.put('{"results": []}', hash_api_key("tvly-owner"))
+    assert store.get(output_id, hash_api_key("tvly-owner")) == b'{"results": []}'
+    assert store.get(output_id, hash_api_key("tvly-other")) is None
+    assert store.get(output_id, hash_api_key(None)) is None
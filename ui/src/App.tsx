@@ -136,6 +136,8 @@ function App() {
           input: query,
           thread_id: threadId || id,
           agent_type: selectedAgentType,
+          // Coalesced answer chunks and compact tool_end frames
+          protocol_version: 3,
         }),
       });
 
@@ -223,8 +225,14 @@ function App() {
               const orderedOps = lastMessage.response.toolOperations.orderedOperations;
               const lastOperation = orderedOps.length > 0 ? orderedOps[orderedOps.length - 1] : null;
               
-              // If the last operation is active and of the same type, replace it
-              if (lastOperation && lastOperation.status === "active" && lastOperation.type === toolType) {
+              // If the last operation is the same active operation, replace it. Tool calls
+              // can run in parallel, so distinct indexes are kept as separate operations.
+              if (
+                lastOperation &&
+                lastOperation.status === "active" &&
+                lastOperation.type === toolType &&
+                (message.operation_index === undefined || lastOperation.index === operationIndex)
+              ) {
                 lastOperation.data = operationData;
                 lastOperation.status = "active";
                 // console.log(`Replaced last active operation: ${toolType} ${lastOperation.index}`);
@@ -274,13 +282,17 @@ function App() {
                 if (!lastMessage.response?.toolOperations)
                   return updatedMessages;
 
-                // Update the last active operation of the same type with results
+                // Update the matching operation with results. Parallel tool calls can
+                // finish out of order, so match on operation_index when the backend sends it.
                 const orderedOps = lastMessage.response.toolOperations.orderedOperations;
                 if (orderedOps.length > 0) {
-                  // Find the last active operation of the same type
+                  // Find the operation with this index, or the last active operation of the same type
                   for (let i = orderedOps.length - 1; i >= 0; i--) {
                     const operation = orderedOps[i];
-                    if (operation.status === "active" && operation.type === toolType) {
+                    const matches = message.operation_index !== undefined
+                      ? operation.index === message.operation_index
+                      : operation.type === toolType;
+                    if (operation.status === "active" && matches) {
                       operation.status = "complete";
                       operation.results = toolOutput;
                       // console.log(`complete operation: ${operation.type} ${operation.index}`);
@@ -301,11 +313,14 @@ function App() {
                 const updatedMessages = [...prevMessages];
                 const lastMessage = updatedMessages[updatedMessages.length - 1];
                 if (lastMessage.response?.toolOperations) {
-                  // Find and mark the last active operation of the same type as failed
+                  // Find and mark the matching operation as failed
                   const orderedOps = lastMessage.response.toolOperations.orderedOperations;
                   for (let i = orderedOps.length - 1; i >= 0; i--) {
                     const operation = orderedOps[i];
-                    if (operation.status === "active" && operation.type === toolType) {
+                    const matches = message.operation_index !== undefined
+                      ? operation.index === message.operation_index
+                      : operation.type === toolType;
+                    if (operation.status === "active" && matches) {
                       operation.status = "complete";
                       operation.results = { error: "Failed to parse tool output" };
                       break;